@@ -1,40 +1,135 @@
 import asyncio
+import hmac
+import json
 import logging
 import os
+import shutil
+import signal
+import socket
 import sys
+import tempfile
+import time
+from contextlib import nullcontext
 from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
-from typing import Any, MutableMapping
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    ContextManager,
+    MutableMapping,
+    Optional,
+)
 
-from aiohttp import ClientSession, web
+from aiohttp import web
 from cachetools import LRUCache
-from gidgethub.sansio import Event
+from gidgethub.sansio import DOMAIN, Event
 from sentry_sdk import init as sentry_init
 from sentry_sdk.integrations.aiohttp import AioHttpIntegration
 
-from algorithms_keeper.api import GitHubAPI
+from algorithms_keeper import jsoncodec, tracing
+from algorithms_keeper.admission import DEFAULT_SHED_THRESHOLD, Admission
+from algorithms_keeper.api import (
+    TOKEN_TTL,
+    GitHubAPI,
+    create_client_session,
+    token_manager,
+)
+from algorithms_keeper.cache import MeteredCache, SQLiteCache
+from algorithms_keeper.deliveries import (
+    DEFAULT_TTL,
+    DeliveryStore,
+    MemoryDeliveryStore,
+    SQLiteDeliveryStore,
+    duplicate_deliveries_total,
+    to_delivery,
+)
 from algorithms_keeper.event import main_router
+from algorithms_keeper.jobs import (
+    PRIORITIES,
+    EventQueue,
+    KeyedExecutor,
+    parse_priorities,
+    pull_request_key,
+    run_in_order,
+)
+from algorithms_keeper.jobstore import DEAD, DEFAULT_MAX_ATTEMPTS, JobStore
+from algorithms_keeper.logs import LogSampler, parse_sample_rates, queued_handler
+from algorithms_keeper.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from algorithms_keeper.metrics import Counter, Histogram, generate_latest
+from algorithms_keeper.profiling import Profiler, parse_names
+from algorithms_keeper.ratelimit import DEFAULT_MAX_WAIT, DEFAULT_RESERVE, RateLimiter
+from algorithms_keeper.retry import DEFAULT_ATTEMPTS, DEFAULT_BUDGET, RetryPolicy
+from algorithms_keeper.tokens import Token, TokenManager
 
 # TODO(dhruvmanila): Remove this block when it's the default.
 # https://github.com/Instagram/LibCST/issues/285#issuecomment-1011427731
 if sys.version_info >= (3, 10):
     os.environ["LIBCST_PARSER_TYPE"] = "native"
 
-cache: MutableMapping[Any, Any] = LRUCache(maxsize=500)
+CACHE_SIZE = 500
+
+# Defaults for the ETag cache stored on the disk, which can hold a lot more entries
+# than the one in memory. The entries are kept for a week, after which the ETag is
+# unlikely to match anyway.
+DEFAULT_ETAG_CACHE_SIZE = 10_000
+DEFAULT_ETAG_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Number of seconds after which the deliveries turned away on overload should be
+# redelivered.
+RETRY_AFTER = 60
+
+# Default number of seconds to wait for the events in progress to finish on shutdown.
+# Heroku kills the process 30 seconds after sending the SIGTERM.
+DEFAULT_SHUTDOWN_TIMEOUT = 25
+
+cache: MutableMapping[Any, Any] = LRUCache(maxsize=CACHE_SIZE)
 
 sentry_init(
     dsn=os.environ.get("SENTRY_DSN"),
     integrations=[AioHttpIntegration(transaction_style="method_and_path_pattern")],
+    traces_sample_rate=(
+        float(os.environ["SENTRY_TRACES_SAMPLE_RATE"])
+        if os.environ.get("SENTRY_TRACES_SAMPLE_RATE")
+        else None
+    ),
 )
 
+# The records are written out by a background thread once the app starts, see
+# ``log_queue_ctx``.
+log_handler = logging.StreamHandler()
+
 logging.basicConfig(
     format="[%(levelname)s] %(message)s",
     level=os.environ.get("LOG_LEVEL", "INFO"),
-    handlers=[logging.StreamHandler()],
+    handlers=[log_handler],
 )
 
 logger = logging.getLogger(__package__)
 
+events_total = Counter(
+    "algorithms_keeper_events_total",
+    "Number of events dispatched.",
+    ("event", "action"),
+)
+event_duration_seconds = Histogram(
+    "algorithms_keeper_event_duration_seconds",
+    "Time taken to dispatch an event to all its callbacks.",
+    ("event", "action"),
+)
+callback_calls_total = Counter(
+    "algorithms_keeper_callback_calls_total",
+    "Number of router callback calls.",
+    ("callback", "status"),
+)
+callback_duration_seconds = Histogram(
+    "algorithms_keeper_callback_duration_seconds",
+    "Time taken by a router callback.",
+    ("callback",),
+)
+
 routes = web.RouteTableDef()
 
 STATIC_DIR = Path(__file__).parent / "static"
@@ -62,45 +157,549 @@ async def health(_: web.Request) -> web.Response:
     return web.Response(status=200, text="OK")
 
 
+@routes.get("/metrics")
+async def metrics(_: web.Request) -> web.Response:
+    return web.Response(
+        body=generate_latest(), headers={"Content-Type": METRICS_CONTENT_TYPE}
+    )
+
+
+def check_admin_token(request: web.Request) -> None:
+    """Raise an HTTP error unless the request carries the ``ADMIN_TOKEN``.
+
+    The admin endpoints are disabled if the ``ADMIN_TOKEN`` environment variable is
+    not set or the job store is not enabled.
+    """
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    if not admin_token or request.app.get("job_store") is None:
+        raise web.HTTPNotFound()
+    authorization = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(authorization, f"Bearer {admin_token}"):
+        raise web.HTTPUnauthorized()
+
+
+@routes.get("/admin/jobs")
+async def list_jobs(request: web.Request) -> web.Response:
+    """List the jobs in the job store in the given ``state``, which defaults to the
+    dead jobs."""
+    check_admin_token(request)
+    job_store: JobStore = request.app["job_store"]
+    jobs = job_store.jobs(request.query.get("state", DEAD))
+    return web.json_response([job.summary() for job in jobs])
+
+
+@routes.post(r"/admin/jobs/{job_id:\d+}/requeue")
+async def requeue_job(request: web.Request) -> web.Response:
+    """Put the dead job back on the queue with all its attempts available."""
+    check_admin_token(request)
+    job_store: JobStore = request.app["job_store"]
+    job = job_store.requeue(int(request.match_info["job_id"]))
+    if job is None:
+        raise web.HTTPNotFound(text="No dead job with the ID")
+    request.app["event_queue"].put(job.event, job_id=job.id)
+    logger.info("Requeued delivery_id=%s", job.event.delivery_id)
+    return web.json_response(job.summary(), status=202)
+
+
+async def dispatch_callback(
+    callback: Callable[..., Awaitable[None]], event: Event, gh: GitHubAPI
+) -> None:
+    """Call the router callback for the event and record its metrics."""
+    name = callback.__name__
+    start = time.perf_counter()
+    status = "error"
+    try:
+        with tracing.span("event.callback", callback=name):
+            await callback(event, gh)
+        status = "success"
+    finally:
+        callback_duration_seconds.observe(time.perf_counter() - start, callback=name)
+        callback_calls_total.inc(callback=name, status=status)
+
+
+def create_github_api(app: web.Application, installation_id: int) -> GitHubAPI:
+    """Create the GitHub API client for the installation using the client session
+    and the caches of the application."""
+    return GitHubAPI(
+        installation_id=installation_id,
+        session=app["client_session"],
+        requester="TheAlgorithms/algorithms-keeper",
+        cache=app["cache"],
+        token_manager=app["token_manager"],
+        rate_limiter=app["rate_limiter"],
+        retry_policy=app["retry_policy"],
+        use_graphql=app["use_graphql"],
+        log_sampler=app["log_sampler"],
+        base_url=os.environ.get("GITHUB_API_URL", DOMAIN),
+    )
+
+
+async def process_event(event: Event, app: web.Application) -> None:
+    """Dispatch the event to all the registered callbacks using the client session
+    and the caches of the application."""
+    event_info = f"{event.event}:{event.data['action']}"
+    gh = create_github_api(app, event.data["installation"]["id"])
+    labels = {"event": event.event, "action": event.data["action"]}
+    with tracing.span("event.dispatch", delivery_id=event.delivery_id, **labels):
+        # Give GitHub some time to reach internal consistency.
+        await asyncio.sleep(1)
+        events_total.inc(**labels)
+        profiler: Optional[Profiler] = app.get("profiler")
+        profile: ContextManager[None] = (
+            nullcontext() if profiler is None else profiler.profile(event)
+        )
+        with event_duration_seconds.time(**labels), profile:
+            callbacks = main_router.fetch(event)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "event=%s callbacks=%s",
+                    event_info,
+                    [func.__name__ for func in callbacks],
+                )
+            # This is the same as ``main_router.dispatch`` while measuring every
+            # callback.
+            for callback in callbacks:
+                await dispatch_callback(callback, event, gh)
+    if gh.rate_limit is not None:  # pragma: no cover
+        logger.info(
+            "ratelimit=%s, time_remaining=%s",
+            f"{gh.rate_limit.remaining}/{gh.rate_limit.limit}",
+            gh.rate_limit.reset_datetime - datetime.now(timezone.utc),
+        )
+
+
 @routes.post("/")
 async def main(request: web.Request) -> web.Response:
+    if request.app["draining"].is_set():
+        # Let GitHub know that the delivery failed, so that it can be redelivered
+        # once the new instance is up.
+        return web.Response(status=503, text="shutting down")
+    event: Optional[Event] = None
     try:
         body = await request.read()
         secret = os.environ.get("GITHUB_SECRET")
-        event = Event.from_http(request.headers, body, secret=secret)
+        event = jsoncodec.event_from_http(request.headers, body, secret=secret)
         if event.event == "ping":
             logger.debug("Received ping event")
             return web.Response(status=200, text="pong")
         event_info = f"{event.event}:{event.data['action']}"
-        logger.info("event=%s delivery_id=%s", event_info, event.delivery_id)
-        async with ClientSession() as session:
-            gh = GitHubAPI(
-                installation_id=event.data["installation"]["id"],
-                session=session,
-                requester="TheAlgorithms/algorithms-keeper",
-                cache=cache,
+        admission: Optional[Admission] = request.app.get("admission")
+        if admission is not None and not admission.admit(
+            event, pending_events(request.app)
+        ):
+            logger.warning(
+                "Overloaded, turning away event=%s delivery_id=%s",
+                event_info,
+                event.delivery_id,
             )
-            # Give GitHub some time to reach internal consistency.
-            await asyncio.sleep(1)
-            if logger.isEnabledFor(logging.DEBUG):
-                callbacks = [func.__name__ for func in main_router.fetch(event)]
-                logger.debug("event=%s callbacks=%s", event_info, callbacks)
-            await main_router.dispatch(event, gh)
-        if gh.rate_limit is not None:  # pragma: no cover
+            return web.Response(
+                status=503,
+                text="overloaded",
+                headers={"Retry-After": str(RETRY_AFTER)},
+            )
+        if not request.app["delivery_store"].add(event.delivery_id):
             logger.info(
-                "ratelimit=%s, time_remaining=%s",
-                f"{gh.rate_limit.remaining}/{gh.rate_limit.limit}",
-                gh.rate_limit.reset_datetime - datetime.now(timezone.utc),
+                "Dropping duplicate event=%s delivery_id=%s",
+                event_info,
+                event.delivery_id,
+            )
+            duplicate_deliveries_total.inc()
+            return web.Response(status=200, text="duplicate")
+        logger.info("event=%s delivery_id=%s", event_info, event.delivery_id)
+        # In the background mode, acknowledge the delivery right away and let one of
+        # the queue workers process the event.
+        event_queue: Optional[EventQueue] = request.app.get("event_queue")
+        if event_queue is not None:
+            event_queue.put(event)
+            return web.Response(status=202)
+        in_flight = request.app["in_flight"]
+        in_flight[event.delivery_id] = event, asyncio.current_task()
+        try:
+            # Events for the same pull request are processed one at a time.
+            await run_in_order(
+                request.app["keyed_executor"],
+                pull_request_key(event),
+                partial(process_event, event, request.app),
             )
+        finally:
+            del in_flight[event.delivery_id]
         return web.Response(status=200)
     except Exception as err:
         logger.exception(err)
+        if event is not None:
+            # Let GitHub, or a maintainer, redeliver the failed event.
+            request.app["delivery_store"].discard(event.delivery_id)
         return web.Response(status=500, text=str(err))
 
 
-if __name__ == "__main__":  # pragma: no cover
+def pending_events(app: web.Application) -> int:
+    """Return the number of events accepted by the process which are not processed
+    yet."""
+    pending = len(app["in_flight"])
+    event_queue: Optional[EventQueue] = app.get("event_queue")
+    if event_queue is not None:
+        pending += event_queue.pending()
+    return pending
+
+
+async def process_queued_event(app: web.Application, event: Event) -> None:
+    """Process an event taken off the event queue by one of the workers."""
+    try:
+        await process_event(event, app)
+    except Exception:
+        if app.get("job_store") is None:
+            # Without the job store, the event can only be redelivered.
+            app["delivery_store"].discard(event.delivery_id)
+        raise
+
+
+async def drain(app: web.Application) -> None:
+    """Stop accepting new deliveries and wait for the events in progress to finish.
+
+    The events which didn't finish within ``SHUTDOWN_TIMEOUT`` seconds are cancelled
+    and saved, see ``save_unfinished_events``.
+    """
+    app["draining"].set()
+    loop = asyncio.get_running_loop()
+    timeout = float(os.environ.get("SHUTDOWN_TIMEOUT", DEFAULT_SHUTDOWN_TIMEOUT))
+    deadline = loop.time() + timeout
+    unfinished: list[Event] = []
+    event_queue: Optional[EventQueue] = app.get("event_queue")
+    if event_queue is not None:
+        # There's no point in waiting for a newer event as we're shutting down.
+        event_queue.flush()
+        try:
+            await asyncio.wait_for(event_queue.join(), timeout)
+        except asyncio.TimeoutError:
+            await event_queue.stop()
+            events = event_queue.unfinished()
+            if app.get("job_store") is None:
+                unfinished.extend(events)
+            elif events:
+                logger.warning(
+                    "Left %d unfinished events in the job store", len(events)
+                )
+    in_flight = app["in_flight"]
+    if in_flight:
+        logger.info("Waiting for %d events in progress", len(in_flight))
+        tasks = [task for _, task in in_flight.values()]
+        await asyncio.wait(tasks, timeout=max(deadline - loop.time(), 0))
+        for event, task in list(in_flight.values()):
+            unfinished.append(event)
+            task.cancel()
+    if unfinished:
+        save_unfinished_events(app, unfinished)
+
+
+def save_unfinished_events(app: web.Application, events: list[Event]) -> None:
+    """Save the events which weren't processed before the shutdown so that they can
+    be replayed.
+
+    The events are appended to the file at ``UNFINISHED_EVENTS_PATH`` in the format
+    read by the ``replay`` module, or logged if it's not set. Their delivery IDs are
+    forgotten as well, so that a redelivery isn't dropped as a duplicate.
+    """
+    lines = [json.dumps(to_delivery(event)) + "\n" for event in events]
+    path = os.environ.get("UNFINISHED_EVENTS_PATH")
+    if path:
+        with open(path, "a") as file:
+            # A single write, as the other worker processes might be appending to
+            # the same file.
+            file.write("".join(lines))
+        logger.warning("Saved %d unfinished events to %s", len(events), path)
+    else:
+        for line in lines:
+            logger.warning("Unfinished delivery: %s", line.rstrip())
+    for event in events:
+        app["delivery_store"].discard(event.delivery_id)
+
+
+def warm_up_lint_engine() -> None:
+    """Import the lint engine and lint a small source with it once.
+
+    The lint engine takes most of the import time, so it's imported on the first
+    use instead of on startup, see ``check_pr_files``.
+    """
+    start = time.perf_counter()
+    try:
+        from algorithms_keeper.parser import warm_up
+
+        warm_up()
+    except Exception:
+        logger.exception("Failed to warm up the lint engine")
+    else:
+        logger.info("Warmed up the lint engine in %.3fs", time.perf_counter() - start)
+
+
+async def log_queue_ctx(_: web.Application) -> AsyncIterator[None]:
+    """Write the log records from a background thread, so that the event loop
+    doesn't block on writing them out."""
+    with queued_handler(logging.getLogger(), log_handler):
+        yield
+
+
+async def warm_up_ctx(_: web.Application) -> AsyncIterator[None]:
+    """Warm up the lint engine in a thread while the app is already serving the
+    requests, so that neither the startup nor the first pull request pays for it."""
+    loop = asyncio.get_running_loop()
+    warm_up = loop.run_in_executor(None, warm_up_lint_engine)
+    yield
+    await warm_up
+
+
+async def trace_exporter_ctx(app: web.Application) -> AsyncIterator[None]:
+    """Export the tracing spans to the JSON lines file at ``TRACE_PATH``."""
+    exporter = tracing.JSONLinesExporter(os.environ["TRACE_PATH"])
+    tracing.EXPORTERS.append(exporter)
+    yield
+    tracing.EXPORTERS.remove(exporter)
+    exporter.close()
+
+
+async def client_session_ctx(app: web.Application) -> AsyncIterator[None]:
+    """Share one client session, and thus its connection pool, between all the
+    events for the lifetime of the application."""
+    app["client_session"] = create_client_session()
+    yield
+    await app["client_session"].close()
+
+
+async def cache_ctx(app: web.Application) -> AsyncIterator[None]:
+    """Set up the ETag cache for the conditional requests and the installation
+    access token manager.
+
+    The caches are stored in a SQLite database if the ``CACHE_PATH`` environment
+    variable is set, so that they are shared by all the worker processes and survive
+    a restart, otherwise in memory. The size and the TTL of the ETag cache on the
+    disk can be set with ``ETAG_CACHE_SIZE`` and ``ETAG_CACHE_TTL``.
+    """
+    path = os.environ.get("CACHE_PATH")
+    if not path:
+        app["cache"] = MeteredCache(cache, name="etag")
+        app["token_manager"] = token_manager
+        yield
+        return
+    etag_cache = SQLiteCache(
+        path,
+        namespace="etag",
+        ttl=float(os.environ.get("ETAG_CACHE_TTL", DEFAULT_ETAG_CACHE_TTL)),
+        maxsize=int(os.environ.get("ETAG_CACHE_SIZE", DEFAULT_ETAG_CACHE_SIZE)),
+    )
+    shared_token_cache = SQLiteCache(
+        path, namespace="token", ttl=TOKEN_TTL, dumps=Token.dumps, loads=Token.loads
+    )
+    app["cache"] = MeteredCache(etag_cache, name="etag")
+    app["token_manager"] = TokenManager(shared_token_cache)
+    yield
+    etag_cache.close()
+    shared_token_cache.close()
+
+
+async def token_refresh_ctx(app: web.Application) -> AsyncIterator[None]:
+    """Refresh the installation access tokens in use before they expire, see the
+    ``tokens`` module."""
+
+    async def mint(installation_id: int) -> Token:
+        # Every refresh gets its own client with a fresh retry budget.
+        gh = create_github_api(app, installation_id)
+        return await gh.mint_token(installation_id)
+
+    manager: TokenManager = app["token_manager"]
+    task = asyncio.create_task(manager.run(mint))
+    yield
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def delivery_store_ctx(app: web.Application) -> AsyncIterator[None]:
+    """Remember the recently seen delivery IDs to drop the redelivered events.
+
+    The IDs are stored in a SQLite database if the ``DELIVERY_STORE_PATH``
+    environment variable is set, otherwise in memory.
+    """
+    ttl = float(os.environ.get("DELIVERY_TTL", DEFAULT_TTL))
+    path = os.environ.get("DELIVERY_STORE_PATH")
+    delivery_store: DeliveryStore
+    if path:
+        delivery_store = SQLiteDeliveryStore(path, ttl=ttl)
+    else:
+        delivery_store = MemoryDeliveryStore(ttl=ttl)
+    app["delivery_store"] = delivery_store
+    yield
+    delivery_store.close()
+
+
+async def job_store_ctx(app: web.Application) -> AsyncIterator[None]:
+    """Store the queued events in the SQLite database at ``JOB_STORE_PATH``."""
+    job_store = JobStore(
+        os.environ["JOB_STORE_PATH"],
+        max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+    )
+    app["job_store"] = job_store
+    yield
+    job_store.close()
+
+
+async def event_queue_ctx(app: web.Application) -> AsyncIterator[None]:
+    """Run the event queue workers for the lifetime of the application."""
+    event_queue = EventQueue(
+        partial(process_queued_event, app),
+        workers=max(int(os.environ.get("QUEUE_WORKERS", 0)), 1),
+        coalesce_window=float(os.environ.get("COALESCE_WINDOW", 0)),
+        coalesce_max_hold=(
+            float(os.environ["COALESCE_MAX_HOLD"])
+            if os.environ.get("COALESCE_MAX_HOLD")
+            else None
+        ),
+        store=app.get("job_store"),
+        priorities=app["priorities"],
+    )
+    await event_queue.start()
+    app["event_queue"] = event_queue
+    yield
+    await event_queue.stop()
+
+
+def create_app() -> web.Application:
+    """Create the web application.
+
+    Setting the ``QUEUE_WORKERS`` environment variable to a positive number enables
+    the background mode where the events are processed by that many queue workers
+    instead of inside the webhook request. Setting the ``JOB_STORE_PATH``
+    environment variable enables the background mode as well, with the queued events
+    stored on the disk.
+
+    Setting the ``MAX_PENDING_EVENTS`` environment variable to a positive number
+    caps the number of events pending in the process, see the ``admission`` module.
+
+    Setting the ``PROFILE_DIR`` environment variable profiles the dispatch of the
+    events selected by ``PROFILE_EVENTS`` and ``PROFILE_SAMPLE_RATE``, see the
+    ``profiling`` module.
+
+    Setting the ``TRACE_PATH`` environment variable exports the tracing spans of
+    every event to that file, see the ``tracing`` module.
+
+    The lint engine is warmed up in the background, so that the app is ready to
+    serve the requests right after the startup.
+
+    On shutdown, the app stops accepting new deliveries and the events in progress
+    are given ``SHUTDOWN_TIMEOUT`` seconds to finish.
+    """
     app = web.Application()
     app.add_routes(routes)
+    app["keyed_executor"] = KeyedExecutor()
+    # Set on shutdown to stop accepting new deliveries.
+    app["draining"] = asyncio.Event()
+    # Events being processed inside the webhook request along with the request task.
+    app["in_flight"] = {}
+    # aiohttp 3.8 declares the signal as ``Signal[Callable[[Application], ...]]``,
+    # which the newer aiosignal releases take as the argument types of the callbacks
+    # instead of the callback type, so the signal is typed loosely here.
+    on_shutdown: Any = app.on_shutdown
+    on_shutdown.append(drain)
+    app["rate_limiter"] = RateLimiter(
+        reserve=float(os.environ.get("RATE_LIMIT_RESERVE", DEFAULT_RESERVE)),
+        max_wait=float(os.environ.get("RATE_LIMIT_MAX_WAIT", DEFAULT_MAX_WAIT)),
+    )
+    app["use_graphql"] = bool(os.environ.get("USE_GRAPHQL"))
+    jsoncodec.use(os.environ.get("JSON_CODEC", jsoncodec.DEFAULT_CODEC))
+    app["log_sampler"] = LogSampler(
+        rate=float(os.environ.get("API_LOG_SAMPLE_RATE", 1)),
+        rates=parse_sample_rates(os.environ.get("API_LOG_SAMPLE_RATES", "")),
+    )
+    app["retry_policy"] = RetryPolicy(
+        attempts=int(os.environ.get("RETRY_ATTEMPTS", DEFAULT_ATTEMPTS)),
+        budget=int(os.environ.get("RETRY_BUDGET", DEFAULT_BUDGET)),
+    )
+    profile_dir = os.environ.get("PROFILE_DIR")
+    if profile_dir:
+        app["profiler"] = Profiler(
+            Path(profile_dir),
+            events=parse_names(os.environ.get("PROFILE_EVENTS", "")),
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+        )
+    app["priorities"] = {
+        **PRIORITIES,
+        **parse_priorities(os.environ.get("EVENT_PRIORITIES", "")),
+    }
+    capacity = int(os.environ.get("MAX_PENDING_EVENTS", 0))
+    if capacity > 0:
+        app["admission"] = Admission(
+            capacity,
+            shed_threshold=float(
+                os.environ.get("SHED_THRESHOLD", DEFAULT_SHED_THRESHOLD)
+            ),
+            priorities=app["priorities"],
+        )
+    # The cleanup contexts are exited in the reverse order, so the queue workers
+    # are stopped before the client session and the delivery store they use.
+    app.cleanup_ctx.append(log_queue_ctx)
+    app.cleanup_ctx.append(warm_up_ctx)
+    if os.environ.get("TRACE_PATH"):
+        app.cleanup_ctx.append(trace_exporter_ctx)
+    app.cleanup_ctx.append(client_session_ctx)
+    app.cleanup_ctx.append(cache_ctx)
+    app.cleanup_ctx.append(token_refresh_ctx)
+    app.cleanup_ctx.append(delivery_store_ctx)
+    job_store_path = os.environ.get("JOB_STORE_PATH")
+    if job_store_path:
+        app.cleanup_ctx.append(job_store_ctx)
+    if int(os.environ.get("QUEUE_WORKERS", 0)) > 0 or job_store_path:
+        app.cleanup_ctx.append(event_queue_ctx)
+    return app
+
+
+def run_workers(port: int, workers: int) -> None:  # pragma: no cover
+    """Serve the application from *workers* number of pre-forked processes.
+
+    The parsing of the files is CPU bound, so the webhook requests are spread over
+    multiple processes accepting the connections on the same socket. Unless set
+    otherwise, the workers share the caches and the delivery store through a SQLite
+    database in a new temporary directory which only the current user can access, as
+    the cache holds the installation access tokens. The directory is removed once
+    the workers exit.
+
+    Any worker can accept a delivery, so the events for the same pull request are
+    only processed in order and coalesced within a worker, not across them.
+    """
+    directory = tempfile.mkdtemp(prefix="algorithms-keeper-")
+    path = os.path.join(directory, "cache.sqlite3")
+    os.environ.setdefault("CACHE_PATH", path)
+    os.environ.setdefault("DELIVERY_STORE_PATH", path)
+    sock = socket.create_server(("0.0.0.0", port))
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            web.run_app(create_app(), sock=sock, print=lambda *_: None)
+            os._exit(0)
+        children.append(pid)
+    logger.info("Started %d workers on port %d: %s", workers, port, children)
+
+    def forward(signum: int, _: Any) -> None:
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for pid in children:
+        os.waitpid(pid, 0)
+    sock.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":  # pragma: no cover
     # Heroku dynamically assigns the app a port, so we can't set the port to a fixed
     # number. Heroku adds the port to the env, so we need to pull it from there.
-    web.run_app(app, port=int(os.environ.get("PORT", 5000)))
+    port = int(os.environ.get("PORT", 5000))
+    workers = int(os.environ.get("KEEPER_WORKERS", 1))
+    if workers > 1:
+        run_workers(port, workers)
+    else:
+        web.run_app(create_app(), port=port)
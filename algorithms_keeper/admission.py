@@ -0,0 +1,62 @@
+"""Admission control for the webhook deliveries
+
+A burst of events, like the ``check_run:completed`` events sent when a CI matrix
+finishes, can pile up faster than the bot can process them. Without a limit, the
+pending events use more and more memory and every event takes longer as they all
+compete for the same process.
+
+The admission control caps the number of events pending in the process. Once the
+pending events reach the shedding threshold, the low priority events, i.e., the
+ones queued after the rest as per ``jobs.PRIORITIES``, are turned away, keeping the
+room for the events which matter more. Once the capacity is reached, every event is
+turned away. The turned away deliveries are answered with a
+``503 Service Unavailable`` so that they can be redelivered later.
+"""
+from typing import Mapping
+
+from gidgethub.sansio import Event
+
+from algorithms_keeper.jobs import DEFAULT_PRIORITY, PRIORITIES, event_priority
+from algorithms_keeper.metrics import Counter
+
+# Default fraction of the capacity after which the low priority events are shed.
+DEFAULT_SHED_THRESHOLD = 0.8
+
+shed_events_total = Counter(
+    "algorithms_keeper_shed_events_total",
+    "Number of deliveries turned away as the bot was overloaded.",
+    ("event", "action"),
+)
+
+
+class Admission:
+    """Decide whether to accept an event given the number of pending events.
+
+    The events with a priority in *priorities* lower than the ``DEFAULT_PRIORITY``,
+    i.e., a higher number, are the low priority events.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        *,
+        shed_threshold: float = DEFAULT_SHED_THRESHOLD,
+        priorities: Mapping[str, int] = PRIORITIES,
+    ) -> None:
+        if capacity < 1:
+            raise ValueError(f"Expected a positive capacity, got {capacity}")
+        self.capacity = capacity
+        self._shed_at = capacity * shed_threshold
+        self._priorities = priorities
+
+    def admit(self, event: Event, pending: int) -> bool:
+        """Return ``True`` if the event should be accepted when there are *pending*
+        number of events in the process."""
+        action = event.data.get("action", "")
+        if pending < self._shed_at or (
+            pending < self.capacity
+            and event_priority(event, self._priorities) <= DEFAULT_PRIORITY
+        ):
+            return True
+        shed_events_total.inc(event=event.event, action=action)
+        return False
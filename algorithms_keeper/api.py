@@ -1,72 +1,314 @@
+import asyncio
 import logging
-import os
-from typing import Any, Mapping, MutableMapping
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Mapping, Optional
 
-from aiohttp import ClientResponse
-from cachetools import TTLCache
-from gidgethub import apps
-from gidgethub.abc import UTF_8_CHARSET
+from aiohttp import (
+    ClientConnectionError,
+    ClientResponse,
+    ClientSession,
+    TCPConnector,
+    TraceConfig,
+    TraceConnectionCreateEndParams,
+    TraceConnectionReuseconnParams,
+    TraceDnsCacheHitParams,
+    TraceDnsCacheMissParams,
+)
+from gidgethub.abc import JSON_CONTENT_TYPE, JSON_UTF_8_CHARSET, UTF_8_CHARSET
 from gidgethub.aiohttp import GitHubAPI as BaseGitHubAPI
+from gidgethub.sansio import RateLimit, create_headers, format_url
+from uritemplate.variable import VariableValueDict
+from yarl import URL
 
-# Timed token_cache for installation access token (1 minute less than an hour)
-token_cache: MutableMapping[int, str] = TTLCache(maxsize=10, ttl=1 * 59 * 60)
+from algorithms_keeper import jsoncodec, retry, tracing
+from algorithms_keeper.credentials import app_credentials
+from algorithms_keeper.logs import LogSampler
+from algorithms_keeper.metrics import Counter, Gauge, Histogram
+from algorithms_keeper.ratelimit import RateLimiter, rate_limiter, resource_for
+from algorithms_keeper.retry import RetryPolicy
+from algorithms_keeper.tokens import Token, TokenManager
+
+# Time for which the installation access token is cached (it lasts for an hour)
+TOKEN_TTL = 60 * 60
+
+# Installation access tokens for all the installations
+token_manager = TokenManager()
 
 # From `gidgethub.sansio.decipher_response()`
 # From `gidgethub.abc._request()#113`
 STATUS_OK: tuple[int, int, int, int] = (200, 201, 204, 304)
 
+# Number of bytes of the response body logged for a failed request.
+ERROR_BODY_LIMIT = 500
+
+# Connection pool settings for the process-wide client session. Almost all the
+# requests go to a single host (api.github.com), so most of the pool is available to
+# it and the idle connections are kept alive for a while between events.
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 50
+KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
+
 logger = logging.getLogger(__package__)
 
+connections_created_total = Counter(
+    "algorithms_keeper_http_connections_created_total",
+    "Number of new connections opened by the client session.",
+)
+connections_reused_total = Counter(
+    "algorithms_keeper_http_connections_reused_total",
+    "Number of requests served over a kept-alive connection.",
+)
+dns_cache_hits_total = Counter(
+    "algorithms_keeper_dns_cache_hits_total",
+    "Number of host lookups served from the connector DNS cache.",
+)
+dns_cache_misses_total = Counter(
+    "algorithms_keeper_dns_cache_misses_total",
+    "Number of host lookups which required a DNS resolution.",
+)
+github_requests_total = Counter(
+    "algorithms_keeper_github_requests_total",
+    "Number of requests made to the GitHub API.",
+    ("method", "endpoint", "status"),
+)
+github_request_duration_seconds = Histogram(
+    "algorithms_keeper_github_request_duration_seconds",
+    "Time taken by the requests made to the GitHub API.",
+    ("method", "endpoint"),
+)
+github_retries_total = Counter(
+    "algorithms_keeper_github_retries_total",
+    "Number of requests retried after a transient failure.",
+    ("method", "endpoint", "reason"),
+)
+github_rate_limit_remaining = Gauge(
+    "algorithms_keeper_github_rate_limit_remaining",
+    "Remaining number of requests in the current rate limit window.",
+    ("installation",),
+)
+github_rate_limit_limit = Gauge(
+    "algorithms_keeper_github_rate_limit_limit",
+    "Maximum number of requests in the rate limit window.",
+    ("installation",),
+)
+
+# Substitutions to reduce an API path to its endpoint template. These are applied in
+# order on the path without the query string.
+ENDPOINT_PATTERNS: tuple[tuple[re.Pattern[str], str], ...] = (
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/{owner}/{repo}"),
+    (re.compile(r"/contents/.+$"), "/contents/{path}"),
+    (re.compile(r"/labels/[^/]+$"), "/labels/{name}"),
+    (re.compile(r"/commits/[^/]+"), "/commits/{ref}"),
+    (re.compile(r"/\d+(?=/|$)"), "/{number}"),
+)
+
+
+async def _on_connection_create_end(
+    session: ClientSession, ctx: SimpleNamespace, params: TraceConnectionCreateEndParams
+) -> None:
+    connections_created_total.inc()
+
+
+async def _on_connection_reuseconn(
+    session: ClientSession, ctx: SimpleNamespace, params: TraceConnectionReuseconnParams
+) -> None:
+    connections_reused_total.inc()
+
+
+async def _on_dns_cache_hit(
+    session: ClientSession, ctx: SimpleNamespace, params: TraceDnsCacheHitParams
+) -> None:
+    dns_cache_hits_total.inc()
+
 
-def _get_private_key() -> str:
-    """Return the private key from either the environment or a file.
+async def _on_dns_cache_miss(
+    session: ClientSession, ctx: SimpleNamespace, params: TraceDnsCacheMissParams
+) -> None:
+    dns_cache_misses_total.inc()
 
-    It is recommended to use the environment variable, but in case where the
-    it cannot be used, the private key can be stored in a file. This could be
-    the case when deploying to a platform which does not support multiline
-    environment variables (e.g. Render).
+
+def endpoint_template(url: str) -> str:
+    """Return the endpoint template for the given API URL.
+
+    The repository, numbers, references and the other variable parts of the path are
+    replaced with a placeholder, so that the URL can be used as a metric label::
+
+        >>> endpoint_template("https://api.github.com/repos/a/b/pulls/1/files?page=2")
+        '/repos/{owner}/{repo}/pulls/{number}/files'
     """
-    private_key = os.getenv("GITHUB_PRIVATE_KEY")
-    if private_key is None:
-        private_key_path = os.getenv("GITHUB_PRIVATE_KEY_PATH")
-        if private_key_path is None:
-            raise RuntimeError(
-                "Provide the private key using the GITHUB_PRIVATE_KEY environment "
-                + "variable or in a file using the GITHUB_PRIVATE_KEY_PATH "
-                + "environment variable. The path should either be absolute or "
-                + "relative to the repository root."
-            )
-        with open(private_key_path, "r") as f:
-            private_key = f.read()
-    return private_key
+    path = URL(url).path
+    for pattern, replacement in ENDPOINT_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return path
+
+
+def create_client_session() -> ClientSession:
+    """Create the client session which is shared by all the ``GitHubAPI`` instances.
+
+    The session should be created once when the application starts and closed on
+    shutdown, so that the connections to GitHub are kept alive and reused across
+    events instead of paying for a new TCP and TLS handshake on every delivery.
+    """
+    trace_config = TraceConfig()
+    # aiohttp 3.8 declares the trace signals as ``Signal[_SignalCallback[...]]``,
+    # which the newer aiosignal releases take as the argument types of the callbacks
+    # instead of the callback type, so the signals are typed loosely here.
+    signals: tuple[tuple[Any, Callable[..., Awaitable[None]]], ...] = (
+        (trace_config.on_connection_create_end, _on_connection_create_end),
+        (trace_config.on_connection_reuseconn, _on_connection_reuseconn),
+        (trace_config.on_dns_cache_hit, _on_dns_cache_hit),
+        (trace_config.on_dns_cache_miss, _on_dns_cache_miss),
+    )
+    for signal, callback in signals:
+        signal.append(callback)
+    connector = TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+    )
+    return ClientSession(connector=connector, trace_configs=[trace_config])
 
 
 class GitHubAPI(BaseGitHubAPI):
-    def __init__(self, installation_id: int, *args: Any, **kwargs: Any) -> None:
+    def __init__(
+        self,
+        installation_id: int,
+        *args: Any,
+        token_manager: TokenManager = token_manager,
+        rate_limiter: RateLimiter = rate_limiter,
+        retry_policy: RetryPolicy = RetryPolicy(),
+        use_graphql: bool = False,
+        log_sampler: LogSampler = LogSampler(),
+        **kwargs: Any,
+    ) -> None:
         self._installation_id = installation_id
+        self._log_sampler = log_sampler
+        self._token_manager = token_manager
+        self._rate_limiter = rate_limiter
+        self._retry_policy = retry_policy
+        # Number of retries left for all the requests made by this instance, which
+        # is created for every event.
+        self._retry_budget = retry_policy.budget
+        # Whether to fetch the state of the pull requests with GraphQL, and the
+        # states fetched for the event by the pull request URL, see
+        # ``utils.get_pr_state``.
+        self.use_graphql = use_graphql
+        self.pr_states: dict[str, Any] = {}
         super().__init__(*args, **kwargs)
 
     @property
     async def access_token(self) -> str:
-        """Return the installation access token if it is present in the ``token_cache``
-        else create a new token and store it for later use."""
-        # Currently, the token lasts for 1 hour.
-        # https://docs.github.com/en/developers/apps/differences-between-github-apps-and-oauth-apps#token-based-identification
-        # We will store the token with key as installation ID so that the app can be
-        # installed in multiple repositories (max installation determined by the
-        # maxsize argument to the token_cache).
-        if not hasattr(self, "_private_key"):
-            self._private_key = _get_private_key()
-        installation_id = self._installation_id
-        if installation_id not in token_cache:
-            data = await apps.get_installation_access_token(
-                self,
-                installation_id=str(installation_id),
-                app_id=os.environ["GITHUB_APP_ID"],
-                private_key=self._private_key,
+        """Return the installation access token from the ``token_manager``, which
+        mints a new one if needed."""
+        return await self._token_manager.get(self._installation_id, self.mint_token)
+
+    async def mint_token(self, installation_id: int) -> Token:
+        """Mint a new access token for the installation."""
+        # https://docs.github.com/en/rest/apps/apps#create-an-installation-access-token-for-an-app
+        # This is the same as ``gidgethub.apps.get_installation_access_token`` except
+        # that the private key is parsed once and the JWT is reused.
+        # Minting a new token doesn't revoke the previous one.
+        with retry.idempotent():
+            data = await self.post(
+                f"/app/installations/{installation_id}/access_tokens",
+                data=b"",
+                jwt=app_credentials().jwt(),
+            )
+        return Token.from_response(data)
+
+    async def graphql(
+        self, query: str, *, endpoint: Optional[str] = None, **variables: Any
+    ) -> Any:
+        """Query the GraphQL API of the ``base_url`` as the installation.
+
+        The queries don't change anything, so they are retried like the other
+        idempotent requests.
+        """
+        self.oauth_token = await self.access_token
+        with retry.idempotent():
+            return await super().graphql(
+                query,
+                endpoint=endpoint or f"{self.base_url.rstrip('/')}/graphql",
+                **variables,
+            )
+
+    async def _make_request(
+        self,
+        method: str,
+        url: str,
+        url_vars: Optional[VariableValueDict],
+        data: Any,
+        accept: str,
+        jwt: Optional[str] = None,
+        oauth_token: Optional[str] = None,
+        content_type: str = JSON_CONTENT_TYPE,
+    ) -> tuple[Any, Optional[str]]:
+        """Construct and make the API request.
+
+        This is the same method as ``gidgethub.abc.GitHubAPI._make_request`` except
+        that the JSON request and response bodies are encoded and decoded with the
+        ``jsoncodec``.
+        """
+        if oauth_token is not None and jwt is not None:
+            raise ValueError("Cannot pass both oauth_token and jwt.")
+        filled_url = format_url(url, url_vars, base_url=self.base_url)
+        if jwt is not None:
+            headers = create_headers(self.requester, accept=accept, jwt=jwt)
+        else:
+            headers = create_headers(
+                self.requester,
+                accept=accept,
+                oauth_token=self.oauth_token if oauth_token is None else oauth_token,
+            )
+        cached = cacheable = False
+        # Can't use None as a "no body" sentinel as it's a legitimate JSON type.
+        if data == b"":
+            body = b""
+            headers["content-length"] = "0"
+            if method == "GET" and self._cache is not None:
+                cacheable = True
+                try:
+                    etag, last_modified, data, more = self._cache[filled_url]
+                except KeyError:
+                    pass
+                else:
+                    cached = True
+                    if etag is not None:
+                        headers["if-none-match"] = etag
+                    if last_modified is not None:
+                        headers["if-modified-since"] = last_modified
+        else:
+            if content_type == JSON_CONTENT_TYPE:
+                body = jsoncodec.dumps(data)
+                headers["content-type"] = JSON_UTF_8_CHARSET
+            else:
+                body = data
+                headers["content-type"] = content_type
+            headers["content-length"] = str(len(body))
+        if self.rate_limit is not None:
+            self.rate_limit.remaining -= 1
+        status, response_headers, response_body = await self._request(
+            method, filled_url, headers, body
+        )
+        if not (status == 304 and cached):
+            data, self.rate_limit, more = jsoncodec.decipher_response(
+                status, response_headers, response_body
+            )
+            has_cache_details = (
+                "etag" in response_headers or "last-modified" in response_headers
             )
-            token_cache[installation_id] = data["token"]
-        return token_cache[installation_id]
+            if self._cache is not None and cacheable and has_cache_details:
+                self._cache[filled_url] = (
+                    response_headers.get("etag"),
+                    response_headers.get("last-modified"),
+                    data,
+                    more,
+                )
+        return data, more
 
     async def _request(
         self, method: str, url: str, headers: Mapping[str, str], body: bytes = b""
@@ -74,40 +316,144 @@ class GitHubAPI(BaseGitHubAPI):
         """Make the API request and log the request-response cycle along with storing
         the response headers.
 
-        This is the same method as ``gidgethub.aiohttp.GitHubAPI._request``.
+        This is the same method as ``gidgethub.aiohttp.GitHubAPI._request`` except
+        that the request waits for its turn within the rate limit, see the
+        ``ratelimit`` module, and the transient failures are retried, see the
+        ``retry`` module. A ``404`` for a retried ``DELETE`` request means that an
+        earlier attempt went through, e.g., the label was removed but the response
+        was lost, so it's returned as a ``204``.
         """
-        async with self._session.request(
-            method, url, headers=headers, data=body
-        ) as response:
-            self.log(response, body)
-            return response.status, response.headers, await response.read()
-
-    @staticmethod
-    def log(response: ClientResponse, body: bytes) -> None:  # pragma: no cover
+        endpoint = endpoint_template(url)
+        policy = self._retry_policy
+        can_retry = retry.is_idempotent(method)
+        attempt = 1
+        while True:
+            try:
+                status, response_headers, data = await self._send(
+                    method, url, headers, body, endpoint=endpoint
+                )
+            except (ClientConnectionError, asyncio.TimeoutError):
+                if not can_retry or not self._can_retry(attempt):
+                    raise
+                reason = "connection"
+                delay = policy.backoff(attempt)
+            else:
+                if attempt > 1 and method == "DELETE" and status == 404:
+                    logger.info(
+                        'Treating 404 for retried "%s %s" as already deleted',
+                        method,
+                        endpoint,
+                    )
+                    return 204, response_headers, b""
+                if not can_retry or not self._can_retry(attempt):
+                    return status, response_headers, data
+                reason = str(status)
+                response_delay = policy.delay(attempt, status, response_headers)
+                if response_delay is None:
+                    return status, response_headers, data
+                delay = response_delay
+            self._retry_budget -= 1
+            github_retries_total.inc(method=method, endpoint=endpoint, reason=reason)
+            logger.warning(
+                'Retrying "%s %s" after %s in %.1fs (attempt %d/%d)',
+                method,
+                endpoint,
+                reason,
+                delay,
+                attempt,
+                policy.attempts,
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _can_retry(self, attempt: int) -> bool:
+        return attempt < self._retry_policy.attempts and self._retry_budget > 0
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Mapping[str, str],
+        body: bytes,
+        *,
+        endpoint: str,
+    ) -> tuple[int, Mapping[str, str], bytes]:
+        """Make a single attempt of the API request."""
+        resource = resource_for(url)
+        if resource is not None:
+            await self._rate_limiter.acquire(self._installation_id, resource)
+        start = time.perf_counter()
+        with tracing.span("github.request", method=method, endpoint=endpoint) as span:
+            async with self._session.request(
+                method, url, headers=headers, data=body
+            ) as response:
+                data = await response.read()
+            span.attributes["status"] = response.status
+        duration = time.perf_counter() - start
+        self.log(
+            response,
+            endpoint=endpoint,
+            duration=duration,
+            request_body=body,
+            response_body=data,
+        )
+        github_request_duration_seconds.observe(
+            duration, method=method, endpoint=endpoint
+        )
+        github_requests_total.inc(
+            method=method, endpoint=endpoint, status=str(response.status)
+        )
+        if resource is not None:
+            self._rate_limiter.update(self._installation_id, resource, response.headers)
+        rate_limit = RateLimit.from_http(response.headers)
+        if rate_limit is not None:
+            installation = str(self._installation_id)
+            github_rate_limit_remaining.set(
+                rate_limit.remaining, installation=installation
+            )
+            github_rate_limit_limit.set(rate_limit.limit, installation=installation)
+        return response.status, response.headers, data
+
+    def log(
+        self,
+        response: ClientResponse,
+        *,
+        endpoint: str,
+        duration: float,
+        request_body: bytes,
+        response_body: bytes,
+    ) -> None:
         """Log the request-response cycle for the GitHub API calls made by the bot.
 
         The logger information will be useful to know what actions the bot made.
-        INFO: All actions taken by the bot.
-        ERROR: Unknown error in the API call.
+        INFO: All actions taken by the bot, sampled with the ``log_sampler``.
+        ERROR: Unknown error in the API call, along with the start of the response.
         """
         if response.status in STATUS_OK:
-            loggerlevel = logger.info
-            # Comments and reviews are too long to be logged for INFO level
-            if response.url.name in ("comments", "reviews"):
-                data = response.url.name.upper()
-            else:
-                data = body.decode(UTF_8_CHARSET)
+            if not logger.isEnabledFor(logging.INFO):
+                return
+            if not self._log_sampler.sample(endpoint):
+                return
+            level = logging.INFO
+            error = None
         else:
-            loggerlevel = logger.error
-            data = body.decode(UTF_8_CHARSET)
-        version = response.version
-        if version is not None:
-            version = f"{version.major}.{version.minor}"
-        loggerlevel(
-            'api "%s %s %s %s" => %s',
-            response.method,
-            response.url.raw_path_qs,
-            f"{response.url.scheme.upper()}/{version}",
-            data,
-            f"{response.status}:{response.reason}",
+            level = logging.ERROR
+            error = response_body[:ERROR_BODY_LIMIT].decode(UTF_8_CHARSET, "replace")
+        fields = {
+            "method": response.method,
+            "path": response.url.raw_path_qs,
+            "endpoint": endpoint,
+            "status": response.status,
+            "duration": round(duration, 3),
+            "request_bytes": len(request_body),
+            "response_bytes": len(response_body),
+            "installation": self._installation_id,
+        }
+        if error is not None:
+            fields["error"] = error
+        logger.log(
+            level,
+            "api %s",
+            " ".join(f"{key}={value}" for key, value in fields.items()),
+            extra={"github": fields},
         )
@@ -0,0 +1,176 @@
+"""Caches shared between the worker processes
+
+In the pre-fork mode, every worker process has its own copy of the in-memory caches.
+This means every worker mints its own installation access token and a response
+cached by one worker can't be used by the others for a conditional request. The
+``SQLiteCache`` keeps the entries in a SQLite database on the local disk, which all
+the workers on the machine can use at the same time.
+
+The keys and values are stored as JSON, so the cached responses and the JSON types
+can be stored as they are, with the tuples coming back as lists, while the other
+values need a *dumps* and *loads* pair to convert them. Unlike pickle, loading an
+entry can't run any code, even if the database was tampered with. The cache is
+accessed synchronously from the event loop like the delivery store.
+
+As the database outlives the process, the responses cached for the conditional
+requests are still there after a restart or a deploy. The ``MeteredCache`` counts the
+hits and misses of a cache, which for the conditional requests tells how many
+requests could be answered with a ``304 Not Modified`` that doesn't count against
+the rate limit.
+"""
+import json
+import sqlite3
+import time
+from typing import Any, Callable, Iterator, MutableMapping, Optional
+
+from algorithms_keeper.metrics import Counter
+
+# Number of seconds to wait for another process to release the database lock.
+BUSY_TIMEOUT = 5
+
+cache_lookups_total = Counter(
+    "algorithms_keeper_cache_lookups_total",
+    "Number of lookups in the caches by the result, either hit or miss.",
+    ("cache", "result"),
+)
+
+
+class SQLiteCache(MutableMapping[Any, Any]):
+    """A mapping stored in a SQLite database at the given path.
+
+    Multiple caches can share the same database using a different *namespace*. If
+    *ttl* is given, an entry expires that many seconds after it was stored. If
+    *maxsize* is given, the least recently stored entries are evicted to keep the
+    cache within that many entries. The values are converted to and from JSON with
+    *dumps* and *loads*.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        namespace: str,
+        ttl: Optional[float] = None,
+        maxsize: Optional[int] = None,
+        dumps: Callable[[Any], str] = json.dumps,
+        loads: Callable[[str], Any] = json.loads,
+    ) -> None:
+        self._namespace = namespace
+        self._dumps = dumps
+        self._loads = loads
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        # Let the readers in the other processes go on while one is writing.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS json_cache "
+            "(namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        # For the expiry and the eviction of the oldest entries on every write.
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS json_cache_expires_at "
+            "ON json_cache (namespace, expires_at)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS json_cache_stored_at "
+            "ON json_cache (namespace, stored_at)"
+        )
+
+    def __getitem__(self, key: Any) -> Any:
+        row = self._db.execute(
+            "SELECT value FROM json_cache WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (self._namespace, json.dumps(key), time.time()),
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._loads(row[0])
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self._ttl if self._ttl is not None else None
+        self._db.execute(
+            "INSERT OR REPLACE INTO json_cache VALUES (?, ?, ?, ?, ?)",
+            (self._namespace, json.dumps(key), self._dumps(value), now, expires_at),
+        )
+        self.expire()
+        if self._maxsize is not None:
+            # Nothing is deleted unless there are more than *maxsize* entries, as the
+            # subquery is ``NULL`` otherwise.
+            self._db.execute(
+                "DELETE FROM json_cache WHERE namespace = ? AND stored_at < "
+                "(SELECT stored_at FROM json_cache WHERE namespace = ? "
+                "ORDER BY stored_at DESC LIMIT 1 OFFSET ?)",
+                (self._namespace, self._namespace, self._maxsize - 1),
+            )
+
+    def __delitem__(self, key: Any) -> None:
+        cursor = self._db.execute(
+            "DELETE FROM json_cache WHERE namespace = ? AND key = ?",
+            (self._namespace, json.dumps(key)),
+        )
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[Any]:
+        rows = self._db.execute(
+            "SELECT key FROM json_cache WHERE namespace = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (self._namespace, time.time()),
+        ).fetchall()
+        return (json.loads(key) for key, in rows)
+
+    def __len__(self) -> int:
+        (count,) = self._db.execute(
+            "SELECT COUNT(*) FROM json_cache WHERE namespace = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (self._namespace, time.time()),
+        ).fetchone()
+        return int(count)
+
+    def clear(self) -> None:
+        self._db.execute(
+            "DELETE FROM json_cache WHERE namespace = ?", (self._namespace,)
+        )
+
+    def expire(self) -> None:
+        """Remove all the expired entries."""
+        self._db.execute(
+            "DELETE FROM json_cache WHERE namespace = ? AND expires_at <= ?",
+            (self._namespace, time.time()),
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class MeteredCache(MutableMapping[Any, Any]):
+    """Count the hits and misses of the lookups in the wrapped *cache* under the
+    given *name*."""
+
+    def __init__(self, cache: MutableMapping[Any, Any], *, name: str) -> None:
+        self.cache = cache
+        self.name = name
+
+    def __getitem__(self, key: Any) -> Any:
+        try:
+            value = self.cache[key]
+        except KeyError:
+            cache_lookups_total.inc(cache=self.name, result="miss")
+            raise
+        cache_lookups_total.inc(cache=self.name, result="hit")
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self.cache[key] = value
+
+    def __delitem__(self, key: Any) -> None:
+        del self.cache[key]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.cache)
+
+    def __len__(self) -> int:
+        return len(self.cache)
@@ -0,0 +1,156 @@
+"""Cold start benchmark
+
+Starts the bot in a fresh process, like a platform scaling the app up from zero,
+and reports how long it takes until:
+
+- ``/health`` responds,
+- the webhook endpoint responds to a ``ping`` delivery,
+- the lint engine is warmed up, which is the earliest a pull request can be linted
+  without paying for the import of the lint engine.
+
+    python -m algorithms_keeper.coldstart [--repeat 5]
+
+Every run starts a new process on a free port and the medians over all the runs are
+reported as well.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from typing import Iterator, Optional, Sequence
+
+from aiohttp import ClientError, ClientSession
+
+# Log message of ``__main__.warm_up_lint_engine`` once the lint engine is ready.
+WARM_UP_MESSAGE = b"Warmed up the lint engine"
+
+# Number of seconds between the polls of the endpoints.
+POLL_INTERVAL = 0.005
+
+
+@dataclass
+class Startup:
+    """Number of seconds from starting the process to each milestone."""
+
+    first_response: float
+    first_webhook: float
+    first_lint: float
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+async def poll(session: ClientSession, method: str, url: str, **kwargs: object) -> None:
+    """Send the request until it gets a successful response."""
+    while True:
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                if response.status == 200:
+                    return None
+        except ClientError:
+            pass
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def read_log(stream: asyncio.StreamReader, warmed_up: asyncio.Event) -> None:
+    """Read the log of the process until it exits, setting *warmed_up* once the
+    lint engine is warmed up.
+
+    The whole log is read so that the process doesn't block on a full pipe.
+    """
+    while line := await stream.readline():
+        if WARM_UP_MESSAGE in line:
+            warmed_up.set()
+
+
+async def measure(timeout: float = 30) -> Startup:
+    """Start the bot in a new process and measure its startup."""
+    port = free_port()
+    env = {**os.environ, "PORT": str(port), "LOG_LEVEL": "INFO"}
+    # The ping delivery isn't signed.
+    env.pop("GITHUB_SECRET", None)
+    base_url = f"http://127.0.0.1:{port}"
+    ping = json.dumps({"zen": "Keep it logically awesome.", "hook_id": 1})
+    headers = {
+        "content-type": "application/json",
+        "x-github-event": "ping",
+        "x-github-delivery": "coldstart",
+    }
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "algorithms_keeper",
+        env=env,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    assert process.stderr is not None
+    warmed_up = asyncio.Event()
+    log_reader = asyncio.create_task(read_log(process.stderr, warmed_up))
+    try:
+        async with ClientSession() as session:
+            await asyncio.wait_for(poll(session, "GET", f"{base_url}/health"), timeout)
+            first_response = time.perf_counter() - start
+            await asyncio.wait_for(
+                poll(session, "POST", f"{base_url}/", data=ping, headers=headers),
+                timeout,
+            )
+            first_webhook = time.perf_counter() - start
+        await asyncio.wait_for(warmed_up.wait(), timeout)
+        first_lint = time.perf_counter() - start
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGTERM)
+        await process.wait()
+        await log_reader
+    return Startup(first_response, first_webhook, first_lint)
+
+
+def lines(runs: Sequence[Startup]) -> Iterator[str]:
+    yield f"{'run':<8} {'response (ms)':>14} {'webhook (ms)':>14} {'lint (ms)':>14}"
+    for n, run in enumerate(runs, start=1):
+        yield (
+            f"{n:<8} {run.first_response * 1000:>14.1f} "
+            f"{run.first_webhook * 1000:>14.1f} {run.first_lint * 1000:>14.1f}"
+        )
+    yield (
+        f"{'median':<8} "
+        f"{statistics.median(run.first_response for run in runs) * 1000:>14.1f} "
+        f"{statistics.median(run.first_webhook for run in runs) * 1000:>14.1f} "
+        f"{statistics.median(run.first_lint for run in runs) * 1000:>14.1f}"
+    )
+
+
+async def run(repeat: int, timeout: float) -> list[Startup]:
+    return [await measure(timeout) for _ in range(repeat)]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m algorithms_keeper.coldstart",
+        description="Measure the time taken by the bot to start serving.",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs")
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="seconds to wait for a milestone"
+    )
+    args = parser.parse_args(argv)
+    runs = asyncio.run(run(args.repeat, args.timeout))
+    for line in lines(runs):
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Credentials of the GitHub App
+
+The app authenticates as itself with a JWT signed by its RSA private key, which is
+needed to mint the installation access tokens. Reading the key from the environment
+or a file, parsing the PEM and signing the JWT for every token adds up to a few
+milliseconds of CPU time on the event loop each time.
+
+The ``AppCredentials`` parses the private key once, and signs a new JWT only once
+the previous one is about to expire. ``app_credentials`` returns the credentials for
+the current environment, which are loaded once per process.
+"""
+import os
+import time
+from functools import lru_cache
+from typing import Optional
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+from algorithms_keeper.metrics import Histogram
+
+# GitHub accepts a JWT which expires at most 10 minutes after it was issued. The
+# issue time is backdated by a minute to allow for the clock drift.
+JWT_LIFETIME = 9 * 60
+JWT_BACKDATE = 60
+
+# Minimum number of seconds a JWT should be valid for to be reused.
+JWT_MIN_VALIDITY = 60
+
+jwt_sign_duration_seconds = Histogram(
+    "algorithms_keeper_app_jwt_sign_duration_seconds",
+    "Time taken to sign a new app JWT.",
+)
+
+
+def _get_private_key() -> str:
+    """Return the private key from either the environment or a file.
+
+    It is recommended to use the environment variable, but in case where the
+    it cannot be used, the private key can be stored in a file. This could be
+    the case when deploying to a platform which does not support multiline
+    environment variables (e.g. Render).
+    """
+    private_key = os.getenv("GITHUB_PRIVATE_KEY")
+    if private_key is None:
+        private_key_path = os.getenv("GITHUB_PRIVATE_KEY_PATH")
+        if private_key_path is None:
+            raise RuntimeError(
+                "Provide the private key using the GITHUB_PRIVATE_KEY environment "
+                + "variable or in a file using the GITHUB_PRIVATE_KEY_PATH "
+                + "environment variable. The path should either be absolute or "
+                + "relative to the repository root."
+            )
+        with open(private_key_path, "r") as f:
+            private_key = f.read()
+    return private_key
+
+
+class AppCredentials:
+    """Sign the JWTs for the app with the given ID using its PEM encoded private
+    key."""
+
+    def __init__(self, app_id: str, private_key: str) -> None:
+        self.app_id = app_id
+        key = load_pem_private_key(private_key.encode(), password=None)
+        if not isinstance(key, RSAPrivateKey):
+            raise ValueError(f"Expected an RSA private key, got {type(key).__name__}")
+        self._private_key = key
+        self._jwt: Optional[str] = None
+        self._jwt_expires_at = 0.0
+
+    def jwt(self) -> str:
+        """Return a JWT to authenticate as the app, signing a new one if the last one
+        is about to expire."""
+        now = time.time()
+        if self._jwt is None or self._jwt_expires_at - now <= JWT_MIN_VALIDITY:
+            with jwt_sign_duration_seconds.time():
+                issued_at = int(now) - JWT_BACKDATE
+                expires_at = int(now) + JWT_LIFETIME
+                payload = {"iat": issued_at, "exp": expires_at, "iss": self.app_id}
+                self._jwt = jwt.encode(payload, self._private_key, algorithm="RS256")
+            self._jwt_expires_at = expires_at
+        return self._jwt
+
+
+def app_credentials() -> AppCredentials:
+    """Return the credentials of the app from the ``GITHUB_APP_ID`` and the private
+    key environment variables.
+
+    The private key is read and parsed once, unless the environment changes.
+    """
+    return _load_credentials(
+        os.environ["GITHUB_APP_ID"],
+        os.getenv("GITHUB_PRIVATE_KEY"),
+        os.getenv("GITHUB_PRIVATE_KEY_PATH"),
+    )
+
+
+@lru_cache(maxsize=1)
+def _load_credentials(
+    app_id: str, private_key: Optional[str], private_key_path: Optional[str]
+) -> AppCredentials:
+    # The private key variables are only used as the cache key.
+    return AppCredentials(app_id, _get_private_key())
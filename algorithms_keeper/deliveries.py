@@ -0,0 +1,111 @@
+"""Webhook delivery deduplication
+
+GitHub redelivers a webhook when our response times out and the maintainers can
+redeliver them manually as well. Processing the same delivery twice means checking
+all the pull request files again and posting a duplicate review, so the recently seen
+delivery IDs are remembered and the duplicates are dropped before the dispatch.
+
+The stores are accessed synchronously from the event loop. The operations are a
+single dictionary or an indexed SQLite lookup, which is cheap enough for the rate at
+which the deliveries arrive.
+
+The events which were not processed can be saved with ``to_delivery`` in the format
+read by the ``replay`` module.
+"""
+import sqlite3
+import time
+from typing import Any, MutableMapping
+
+from cachetools import TTLCache
+from gidgethub.sansio import Event
+
+from algorithms_keeper.metrics import Counter
+
+# Default number of seconds for which a delivery ID is remembered.
+DEFAULT_TTL = 24 * 60 * 60
+
+duplicate_deliveries_total = Counter(
+    "algorithms_keeper_duplicate_deliveries_total",
+    "Number of webhook deliveries dropped as a duplicate.",
+)
+
+
+def to_delivery(event: Event) -> dict[str, Any]:
+    """Return the delivery for the event in the format read by
+    ``replay.load_deliveries``."""
+    return {
+        "headers": {
+            "X-GitHub-Event": event.event,
+            "X-GitHub-Delivery": event.delivery_id,
+        },
+        "body": event.data,
+    }
+
+
+class DeliveryStore:
+    """A base store for the recently seen delivery IDs.
+
+    Subclasses should implement the ``add`` and ``discard`` methods.
+    """
+
+    def add(self, delivery_id: str) -> bool:
+        """Remember the delivery ID. Returns ``False`` if it was already seen."""
+        raise NotImplementedError
+
+    def discard(self, delivery_id: str) -> None:
+        """Forget the delivery ID, if present, so that it can be redelivered.
+
+        This should be used when the processing of the delivery failed.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the store."""
+
+
+class MemoryDeliveryStore(DeliveryStore):
+    """Store the delivery IDs in memory. The IDs are lost on restart."""
+
+    def __init__(self, *, ttl: float = DEFAULT_TTL, maxsize: int = 10_000) -> None:
+        self._seen: MutableMapping[str, bool] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def add(self, delivery_id: str) -> bool:
+        if delivery_id in self._seen:
+            return False
+        self._seen[delivery_id] = True
+        return True
+
+    def discard(self, delivery_id: str) -> None:
+        self._seen.pop(delivery_id, None)
+
+
+class SQLiteDeliveryStore(DeliveryStore):
+    """Store the delivery IDs in a SQLite database at the given path so that the
+    deduplication survives a restart of the bot."""
+
+    def __init__(self, path: str, *, ttl: float = DEFAULT_TTL) -> None:
+        self._ttl = ttl
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries "
+            "(delivery_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS deliveries_expires_at "
+            "ON deliveries (expires_at)"
+        )
+
+    def add(self, delivery_id: str) -> bool:
+        now = time.time()
+        self._db.execute("DELETE FROM deliveries WHERE expires_at <= ?", (now,))
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO deliveries VALUES (?, ?)",
+            (delivery_id, now + self._ttl),
+        )
+        return cursor.rowcount == 1
+
+    def discard(self, delivery_id: str) -> None:
+        self._db.execute("DELETE FROM deliveries WHERE delivery_id = ?", (delivery_id,))
+
+    def close(self) -> None:
+        self._db.close()
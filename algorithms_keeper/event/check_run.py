@@ -49,9 +49,16 @@ async def check_ci_status_and_label(
         )
         return None
 
-    check_runs = await utils.get_check_runs_for_commit(
-        gh, sha=commit_sha, repository=repository
-    )
+    state = None
+    if gh.use_graphql and "pull_request" in event.data:
+        # The check runs of the head commit are fetched along with the files.
+        state = await utils.get_pr_state(gh, pull_request=pr_for_commit)
+    if state is not None and state.head_sha == commit_sha:
+        check_runs = {"check_runs": state.check_runs}
+    else:
+        check_runs = await utils.get_check_runs_for_commit(
+            gh, sha=commit_sha, repository=repository
+        )
 
     all_check_run_status: list[str] = [
         check_run["status"] for check_run in check_runs["check_runs"]
@@ -12,7 +12,7 @@ from typing import Any, Pattern
 from gidgethub import routing
 from gidgethub.sansio import Event
 
-from algorithms_keeper import utils
+from algorithms_keeper import ratelimit, utils
 from algorithms_keeper.api import GitHubAPI
 from algorithms_keeper.event.pull_request import check_pr_files
 
@@ -31,7 +31,8 @@ async def check_comment_for_command(
     function if it matches.
 
     Only the comments made by either the member or the owner of the organization will
-    be considered.
+    be considered. A maintainer is waiting for the result of the command, so the
+    requests can use the rate limit reserved for the urgent requests.
     """
     comment = event.data["comment"]
 
@@ -41,10 +42,11 @@ async def check_comment_for_command(
     if match := COMMAND_RE.search(comment["body"]):
         command = match.group(1).lower()
         logger.info("match=%s command=%s", match.string, command)
-        if command == "review":
-            await review(event, gh, *args, **kwargs)
-        elif command == "review-all":
-            await review(event, gh, *args, ignore_modified=False, **kwargs)
+        with ratelimit.urgent():
+            if command == "review":
+                await review(event, gh, *args, **kwargs)
+            elif command == "review-all":
+                await review(event, gh, *args, ignore_modified=False, **kwargs)
 
 
 async def review(event: Event, gh: GitHubAPI, *args: Any, **kwargs: Any) -> None:
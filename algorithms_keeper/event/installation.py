@@ -4,6 +4,7 @@ from typing import Any
 from gidgethub import routing
 from gidgethub.sansio import Event
 
+from algorithms_keeper import retry
 from algorithms_keeper.api import GitHubAPI
 from algorithms_keeper.constants import GREETING_COMMENT
 
@@ -40,6 +41,7 @@ async def repo_installation_added(
             oauth_token=await gh.access_token,
         )
         issue_url = response["url"]
-        await gh.patch(
-            issue_url, data={"state": "closed"}, oauth_token=await gh.access_token
-        )
+        with retry.idempotent():
+            await gh.patch(
+                issue_url, data={"state": "closed"}, oauth_token=await gh.access_token
+            )
@@ -37,7 +37,6 @@ from algorithms_keeper.constants import (
     PR_REVIEW_COMMENT,
     Label,
 )
-from algorithms_keeper.parser import PythonParser
 
 # To disable this check, set the constant to 0.
 MAX_PR_PER_USER = 3
@@ -54,27 +53,19 @@ async def update_stage_label(
 ) -> None:
     """Update the stage label of the given pull request.
 
-    This is a two steps process with one being optional:
-
-    1. Remove any of the stage labels, if present.
-    2. Add the next stage label given in the `next_label` argument.
-
-    If `next_label` argument is not provided, then only the first step is performed.
+    Any of the stage labels, if present, are replaced with the next stage label given
+    in the `next_label` argument with a single request. If `next_label` argument is
+    not provided, then the stage labels are only removed.
     """
-    for label in pull_request["labels"]:
-        # The bot should be smart enough to figure out that if the next_label
-        # already exist, then there's no need to change the pull request stage.
-        label_name = label["name"]
-        if label_name == next_label:
-            return None
-        elif STAGE_PREFIX in label_name:
-            await utils.remove_label_from_pr_or_issue(
-                gh, label=label_name, pr_or_issue=pull_request
-            )
+    current_labels = utils.label_names(pull_request)
+    # The bot should be smart enough to figure out that if the next_label
+    # already exist, then there's no need to change the pull request stage.
+    if next_label in current_labels:
+        return None
+    labels = [label for label in current_labels if STAGE_PREFIX not in label]
     if next_label is not None:
-        await utils.add_label_to_pr_or_issue(
-            gh, label=next_label, pr_or_issue=pull_request
-        )
+        labels.append(next_label)
+    await utils.reconcile_labels(gh, labels=labels, pr_or_issue=pull_request)
 
 
 @pull_request_router.register("pull_request", action="opened")
@@ -196,8 +187,18 @@ async def check_pr_files(
         return None
 
     ignore_modified: bool = kwargs.pop("ignore_modified", True)
-    pr_files = await utils.get_pr_files(gh, pull_request=pull_request)
+    state = None
+    if gh.use_graphql:
+        state = await utils.get_pr_state(gh, pull_request=pull_request)
+        pr_files = state.files
+    else:
+        pr_files = await utils.get_pr_files(gh, pull_request=pull_request)
+    # The lint engine is slow to import, so it's imported on the first use, unless it
+    # was already warmed up, to keep the cold start fast.
+    from algorithms_keeper.parser import PythonParser
+
     parser = PythonParser(pr_files, pull_request)
+    labels = utils.label_names(pull_request)
 
     # No need to perform these checks every time a commit is pushed.
     if event.data["action"] != "synchronize":
@@ -212,29 +213,40 @@ async def check_pr_files(
             )
             return None
         if label := parser.type_label():
-            await utils.add_label_to_pr_or_issue(
-                gh, label=label, pr_or_issue=pull_request
-            )
+            labels.append(label)
 
     # Don't perform file checks if the pull request is made by a bot.
     if pull_request["user"]["type"].lower() == "bot":
+        await utils.reconcile_labels(gh, labels=labels, pr_or_issue=pull_request)
         return None
 
     # Default behavior is to ignore modified files but that can be changed.
     # This will come only from the commands module through the command:
     # ``@algorithms-keeper review-all``
-    for file in parser.files_to_check(ignore_modified):
-        code = await utils.get_file_content(gh, file=file)
-        parser.parse(file, code)
-
-    if parser.labels_to_add:
-        await utils.add_label_to_pr_or_issue(
-            gh, label=parser.labels_to_add, pr_or_issue=pull_request
-        )
-    if parser.labels_to_remove:
-        await utils.remove_label_from_pr_or_issue(
-            gh, label=parser.labels_to_remove, pr_or_issue=pull_request
+    if state is not None:
+        # The content of all the files is fetched at once.
+        file_contents = await utils.get_files_content(
+            gh,
+            pull_request=pull_request,
+            files=[
+                file for file in pr_files if parser.should_check(file, ignore_modified)
+            ],
+            ref=state.head_sha,
         )
+        for file in parser.files_to_check(ignore_modified):
+            parser.parse(file, file_contents[file.name])
+    else:
+        for file in parser.files_to_check(ignore_modified):
+            code = await utils.get_file_content(gh, file=file)
+            parser.parse(file, code)
+
+    # The type label and the labels from parsing the files are applied together.
+    labels += parser.labels_to_add
+    await utils.reconcile_labels(
+        gh,
+        labels=[label for label in labels if label not in parser.labels_to_remove],
+        pr_or_issue=pull_request,
+    )
     # We can only post the review comments on lines included in the pull request diff.
     # If the bot tries to post on lines not in the diff, GitHub will complain. So, we
     # will collect all the review content and post it as a single comment on the pull
@@ -349,7 +361,18 @@ async def check_merge_status(
             # without wasting any time and starting the background check on GitHub.
             # https://developer.github.com/v3/git/#checking-mergeability-of-pull-requests
             await asyncio.sleep(retry_interval)
-            pull_request = await utils.update_pr(gh, pull_request=pull_request)
+            if gh.use_graphql:
+                # The state fetched by another callback can be used the first time.
+                state = await utils.get_pr_state(
+                    gh, pull_request=pull_request, refresh=retry_interval > 0
+                )
+                pull_request = {
+                    **pull_request,
+                    "mergeable": state.mergeable,
+                    "labels": [{"name": label} for label in state.labels],
+                }
+            else:
+                pull_request = await utils.update_pr(gh, pull_request=pull_request)
         else:
             current_labels: list[str] = [
                 label["name"] for label in pull_request["labels"]
@@ -0,0 +1,404 @@
+"""Fake GitHub API server for end-to-end load testing
+
+Unlike the mocks used in the tests, this is an actual HTTP server, so the bot goes
+through its real HTTP path: ``GitHubAPI._request``, the conditional requests using the
+ETag cache, minting the installation access token and the pagination. It covers all
+the endpoints used in the ``utils`` module along with the ones used for the
+installation events, and the GraphQL queries in the ``graphql`` module.
+
+    python -m algorithms_keeper.fake_github --port 8081 --latency 0.05
+
+The bot is pointed to the server using the ``GITHUB_API_URL`` environment variable
+and the URLs in the webhook payloads should point to the server as well, which is
+what the load generator in ``algorithms_keeper.loadgen`` does. The bot still needs a
+valid RSA private key to sign the app JWT, but any key will do.
+
+The behavior of the server can be tuned with:
+
+- ``latency``: seconds to wait before responding, give or take ``jitter``
+- ``error_rate``: probability of responding with a ``502 Bad Gateway``
+- ``rate_limit``: number of requests allowed per access token in an hour, after
+  which the server responds with ``403 Forbidden`` until the window resets
+- ``per_page``: default page size for the paginated endpoints
+- ``files_per_pr``: number of files in every pull request
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from base64 import b64encode
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+from aiohttp import web
+
+from algorithms_keeper.api import endpoint_template
+
+# Content of every Python file in the pull requests. It misses the doctest and the
+# type hints, so the bot has something to review.
+FILE_CONTENT = b'''\
+def add(first, second):
+    """Return the sum of the two numbers."""
+    return first + second
+'''
+
+RATE_LIMIT_WINDOW = 60 * 60
+
+
+class FakeGitHub:
+    """State and configuration of the fake GitHub API server.
+
+    The ``app`` attribute is the ``aiohttp`` application to be served. The number of
+    requests served per endpoint is available in the ``requests`` attribute and at
+    the ``/_stats`` endpoint.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        rate_limit: int = 5000,
+        per_page: int = 30,
+        files_per_pr: int = 3,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.per_page = per_page
+        self.files_per_pr = files_per_pr
+        self.requests: Counter[str] = Counter()
+        # Rate limit state per access token: (remaining, reset epoch)
+        self._rate_limits: dict[str, tuple[int, int]] = {}
+        self._comment_id = 0
+        self.app = web.Application(middlewares=[self._middleware])
+        self.app.add_routes(
+            [
+                web.get("/_stats", self.stats),
+                web.get("/rate_limit", self.get_rate_limit),
+                web.post(
+                    "/app/installations/{installation_id}/access_tokens",
+                    self.create_access_token,
+                ),
+                web.get("/search/issues", self.search_issues),
+                web.get(
+                    "/repos/{owner}/{repo}/commits/{ref}/check-runs",
+                    self.get_check_runs,
+                ),
+                web.post("/repos/{owner}/{repo}/issues", self.create_issue),
+                web.patch("/repos/{owner}/{repo}/issues/{number}", self.update),
+                web.post(
+                    "/repos/{owner}/{repo}/issues/{number}/labels", self.add_labels
+                ),
+                web.put(
+                    "/repos/{owner}/{repo}/issues/{number}/labels", self.set_labels
+                ),
+                web.delete(
+                    "/repos/{owner}/{repo}/issues/{number}/labels/{name}",
+                    self.remove_label,
+                ),
+                web.post(
+                    "/repos/{owner}/{repo}/issues/{number}/comments",
+                    self.create_comment,
+                ),
+                web.post(
+                    "/repos/{owner}/{repo}/issues/comments/{id}/reactions",
+                    self.create_reaction,
+                ),
+                web.get("/repos/{owner}/{repo}/pulls/{number}", self.get_pull),
+                web.patch("/repos/{owner}/{repo}/pulls/{number}", self.update),
+                web.get("/repos/{owner}/{repo}/pulls/{number}/files", self.get_files),
+                web.post(
+                    "/repos/{owner}/{repo}/pulls/{number}/reviews", self.create_review
+                ),
+                web.delete(
+                    "/repos/{owner}/{repo}/pulls/{number}/requested_reviewers",
+                    self.remove_reviewers,
+                ),
+                web.get("/repos/{owner}/{repo}/contents/{path:.+}", self.get_content),
+                web.post("/graphql", self.graphql),
+            ]
+        )
+
+    @web.middleware
+    async def _middleware(
+        self, request: web.Request, handler: Any
+    ) -> web.StreamResponse:
+        if request.path == "/_stats":
+            response: web.StreamResponse = await handler(request)
+            return response
+        self.requests[f"{request.method} {endpoint_template(request.path)}"] += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        await asyncio.sleep(max(delay, 0))
+        if random.random() < self.error_rate:
+            return web.json_response({"message": "Server Error"}, status=502)
+        rate_limit_headers = self._consume_rate_limit(request)
+        if rate_limit_headers.get("x-ratelimit-remaining") == "-1":
+            rate_limit_headers["x-ratelimit-remaining"] = "0"
+            return web.json_response(
+                {"message": "API rate limit exceeded"},
+                status=403,
+                headers=rate_limit_headers,
+            )
+        response = await handler(request)
+        if response.status == 304 and rate_limit_headers:
+            # Conditional requests which are not modified are free.
+            rate_limit_headers = self._consume_rate_limit(request, cost=-1)
+        response.headers.update(rate_limit_headers)
+        return response
+
+    def _consume_rate_limit(
+        self, request: web.Request, *, cost: int = 1
+    ) -> dict[str, str]:
+        authorization = request.headers.get("authorization", "")
+        if not authorization.startswith("token "):
+            # The JWT authenticated requests are not rate limited.
+            return {}
+        now = int(time.time())
+        remaining, reset = self._rate_limits.get(authorization, (0, 0))
+        if reset <= now:
+            remaining, reset = self.rate_limit, now + RATE_LIMIT_WINDOW
+        remaining -= cost
+        self._rate_limits[authorization] = max(remaining, 0), reset
+        return {
+            "x-ratelimit-limit": str(self.rate_limit),
+            "x-ratelimit-remaining": str(remaining),
+            "x-ratelimit-reset": str(reset),
+            "x-ratelimit-resource": "core",
+        }
+
+    def _url(self, request: web.Request, path: str) -> str:
+        return f"{request.scheme}://{request.host}{path}"
+
+    def _json(self, request: web.Request, data: Any, status: int = 200) -> web.Response:
+        """Respond with the data along with an ETag to support the conditional
+        requests."""
+        body = json.dumps(data).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if request.method == "GET" and request.headers.get("if-none-match") == etag:
+            return web.Response(status=304, headers={"etag": etag})
+        return web.Response(
+            body=body,
+            status=status,
+            content_type="application/json",
+            headers={"etag": etag} if request.method == "GET" else None,
+        )
+
+    def _paginate(self, request: web.Request, items: list[Any]) -> web.Response:
+        per_page = int(request.query.get("per_page", self.per_page))
+        page = int(request.query.get("page", 1))
+        response = self._json(
+            request, items[(page - 1) * per_page : page * per_page]  # noqa: E203
+        )
+        if page * per_page < len(items):
+            query = urlencode({**request.query, "page": page + 1})
+            next_url = f"{self._url(request, request.path)}?{query}"
+            response.headers["link"] = f'<{next_url}>; rel="next"'
+        return response
+
+    def _pull_request(self, request: web.Request) -> dict[str, Any]:
+        owner = request.match_info["owner"]
+        repo = request.match_info["repo"]
+        number = int(request.match_info["number"])
+        return pull_request_payload(
+            self._url(request, "/"), f"{owner}/{repo}", number, mergeable=True
+        )
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.requests))
+
+    async def get_rate_limit(self, request: web.Request) -> web.Response:
+        return self._json(request, {"rate": {"limit": self.rate_limit}})
+
+    async def create_access_token(self, request: web.Request) -> web.Response:
+        installation_id = request.match_info["installation_id"]
+        expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        return self._json(
+            request,
+            {
+                "token": f"token-{installation_id}-{random.getrandbits(32)}",
+                "expires_at": expires_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            },
+            status=201,
+        )
+
+    async def search_issues(self, request: web.Request) -> web.Response:
+        # There's no pull request for the commit and the user has no other open
+        # pull requests.
+        return self._json(
+            request, {"total_count": 0, "incomplete_results": False, "items": []}
+        )
+
+    async def get_check_runs(self, request: web.Request) -> web.Response:
+        check_runs = [{"status": "completed", "conclusion": "success"}]
+        return self._json(request, {"total_count": 1, "check_runs": check_runs})
+
+    async def create_issue(self, request: web.Request) -> web.Response:
+        path = f"{request.path}/1"
+        return self._json(request, {"number": 1, "url": self._url(request, path)}, 201)
+
+    async def update(self, request: web.Request) -> web.Response:
+        return self._json(request, {"url": self._url(request, request.path)})
+
+    async def add_labels(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        return self._json(request, [{"name": name} for name in data["labels"]])
+
+    async def set_labels(self, request: web.Request) -> web.Response:
+        return await self.add_labels(request)
+
+    async def remove_label(self, request: web.Request) -> web.Response:
+        return self._json(request, [])
+
+    async def create_comment(self, request: web.Request) -> web.Response:
+        self._comment_id += 1
+        path = f"{request.path}/{self._comment_id}"
+        return self._json(request, {"url": self._url(request, path)}, 201)
+
+    async def create_reaction(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        return self._json(request, {"content": data["content"]}, 201)
+
+    async def get_pull(self, request: web.Request) -> web.Response:
+        return self._json(request, self._pull_request(request))
+
+    async def get_files(self, request: web.Request) -> web.Response:
+        owner = request.match_info["owner"]
+        repo = request.match_info["repo"]
+        files = [
+            {
+                "filename": f"algorithms/file_{n}.py",
+                "status": "added",
+                "contents_url": self._url(
+                    request, f"/repos/{owner}/{repo}/contents/algorithms/file_{n}.py"
+                ),
+            }
+            for n in range(self.files_per_pr)
+        ]
+        return self._paginate(request, files)
+
+    async def create_review(self, request: web.Request) -> web.Response:
+        return self._json(request, {"id": 1, "state": "COMMENTED"})
+
+    async def remove_reviewers(self, request: web.Request) -> web.Response:
+        return self._json(request, self._pull_request(request))
+
+    async def get_content(self, request: web.Request) -> web.Response:
+        return self._json(
+            request,
+            {
+                "path": request.match_info["path"],
+                "encoding": "base64",
+                "content": b64encode(FILE_CONTENT).decode(),
+            },
+        )
+
+    async def graphql(self, request: web.Request) -> web.Response:
+        """Answer the queries in the ``graphql`` module, told apart by their
+        variables: the pull request query has the ``number`` and the blobs query has
+        the ``e0``, ``e1``, ... expressions."""
+        variables = (await request.json()).get("variables", {})
+        if "number" in variables:
+            repository = {"pullRequest": self._graphql_pull_request(variables)}
+        else:
+            blob = {"text": FILE_CONTENT.decode(), "isTruncated": False}
+            repository = {f"f{name[1:]}": blob for name in variables if name[0] == "e"}
+        return self._json(request, {"data": {"repository": repository}})
+
+    def _graphql_pull_request(self, variables: dict[str, Any]) -> dict[str, Any]:
+        start = int(variables.get("cursor") or 0)
+        end = min(start + self.per_page, self.files_per_pr)
+        check_run = {"name": "build", "status": "COMPLETED", "conclusion": "SUCCESS"}
+        return {
+            "headRefOid": f"{variables['number']:040x}",
+            "mergeable": "MERGEABLE",
+            "labels": {"nodes": []},
+            "files": {
+                "pageInfo": {
+                    "hasNextPage": end < self.files_per_pr,
+                    "endCursor": str(end),
+                },
+                "nodes": [
+                    {"path": f"algorithms/file_{n}.py", "changeType": "ADDED"}
+                    for n in range(start, end)
+                ],
+            },
+            "commits": {
+                "nodes": [
+                    {
+                        "commit": {
+                            "checkSuites": {
+                                "nodes": [{"checkRuns": {"nodes": [check_run]}}]
+                            }
+                        }
+                    }
+                ]
+            },
+        }
+
+
+def pull_request_payload(
+    base_url: str, repository: str, number: int, *, mergeable: Optional[bool] = None
+) -> dict[str, Any]:
+    """Return a pull request object with all the URLs pointing to the *base_url*."""
+    base_url = base_url.rstrip("/")
+    url = f"{base_url}/repos/{repository}/pulls/{number}"
+    issue_url = f"{base_url}/repos/{repository}/issues/{number}"
+    return {
+        "number": number,
+        "url": url,
+        "html_url": f"https://github.com/{repository}/pull/{number}",
+        "issue_url": issue_url,
+        "comments_url": f"{issue_url}/comments",
+        "state": "open",
+        "title": "Add an algorithm",
+        "body": "* [x] Add an algorithm?",
+        "user": {"login": "contributor", "type": "User"},
+        "author_association": "CONTRIBUTOR",
+        "labels": [],
+        "draft": False,
+        "merged": False,
+        "mergeable": mergeable,
+        "requested_reviewers": [],
+        "head": {"sha": f"{number:040x}"},
+        "base": {
+            "repo": {
+                "full_name": repository,
+                "url": f"{base_url}/repos/{repository}",
+            }
+        },
+    }
+
+
+def main() -> None:  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        prog="python -m algorithms_keeper.fake_github",
+        description="Fake GitHub API server for end-to-end load testing.",
+    )
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=int, default=5000)
+    parser.add_argument("--per-page", type=int, default=30)
+    parser.add_argument("--files-per-pr", type=int, default=3)
+    args = parser.parse_args()
+    fake_github = FakeGitHub(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        per_page=args.per_page,
+        files_per_pr=args.files_per_pr,
+    )
+    web.run_app(fake_github.app, port=args.port)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,72 @@
+"""GraphQL queries for the state of a pull request
+
+Checking a pull request with the REST API takes a request for every page of its
+files, one for the content of every file, one for its mergeability and one for the
+check runs of its head commit. The same can be fetched with two GraphQL queries: the
+``PULL_REQUEST_QUERY`` for the files, labels, mergeability and check runs, and the
+query from ``blobs_query`` for the content of all the files at once.
+
+The queries are made by the functions in the ``utils`` module.
+"""
+# Maximum number of files whose content is fetched in a single query. A pull request
+# with more files takes more queries.
+BLOB_BATCH_SIZE = 50
+
+PULL_REQUEST_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      headRefOid
+      mergeable
+      labels(first: 100) {
+        nodes { name }
+      }
+      files(first: 100, after: $cursor) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path changeType }
+      }
+      commits(last: 1) {
+        nodes {
+          commit {
+            checkSuites(first: 20) {
+              nodes {
+                checkRuns(first: 50) {
+                  nodes { name status conclusion }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# The file statuses of the REST API for the change types of the GraphQL API.
+CHANGE_TYPES = {
+    "ADDED": "added",
+    "CHANGED": "changed",
+    "COPIED": "copied",
+    "DELETED": "removed",
+    "MODIFIED": "modified",
+    "RENAMED": "renamed",
+}
+
+
+def blobs_query(count: int) -> str:
+    """Return the query for the content of *count* files, given as the ``$e0``,
+    ``$e1``, ... variables in the ``<commit>:<path>`` form, and aliased as ``f0``,
+    ``f1``, ... in the response."""
+    variables = ", ".join(f"$e{n}: String!" for n in range(count))
+    objects = "\n".join(
+        f"    f{n}: object(expression: $e{n}) {{ ... on Blob {{ text isTruncated }} }}"
+        for n in range(count)
+    )
+    return (
+        f"query($owner: String!, $name: String!, {variables}) {{\n"
+        "  repository(owner: $owner, name: $name) {\n"
+        f"{objects}\n"
+        "  }\n"
+        "}\n"
+    )
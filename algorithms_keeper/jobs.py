@@ -0,0 +1,497 @@
+"""Background event queue
+
+In the background mode, the webhook endpoint only validates the delivery and puts the
+event on this queue. A pool of worker tasks takes the events off the queue and
+dispatches them, so GitHub gets its response right away instead of waiting for all
+the file checks and the API calls to finish.
+
+Contributors often push several commits to a pull request within a minute, each of
+which triggers the same checks on the pull request. Such events can be coalesced by
+holding them for a short window per pull request, and only the newest event in a
+burst is put on the queue while the superseded ones are dropped.
+
+Events for the same pull request are processed one after the other, in the order
+they were received, as the callbacks decide which labels to add or remove based on
+the labels in the payload. The events for different pull requests are still
+processed concurrently by the workers.
+
+The queued events are taken off the queue by their priority, see ``PRIORITIES``, and
+in the order they were received within the same priority. The maintainer commands
+are interactive, so they shouldn't wait behind a deep backlog of bulk events like
+the ones sent when a CI matrix finishes.
+
+With a job store, see the ``jobstore`` module, the queued events survive a crash or
+a restart and the failed events are retried with a backoff.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Generic, Hashable, Mapping, Optional, TypeVar
+
+from gidgethub.sansio import Event
+
+from algorithms_keeper.jobstore import JobStore
+from algorithms_keeper.metrics import Counter, Gauge, Histogram
+
+EventHandler = Callable[[Event], Awaitable[None]]
+
+T = TypeVar("T")
+
+# Repository full name and the pull request number.
+PullRequestKey = tuple[str, int]
+
+# Events which are superseded by a newer event of the same kind for a pull request.
+COALESCED_EVENTS: set[tuple[str, str]] = {("pull_request", "synchronize")}
+
+# Default maximum time an event is held back for coalescing as a multiple of the
+# coalescing window, so that a pull request with a steady stream of pushes is still
+# checked once in a while.
+MAX_HOLD_WINDOWS = 5
+
+# Priority of the events by their ``event:action`` or only ``event`` name, where the
+# lower number is taken off the queue first. The rest of the events have the
+# ``DEFAULT_PRIORITY``.
+PRIORITIES: dict[str, int] = {
+    # Maintainer commands, see the ``event.commands`` module.
+    "issue_comment:created": 0,
+    "pull_request:opened": 0,
+    "check_run": 2,
+}
+
+DEFAULT_PRIORITY = 1
+
+logger = logging.getLogger(__package__)
+
+queue_depth = Gauge(
+    "algorithms_keeper_queue_depth", "Number of events waiting in the event queue."
+)
+queue_wait_seconds = Histogram(
+    "algorithms_keeper_queue_wait_seconds",
+    "Time an event spent in the queue before a worker picked it up.",
+    ("event", "action"),
+)
+job_latency_seconds = Histogram(
+    "algorithms_keeper_job_latency_seconds",
+    "Time from enqueuing an event to the end of its processing.",
+    ("event", "action"),
+)
+coalesced_events_total = Counter(
+    "algorithms_keeper_coalesced_events_total",
+    "Number of events dropped as they were superseded by a newer event.",
+    ("event", "action"),
+)
+job_failures_total = Counter(
+    "algorithms_keeper_job_failures_total",
+    "Number of queued events whose processing raised an exception.",
+    ("event", "action"),
+)
+
+
+@dataclass
+class Job:
+    event: Event
+
+    # Monotonic time at which the event was put on the queue. This is used to measure
+    # the queue wait time and the total latency of the job.
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    # ID of the job in the job store, if any.
+    job_id: Optional[int] = None
+
+
+# Entries of the event queue, which are ordered by the priority and then by the
+# sequence number which keeps the events with the same priority in order.
+QueueEntry = tuple[int, int, Job]
+
+
+def parse_priorities(value: str) -> dict[str, int]:
+    """Parse the event priorities from a comma separated list of ``name=priority``
+    pairs, where the name is either ``event:action`` or only ``event``, like
+    ``issue_comment:created=0,check_run=2``.
+    """
+    priorities = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, sep, priority = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected 'name=priority', got {item.strip()!r}")
+        priorities[name.strip()] = int(priority)
+    return priorities
+
+
+def event_priority(event: Event, priorities: Mapping[str, int] = PRIORITIES) -> int:
+    """Return the priority of the event in *priorities*, looked up by the
+    ``event:action`` and then the ``event`` name."""
+    name = f"{event.event}:{event.data.get('action', '')}"
+    priority = priorities.get(name)
+    if priority is None:
+        priority = priorities.get(event.event, DEFAULT_PRIORITY)
+    return priority
+
+
+def pull_request_key(event: Event) -> Optional[PullRequestKey]:
+    """Return the repository and number of the pull request the event is about or
+    ``None`` if it's not related to a pull request."""
+    data = event.data
+    try:
+        repository = data["repository"]["full_name"]
+    except KeyError:
+        return None
+    if "pull_request" in data:
+        return repository, data["pull_request"]["number"]
+    # Comments on a pull request are delivered as an issue comment.
+    issue = data.get("issue")
+    if issue is not None and "pull_request" in issue:
+        return repository, issue["number"]
+    # The check run contains the pull requests only if the head branch is in the
+    # same repository.
+    check_run = data.get("check_run")
+    if check_run is not None and check_run.get("pull_requests"):
+        return repository, check_run["pull_requests"][0]["number"]
+    return None
+
+
+class KeyedExecutor(Generic[T]):
+    """Serialize the work sharing a key while the work for different keys runs
+    concurrently.
+
+    Every key with some work in progress owns a lane. The work for a busy key is
+    queued on its lane and is handed over, in order, to whoever finishes the current
+    work for that key. This way the caller doesn't have to wait for the other work,
+    which is what the queue workers need to keep serving the other keys.
+    """
+
+    def __init__(self) -> None:
+        self._lanes: dict[Hashable, deque[T]] = {}
+
+    def acquire(self, key: Hashable, item: T) -> bool:
+        """Try to acquire the lane for the key.
+
+        Returns ``True`` if the caller now owns the lane and should process the
+        *item*. Otherwise, the item is queued on the lane and ``False`` is returned.
+        """
+        lane = self._lanes.get(key)
+        if lane is None:
+            self._lanes[key] = deque()
+            return True
+        lane.append(item)
+        return False
+
+    def release(self, key: Hashable) -> Optional[T]:
+        """Return the next queued item for the key, which the caller should process
+        next, or release the lane and return ``None`` if there's none."""
+        lane = self._lanes[key]
+        if lane:
+            return lane.popleft()
+        del self._lanes[key]
+        return None
+
+    def drain(self) -> list[T]:
+        """Remove and return all the queued items from every lane."""
+        items = [item for lane in self._lanes.values() for item in lane]
+        self._lanes.clear()
+        return items
+
+
+async def run_in_order(
+    executor: KeyedExecutor["asyncio.Future[None]"],
+    key: Optional[Hashable],
+    work: Callable[[], Awaitable[None]],
+) -> None:
+    """Run the *work* once all the earlier work for the *key* is done.
+
+    This is for the callers which are fine with waiting for their turn. If the
+    *key* is ``None``, the work is run right away.
+    """
+    if key is None:
+        await work()
+        return None
+    turn = asyncio.get_running_loop().create_future()
+    if not executor.acquire(key, turn):
+        try:
+            await turn
+        except asyncio.CancelledError:
+            if turn.done() and not turn.cancelled():
+                # It was our turn, so pass it on to the next one in line.
+                _hand_over(executor, key)
+            raise
+    try:
+        await work()
+    finally:
+        _hand_over(executor, key)
+
+
+def _hand_over(executor: KeyedExecutor["asyncio.Future[None]"], key: Hashable) -> None:
+    while (turn := executor.release(key)) is not None:
+        # Skip the ones which were cancelled while waiting in line.
+        if not turn.cancelled():
+            turn.set_result(None)
+            break
+
+
+class EventQueue:
+    """In-process work queue served by a fixed pool of worker tasks.
+
+    The ``handler`` is called with every event put on the queue. Any exception raised
+    by the handler is logged and does not affect the other jobs or the worker.
+
+    If ``coalesce_window`` is a positive number of seconds, the events in
+    ``COALESCED_EVENTS`` are held for that long per pull request before being put on
+    the queue. An event which arrives in the meantime for the same pull request
+    restarts the window and replaces the held event, but the newest event is put on
+    the queue at the latest ``coalesce_max_hold`` seconds after the first one of
+    them arrived, which defaults to ``MAX_HOLD_WINDOWS`` windows.
+
+    The events are taken off the queue by their priority, looked up by the
+    ``event:action`` and then the ``event`` name in *priorities*, and the events
+    with the same priority in the order they were put on the queue. A higher
+    priority event can overtake a queued event for the same pull request, but not
+    the one being processed.
+
+    If a ``store`` is given, every event is stored in it before being put on the
+    queue and removed once it's processed. The events left in the store are put back
+    on the queue on ``start``. An event whose processing failed is retried after the
+    delay given by the store until it runs out of attempts.
+    """
+
+    def __init__(
+        self,
+        handler: EventHandler,
+        *,
+        workers: int,
+        coalesce_window: float = 0,
+        coalesce_max_hold: Optional[float] = None,
+        store: Optional[JobStore] = None,
+        priorities: Mapping[str, int] = PRIORITIES,
+    ) -> None:
+        if workers < 1:
+            raise ValueError(f"Expected at least one worker, got {workers}")
+        self._handler = handler
+        self._workers = workers
+        self._coalesce_window = coalesce_window
+        self._coalesce_max_hold = (
+            MAX_HOLD_WINDOWS * coalesce_window
+            if coalesce_max_hold is None
+            else coalesce_max_hold
+        )
+        self._store = store
+        self._priorities = priorities
+        self._queue: asyncio.PriorityQueue[QueueEntry] = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._tasks: list[asyncio.Task[None]] = []
+        self._executor: KeyedExecutor[Job] = KeyedExecutor()
+        # Events held back for coalescing along with the timer which releases them
+        # and the loop time at which the first of the coalesced events arrived.
+        self._held: dict[PullRequestKey, tuple[Job, asyncio.TimerHandle, float]] = {}
+        # Jobs whose processing was cancelled when the workers were stopped.
+        self._interrupted: list[Job] = []
+        # Number of events put on the queue which are not processed yet.
+        self._pending = 0
+        # Timers which put the failed jobs back on the queue, by the job ID.
+        self._retries: dict[int, asyncio.TimerHandle] = {}
+
+    def qsize(self) -> int:
+        """Return the number of events waiting to be picked up by a worker."""
+        return self._queue.qsize()
+
+    def held(self) -> int:
+        """Return the number of events held back for coalescing."""
+        return len(self._held)
+
+    def pending(self) -> int:
+        """Return the number of events which are not processed yet, including the
+        ones being processed and the ones held back for coalescing."""
+        return self._pending + len(self._held)
+
+    def priority(self, event: Event) -> int:
+        """Return the priority of the event, the lower the sooner."""
+        return event_priority(event, self._priorities)
+
+    def put(self, event: Event, *, job_id: Optional[int] = None) -> None:
+        """Put the event on the queue without waiting for it to be processed.
+
+        The *job_id* should be given if the event is already in the job store.
+        """
+        if job_id is None and self._store is not None:
+            job_id = self._store.add(event)
+        job = Job(event, job_id=job_id)
+        if (
+            self._coalesce_window > 0
+            and (event.event, event.data.get("action")) in COALESCED_EVENTS
+            and (key := pull_request_key(event)) is not None
+        ):
+            self._hold(key, job)
+        else:
+            self._put(job)
+
+    def _put(self, job: Job) -> None:
+        entry = (self.priority(job.event), next(self._sequence), job)
+        self._queue.put_nowait(entry)
+        self._pending += 1
+        queue_depth.set(self._queue.qsize())
+
+    def _task_done(self) -> None:
+        self._queue.task_done()
+        self._pending -= 1
+
+    def _hold(self, key: PullRequestKey, job: Job) -> None:
+        loop = asyncio.get_running_loop()
+        first_held_at = loop.time()
+        if key in self._held:
+            superseded, timer, first_held_at = self._held.pop(key)
+            timer.cancel()
+            if superseded.job_id is not None:
+                assert self._store is not None
+                self._store.complete(superseded.job_id)
+            event = superseded.event
+            coalesced_events_total.inc(event=event.event, action=event.data["action"])
+            logger.info(
+                "Dropping delivery_id=%s superseded by delivery_id=%s",
+                event.delivery_id,
+                job.event.delivery_id,
+            )
+        deadline = first_held_at + self._coalesce_max_hold
+        delay = max(0, min(self._coalesce_window, deadline - loop.time()))
+        timer = loop.call_later(delay, self._release, key)
+        self._held[key] = job, timer, first_held_at
+
+    def _release(self, key: PullRequestKey) -> None:
+        job, _, _ = self._held.pop(key)
+        self._put(job)
+
+    def flush(self) -> None:
+        """Put all the events held back for coalescing on the queue right away."""
+        for key in list(self._held):
+            _, timer, _ = self._held[key]
+            timer.cancel()
+            self._release(key)
+
+    def unfinished(self) -> list[Event]:
+        """Remove and return all the events which are not processed yet, including
+        the ones interrupted by ``stop``.
+
+        This should be called after the workers are stopped.
+        """
+        jobs = self._interrupted + self._executor.drain()
+        self._interrupted = []
+        while not self._queue.empty():
+            _, _, job = self._queue.get_nowait()
+            jobs.append(job)
+            self._queue.task_done()
+        self._pending = 0
+        queue_depth.set(0)
+        return [job.event for job in jobs]
+
+    def _retry(self, job_id: int, event: Event) -> None:
+        del self._retries[job_id]
+        self._put(Job(event, job_id=job_id))
+
+    async def start(self) -> None:
+        """Start the pool of worker tasks after putting the events left in the job
+        store, if any, back on the queue."""
+        if self._store is not None:
+            recovered = self._store.recover()
+            for stored in recovered:
+                self._put(Job(stored.event, job_id=stored.id))
+            if recovered:
+                logger.info("Recovered %d events from the job store", len(recovered))
+        for n in range(self._workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"worker-{n}"))
+
+    async def join(self) -> None:
+        """Wait until every event put on the queue has been processed."""
+        await self._queue.join()
+
+    async def stop(self) -> None:
+        """Cancel all the worker tasks and wait for them to exit.
+
+        The events still held back for coalescing are dropped and the pending
+        retries are cancelled. With a job store, these are put back on the queue on
+        the next ``start``.
+        """
+        for job, timer, _ in self._held.values():
+            timer.cancel()
+            logger.warning(
+                "Dropping held delivery_id=%s on stop", job.event.delivery_id
+            )
+        self._held.clear()
+        for timer in self._retries.values():
+            timer.cancel()
+        self._retries.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            queue_depth.set(self._queue.qsize())
+            key = pull_request_key(job.event)
+            if key is None:
+                await self._run(job)
+            elif self._executor.acquire(key, job):
+                next_job: Optional[Job] = job
+                while next_job is not None:
+                    await self._run(next_job)
+                    next_job = self._executor.release(key)
+            # Otherwise, another worker is processing an event for the same pull
+            # request and it will process this one as well once it's done.
+
+    async def _run(self, job: Job) -> None:
+        event = job.event
+        store, job_id = self._store, job.job_id
+        if store is not None and job_id is not None and not store.claim(job_id):
+            # Another worker process got to it first.
+            self._task_done()
+            return None
+        labels = {"event": event.event, "action": event.data.get("action", "")}
+        wait = time.monotonic() - job.enqueued_at
+        queue_wait_seconds.observe(wait, **labels)
+        try:
+            await self._handler(event)
+        except asyncio.CancelledError:
+            if store is not None and job_id is not None:
+                store.release(job_id)
+            self._interrupted.append(job)
+            raise
+        except Exception as err:
+            job_failures_total.inc(**labels)
+            logger.exception(
+                "Failed to process event=%s:%s delivery_id=%s",
+                labels["event"],
+                labels["action"],
+                event.delivery_id,
+            )
+            if store is not None and job_id is not None:
+                self._fail(store, job_id, event, err)
+        else:
+            if store is not None and job_id is not None:
+                store.complete(job_id)
+        finally:
+            latency = time.monotonic() - job.enqueued_at
+            job_latency_seconds.observe(latency, **labels)
+            logger.info(
+                "delivery_id=%s queue_wait=%.3fs latency=%.3fs queue_depth=%d",
+                event.delivery_id,
+                wait,
+                latency,
+                self._queue.qsize(),
+            )
+            self._task_done()
+
+    def _fail(self, store: JobStore, job_id: int, event: Event, err: Exception) -> None:
+        delay = store.fail(job_id, repr(err))
+        if delay is None:
+            logger.error(
+                "Giving up on delivery_id=%s, requeue it from the admin endpoint",
+                event.delivery_id,
+            )
+            return None
+        logger.info("Retrying delivery_id=%s in %ss", event.delivery_id, delay)
+        loop = asyncio.get_running_loop()
+        self._retries[job_id] = loop.call_later(delay, self._retry, job_id, event)
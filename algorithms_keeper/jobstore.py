@@ -0,0 +1,237 @@
+"""Durable job store for the event queue
+
+The in-process event queue loses the events it holds when the process dies, and an
+event whose processing failed, say due to GitHub having a bad day, is only logged.
+With the job store, every event put on the queue is first written to a SQLite
+database along with its state and the number of attempts:
+
+- ``pending``: waiting to be claimed by a worker, which includes the events waiting
+  for a retry
+- ``running``: claimed by a worker in the process with the recorded ``owner`` PID
+- ``dead``: failed ``max_attempts`` times, kept for inspection and a manual requeue
+
+The job is removed once it's processed successfully. On startup, the pending jobs
+and the running jobs of the processes which are no longer alive are put back on the
+queue. A running job recorded with the PID of the starting process itself is put
+back as well, as the PID was reused after a restart, e.g., PID 1 in a container.
+Claiming a job is atomic, so the worker processes sharing the database never process
+the same job twice.
+"""
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from gidgethub.sansio import Event
+
+from algorithms_keeper.metrics import Counter
+
+# Default number of times a job is attempted before it's dead-lettered.
+DEFAULT_MAX_ATTEMPTS = 5
+
+# The delay before the n-th retry is ``RETRY_DELAY * 2 ** (n - 1)`` seconds, capped
+# at ``MAX_RETRY_DELAY`` seconds.
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 60 * 60
+
+PENDING = "pending"
+RUNNING = "running"
+DEAD = "dead"
+
+job_retries_total = Counter(
+    "algorithms_keeper_job_retries_total",
+    "Number of failed jobs scheduled for a retry.",
+)
+dead_jobs_total = Counter(
+    "algorithms_keeper_dead_jobs_total",
+    "Number of jobs which failed all their attempts.",
+)
+
+
+@dataclass
+class StoredJob:
+    id: int
+    event: Event
+    state: str
+    attempts: int
+    last_error: Optional[str]
+    updated_at: float
+
+    def summary(self) -> dict[str, Any]:
+        """Return the job details to show in the admin endpoint."""
+        return {
+            "id": self.id,
+            "delivery_id": self.event.delivery_id,
+            "event": self.event.event,
+            "action": self.event.data.get("action"),
+            "state": self.state,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "updated_at": self.updated_at,
+        }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover
+        return True
+    return True
+
+
+class JobStore:
+    """Store the queued jobs in a SQLite database at the given path."""
+
+    def __init__(self, path: str, *, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> None:
+        self.max_attempts = max_attempts
+        self._pid = os.getpid()
+        self._db = sqlite3.connect(path, timeout=5, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "delivery_id TEXT NOT NULL, "
+            "event TEXT NOT NULL, "
+            "data TEXT NOT NULL, "
+            "state TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "owner INTEGER, "
+            "last_error TEXT, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+
+    def add(self, event: Event) -> int:
+        """Store the event as a pending job and return the job ID."""
+        cursor = self._db.execute(
+            "INSERT INTO jobs (delivery_id, event, data, state, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                event.delivery_id,
+                event.event,
+                json.dumps(event.data),
+                PENDING,
+                time.time(),
+            ),
+        )
+        assert cursor.lastrowid is not None
+        return cursor.lastrowid
+
+    def claim(self, job_id: int) -> bool:
+        """Mark the pending job as running in this process and count the attempt.
+
+        Returns ``False`` if the job is not pending anymore, e.g., it was claimed by
+        another process, in which case the job should be skipped.
+        """
+        cursor = self._db.execute(
+            "UPDATE jobs SET state = ?, owner = ?, attempts = attempts + 1, "
+            "updated_at = ? WHERE id = ? AND state = ?",
+            (RUNNING, self._pid, time.time(), job_id, PENDING),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int) -> None:
+        """Remove the job as it's done or not needed anymore."""
+        self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def fail(self, job_id: int, error: str) -> Optional[float]:
+        """Record the failed attempt of the running job.
+
+        Returns the number of seconds after which the job should be retried or
+        ``None`` if it has run out of attempts and is now dead.
+        """
+        row = self._db.execute(
+            "SELECT attempts FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        (attempts,) = row
+        if attempts >= self.max_attempts:
+            state, delay = DEAD, None
+            dead_jobs_total.inc()
+        else:
+            state = PENDING
+            delay = min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+            job_retries_total.inc()
+        self._db.execute(
+            "UPDATE jobs SET state = ?, owner = NULL, last_error = ?, updated_at = ? "
+            "WHERE id = ?",
+            (state, error, time.time(), job_id),
+        )
+        return delay
+
+    def release(self, job_id: int) -> None:
+        """Put the running job back to pending without counting the attempt, e.g.,
+        when it was interrupted by a shutdown."""
+        self._db.execute(
+            "UPDATE jobs SET state = ?, owner = NULL, attempts = attempts - 1, "
+            "updated_at = ? WHERE id = ? AND state = ?",
+            (PENDING, time.time(), job_id, RUNNING),
+        )
+
+    def recover(self) -> list[StoredJob]:
+        """Return the jobs which should be put back on the queue on startup.
+
+        The running jobs of the processes which are no longer alive are moved back
+        to pending, as they were interrupted by a crash. This is called before this
+        process claims any job, so the jobs recorded with its own PID belong to an
+        earlier process which had the same PID.
+        """
+        for job_id, owner in self._db.execute(
+            "SELECT id, owner FROM jobs WHERE state = ?", (RUNNING,)
+        ).fetchall():
+            if owner is None or owner == self._pid or not _pid_alive(owner):
+                self._db.execute(
+                    "UPDATE jobs SET state = ?, owner = NULL "
+                    "WHERE id = ? AND state = ?",
+                    (PENDING, job_id, RUNNING),
+                )
+        return self.jobs(PENDING)
+
+    def jobs(self, state: str) -> list[StoredJob]:
+        """Return all the jobs in the given state, oldest first."""
+        return self._select("state = ? ORDER BY id", (state,))
+
+    def get(self, job_id: int) -> Optional[StoredJob]:
+        """Return the job with the ID or ``None`` if there's none."""
+        jobs = self._select("id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def _select(self, where: str, params: tuple[Any, ...]) -> list[StoredJob]:
+        rows = self._db.execute(
+            "SELECT id, delivery_id, event, data, state, attempts, last_error, "
+            f"updated_at FROM jobs WHERE {where}",
+            params,
+        ).fetchall()
+        return [
+            StoredJob(
+                id=row[0],
+                event=Event(json.loads(row[3]), event=row[2], delivery_id=row[1]),
+                state=row[4],
+                attempts=row[5],
+                last_error=row[6],
+                updated_at=row[7],
+            )
+            for row in rows
+        ]
+
+    def requeue(self, job_id: int) -> Optional[StoredJob]:
+        """Move the dead job back to pending with all its attempts available.
+
+        Returns the job or ``None`` if there's no dead job with the ID.
+        """
+        cursor = self._db.execute(
+            "UPDATE jobs SET state = ?, attempts = 0, updated_at = ? "
+            "WHERE id = ? AND state = ?",
+            (PENDING, time.time(), job_id, DEAD),
+        )
+        if cursor.rowcount == 0:
+            return None
+        return self.get(job_id)
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,88 @@
+"""JSON decode benchmark
+
+Measures the time taken to decode a webhook payload per event type with each of the
+JSON codecs available in the ``jsoncodec`` module.
+
+    python -m algorithms_keeper.jsonbench [--deliveries path/to/deliveries]
+
+By default, the payloads are the synthetic events of the load generator. Recorded
+deliveries, in the format read by the ``replay`` module, can be used instead with
+``--deliveries``, in which case the largest payload of every event type is used.
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+
+from algorithms_keeper import jsoncodec
+from algorithms_keeper.loadgen import EVENT_WEIGHTS, make_delivery
+from algorithms_keeper.replay import load_deliveries
+
+# Base URL used in the synthetic payloads.
+GITHUB_URL = "https://api.github.com"
+
+
+def synthetic_payloads() -> dict[str, bytes]:
+    """Return the encoded payload of every synthetic event by ``event:action``."""
+    payloads = {}
+    for event, action in EVENT_WEIGHTS:
+        _, data = make_delivery(event, action, github_url=GITHUB_URL, pr_number=1)
+        payloads[f"{event}:{action}"] = jsoncodec.CODECS["json"].dumps(data)
+    return payloads
+
+
+def recorded_payloads(directory: Path) -> dict[str, bytes]:
+    """Return the largest encoded payload of every event type in the recorded
+    deliveries by ``event:action``."""
+    payloads: dict[str, bytes] = {}
+    for event in load_deliveries(directory):
+        name = f"{event.event}:{event.data.get('action')}"
+        body = jsoncodec.CODECS["json"].dumps(event.data)
+        if len(body) > len(payloads.get(name, b"")):
+            payloads[name] = body
+    return payloads
+
+
+def measure(payload: bytes, codec: jsoncodec.Codec, number: int) -> float:
+    """Return the best time in seconds to decode the payload with the codec."""
+    timer = timeit.Timer(lambda: codec.loads(payload))
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+
+def lines(payloads: dict[str, bytes], number: int) -> Iterator[str]:
+    codecs = sorted(jsoncodec.CODECS.values(), key=lambda codec: codec.name)
+    yield f"{'event':<32} {'size (KB)':>10}" + "".join(
+        f" {codec.name + ' (us)':>12}" for codec in codecs
+    )
+    for name, payload in sorted(payloads.items()):
+        yield f"{name:<32} {len(payload) / 1024:>10.1f}" + "".join(
+            f" {measure(payload, codec, number) * 1e6:>12.1f}" for codec in codecs
+        )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m algorithms_keeper.jsonbench",
+        description="Measure the time taken to decode a payload per event type.",
+    )
+    parser.add_argument(
+        "--deliveries",
+        type=Path,
+        help="directory with the recorded deliveries, defaults to synthetic events",
+    )
+    parser.add_argument(
+        "--number", type=int, default=1000, help="number of decodes per measurement"
+    )
+    args = parser.parse_args(argv)
+    if args.deliveries is None:
+        payloads = synthetic_payloads()
+    else:
+        payloads = recorded_payloads(args.deliveries)
+    for line in lines(payloads, args.number):
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
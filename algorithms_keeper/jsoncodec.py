@@ -0,0 +1,165 @@
+"""JSON codec
+
+Every webhook payload and every GitHub API request and response body is JSON, and a
+``pull_request`` payload alone is a few tens of kilobytes. ``gidgethub`` decodes all
+of them with the standard library ``json`` module, first decoding the bytes to a
+string.
+
+The functions in this module use the `orjson <https://github.com/ijl/orjson>`_ codec
+when it's installed, which decodes the bytes directly and is several times faster,
+and the standard library otherwise. The codec can be picked with ``use``, which is
+done from the ``JSON_CODEC`` environment variable when the app starts.
+
+``event_from_http`` and ``decipher_response`` are the same as their ``gidgethub``
+counterparts except for the codec, the latter is used by ``api.GitHubAPI`` for the
+REST API responses. The decode cost per event type can be measured with the
+``jsonbench`` module.
+"""
+import http
+import json
+import urllib.parse
+from dataclasses import dataclass
+from email.message import Message
+from typing import Any, Callable, Mapping, Optional, Union
+
+from gidgethub import BadRequest, ValidationFailure
+from gidgethub.sansio import Event, RateLimit
+from gidgethub.sansio import decipher_response as _decipher_response
+from gidgethub.sansio import validate_event
+
+JSON_CONTENT_TYPE = "application/json"
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+# Both codecs decode the bytes in UTF-8 without decoding them to a string first.
+UTF_8_ENCODINGS = ("utf-8", "utf8")
+
+
+@dataclass(frozen=True)
+class Codec:
+    name: str
+    loads: Callable[[Union[bytes, str]], Any]
+    dumps: Callable[[Any], bytes]
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode()
+
+
+# Available codecs by their name.
+CODECS: dict[str, Codec] = {"json": Codec("json", json.loads, _json_dumps)}
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    pass
+else:
+    CODECS["orjson"] = Codec("orjson", orjson.loads, orjson.dumps)
+
+# Name of the codec used when none is picked, the fastest one installed.
+DEFAULT_CODEC = "orjson" if "orjson" in CODECS else "json"
+
+_codec = CODECS[DEFAULT_CODEC]
+
+
+def use(name: str) -> Codec:
+    """Use the codec with the given name for all the functions in this module."""
+    global _codec
+    try:
+        _codec = CODECS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown or unavailable JSON codec {name!r}, "
+            f"expected one of: {', '.join(sorted(CODECS))}"
+        ) from None
+    return _codec
+
+
+def current() -> Codec:
+    """Return the codec in use."""
+    return _codec
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode the JSON document in *data*."""
+    return _codec.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode *obj* as a UTF-8 JSON document."""
+    return _codec.dumps(obj)
+
+
+def _parse_content_type(content_type: Optional[str]) -> tuple[Optional[str], str]:
+    """Return the media type and the charset, which defaults to UTF-8, of the
+    content type header."""
+    if not content_type:
+        return None, "utf-8"
+    message = Message()
+    message["content-type"] = content_type
+    return message.get_content_type(), str(message.get_param("charset") or "utf-8")
+
+
+def _decode_body(content_type: str, body: bytes) -> Any:
+    if not body or not content_type:
+        return None
+    type_, encoding = _parse_content_type(content_type)
+    if type_ == FORM_CONTENT_TYPE:
+        decoded = urllib.parse.parse_qs(body.decode(encoding))
+        return loads(decoded["payload"][0])
+    if type_ != JSON_CONTENT_TYPE:
+        raise ValueError(f"unrecognized content type: {type_!r}")
+    if encoding.lower() in UTF_8_ENCODINGS:
+        return loads(body)
+    return loads(body.decode(encoding))
+
+
+def event_from_http(
+    headers: Mapping[str, str], body: bytes, *, secret: Optional[str] = None
+) -> Event:
+    """Construct an event from the headers and the body of a webhook delivery.
+
+    This is the same as ``gidgethub.sansio.Event.from_http`` except that the payload
+    is decoded with the codec in use.
+    """
+    signature = headers.get("x-hub-signature-256", headers.get("x-hub-signature"))
+    if signature is not None:
+        if secret is None:
+            raise ValidationFailure("secret not provided")
+        validate_event(body, signature=signature, secret=secret)
+    elif secret is not None:
+        raise ValidationFailure("signature is missing")
+    try:
+        data = _decode_body(headers["content-type"], body)
+    except (KeyError, ValueError) as exc:
+        raise BadRequest(
+            http.HTTPStatus(415),
+            "expected a content-type of "
+            f"'{JSON_CONTENT_TYPE}' or '{FORM_CONTENT_TYPE}'",
+        ) from exc
+    return Event(
+        data,
+        event=headers["x-github-event"],
+        delivery_id=headers["x-github-delivery"],
+    )
+
+
+def decipher_response(
+    status_code: int, headers: Mapping[str, str], body: bytes
+) -> tuple[Any, Optional[RateLimit], Optional[str]]:
+    """Decipher the response for a GitHub API request.
+
+    This is the same as ``gidgethub.sansio.decipher_response`` except that the body
+    of a successful JSON response is decoded with the codec in use, while the rate
+    limit and the next page are still read by ``gidgethub``. The failed responses
+    are left to ``gidgethub``, which raises the appropriate exception.
+    """
+    type_, encoding = _parse_content_type(headers.get("content-type"))
+    if (
+        status_code in {200, 201, 202, 204}
+        and body
+        and type_ == JSON_CONTENT_TYPE
+        and encoding.lower() in UTF_8_ENCODINGS
+    ):
+        _, rate_limit, more = _decipher_response(status_code, headers, b"")
+        return loads(body), rate_limit, more
+    return _decipher_response(status_code, headers, body)
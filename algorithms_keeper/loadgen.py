@@ -0,0 +1,197 @@
+"""Load generator for the webhook endpoint
+
+Sends signed synthetic webhook deliveries to a running bot at a fixed rate and
+reports the throughput, the status codes and the latency percentiles of the webhook
+responses. All the URLs in the payloads point to the fake GitHub API server from
+``algorithms_keeper.fake_github``, which the bot should be configured to use with the
+``GITHUB_API_URL`` environment variable.
+
+    python -m algorithms_keeper.loadgen --target http://localhost:5000/ \\
+        --github http://localhost:8081 --rate 20 --duration 30
+
+The deliveries are a mix of pull request, check run and comment events spread over
+``--pull-requests`` number of pull requests. The number of requests served by the
+fake GitHub server during the run are reported as well.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional, Sequence
+
+from aiohttp import ClientSession
+
+from algorithms_keeper.fake_github import pull_request_payload
+from algorithms_keeper.replay import percentile
+
+REPOSITORY = "TheAlgorithms/Python"
+INSTALLATION_ID = 1
+
+# Relative weight of the synthetic events in the generated traffic.
+EVENT_WEIGHTS: dict[tuple[str, str], int] = {
+    ("pull_request", "opened"): 2,
+    ("pull_request", "synchronize"): 5,
+    ("check_run", "completed"): 10,
+    ("issue_comment", "created"): 1,
+}
+
+
+def make_delivery(
+    event: str, action: str, *, github_url: str, pr_number: int
+) -> tuple[str, dict[str, Any]]:
+    """Return the delivery ID and the payload for a synthetic event."""
+    pull_request = pull_request_payload(github_url, REPOSITORY, pr_number)
+    data: dict[str, Any] = {
+        "action": action,
+        "installation": {"id": INSTALLATION_ID},
+        "repository": {"full_name": REPOSITORY},
+        "sender": {"login": "contributor", "type": "User"},
+    }
+    if event == "pull_request":
+        data["pull_request"] = pull_request
+    elif event == "check_run":
+        data["check_run"] = {
+            "head_sha": pull_request["head"]["sha"],
+            "pull_requests": [{"number": pr_number}],
+        }
+    elif event == "issue_comment":
+        data["issue"] = {
+            "number": pr_number,
+            "pull_request": {"url": pull_request["url"]},
+        }
+        data["comment"] = {
+            "url": (
+                f"{github_url.rstrip('/')}/repos/{REPOSITORY}/issues/comments/"
+                f"{random.getrandbits(32)}"
+            ),
+            "body": "@algorithms-keeper review",
+            "author_association": "MEMBER",
+        }
+    return str(uuid.uuid4()), data
+
+
+def sign(body: bytes, secret: str) -> str:
+    """Return the ``X-Hub-Signature-256`` header value for the body."""
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+@dataclass
+class LoadReport:
+    elapsed: float = 0
+    latencies: list[float] = field(default_factory=list)
+    statuses: Counter[str] = field(default_factory=Counter)
+    github_requests: dict[str, int] = field(default_factory=dict)
+
+    def lines(self) -> Iterator[str]:
+        total = sum(self.statuses.values())
+        yield f"deliveries={total} elapsed={self.elapsed:.3f}s"
+        yield f"throughput={total / self.elapsed:.1f} deliveries/s"
+        for p in (50, 90, 99):
+            yield f"p{p}={percentile(self.latencies, p) * 1000:.1f}ms"
+        yield f"statuses={dict(sorted(self.statuses.items()))}"
+        github_total = sum(self.github_requests.values())
+        yield f"github_requests={github_total}"
+        for endpoint, count in sorted(self.github_requests.items()):
+            yield f"  {endpoint}: {count}"
+
+
+async def run(
+    *,
+    target: str,
+    github_url: str,
+    rate: float,
+    duration: float,
+    pull_requests: int = 10,
+    secret: Optional[str] = None,
+) -> LoadReport:
+    """Send the deliveries to the *target* at *rate* per second for *duration*
+    seconds. The deliveries are sent in an open loop, i.e., without waiting for the
+    earlier ones to complete."""
+    report = LoadReport()
+    events = list(EVENT_WEIGHTS)
+    weights = list(EVENT_WEIGHTS.values())
+
+    async def send(session: ClientSession, event: str, action: str) -> None:
+        delivery_id, data = make_delivery(
+            event,
+            action,
+            github_url=github_url,
+            pr_number=random.randint(1, pull_requests),
+        )
+        body = json.dumps(data).encode()
+        headers = {
+            "content-type": "application/json",
+            "x-github-event": event,
+            "x-github-delivery": delivery_id,
+        }
+        if secret is not None:
+            headers["x-hub-signature-256"] = sign(body, secret)
+        start = time.perf_counter()
+        try:
+            async with session.post(target, data=body, headers=headers) as response:
+                await response.read()
+                status = str(response.status)
+        except Exception as err:
+            status = type(err).__name__
+        report.latencies.append(time.perf_counter() - start)
+        report.statuses[status] += 1
+
+    async with ClientSession() as session:
+        async with session.get(f"{github_url.rstrip('/')}/_stats") as response:
+            github_before = await response.json()
+        tasks = []
+        start = time.perf_counter()
+        for n in range(int(rate * duration)):
+            # Sleep until the scheduled time of the delivery.
+            await asyncio.sleep(max(start + n / rate - time.perf_counter(), 0))
+            event, action = random.choices(events, weights)[0]
+            tasks.append(asyncio.create_task(send(session, event, action)))
+        await asyncio.gather(*tasks)
+        report.elapsed = time.perf_counter() - start
+        async with session.get(f"{github_url.rstrip('/')}/_stats") as response:
+            github_after = await response.json()
+    report.github_requests = {
+        endpoint: count - github_before.get(endpoint, 0)
+        for endpoint, count in github_after.items()
+        if count > github_before.get(endpoint, 0)
+    }
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m algorithms_keeper.loadgen",
+        description="Send synthetic webhook deliveries to the bot.",
+    )
+    parser.add_argument("--target", default="http://localhost:5000/")
+    parser.add_argument("--github", default="http://localhost:8081")
+    parser.add_argument("--rate", type=float, default=10, help="deliveries/s")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--pull-requests", type=int, default=10)
+    parser.add_argument("--secret", help="webhook secret to sign the deliveries")
+    args = parser.parse_args(argv)
+    report = asyncio.run(
+        run(
+            target=args.target,
+            github_url=args.github,
+            rate=args.rate,
+            duration=args.duration,
+            pull_requests=args.pull_requests,
+            secret=args.secret,
+        )
+    )
+    for line in report.lines():
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Logging off the event loop
+
+Every GitHub API request is logged at INFO level. Writing a log line to the stream
+is a blocking call on the event loop, which waits on a slow pipe or disk, so the
+``queued_handler`` hands the records over to a background thread which writes them
+out instead.
+
+The API requests are logged as ``key=value`` fields, which are also attached to the
+record as the ``github`` attribute for a structured formatter. The requests to busy
+endpoints can be sampled with a ``LogSampler``, so that INFO logging stays on without
+flooding the logs. The failed requests are always logged.
+"""
+import logging
+import queue
+import random
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator, Mapping
+
+
+@contextmanager
+def queued_handler(logger: logging.Logger, handler: logging.Handler) -> Iterator[None]:
+    """Replace the *handler* of the *logger* with one which puts the records on a
+    queue, from which a background thread passes them on to the *handler*.
+
+    The records still in the queue are written out on exit, and the *handler* is put
+    back on the logger. Nothing is done if the handler isn't attached to the logger.
+    """
+    if handler not in logger.handlers:
+        yield
+        return
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    logger.addHandler(queue_handler)
+    logger.removeHandler(handler)
+    listener.start()
+    try:
+        yield
+    finally:
+        listener.stop()
+        logger.addHandler(handler)
+        logger.removeHandler(queue_handler)
+
+
+def parse_sample_rates(value: str) -> dict[str, float]:
+    """Parse the log sample rates from a comma separated list of ``endpoint=rate``
+    pairs, where the endpoint is the template used in the metrics, like
+    ``/repos/{owner}/{repo}/contents/{path}=0.1``.
+    """
+    rates = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        endpoint, sep, rate = item.rpartition("=")
+        if not sep:
+            raise ValueError(f"Expected 'endpoint=rate', got {item.strip()!r}")
+        rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+@dataclass(frozen=True)
+class LogSampler:
+    """Pick the successful API requests to log with the probability of the *rate*,
+    or of the rate for their endpoint in *rates*."""
+
+    rate: float = 1.0
+    rates: Mapping[str, float] = field(default_factory=dict)
+
+    def sample(self, endpoint: str) -> bool:
+        rate = self.rates.get(endpoint, self.rate)
+        return rate >= 1 or random.random() < rate
@@ -0,0 +1,226 @@
+"""In-process metrics for the bot
+
+A small set of metric primitives which are enough for the bot's needs without pulling
+in a third party client. Every metric registers itself in the module level
+``REGISTRY`` on creation, so it should be created once at the module level and then
+updated from wherever the measurement is taken.
+
+Label values are passed as keyword arguments and should always contain every label
+name the metric was created with:
+
+    events_total = Counter("events_total", "Events received.", ("event", "action"))
+    events_total.inc(event="pull_request", action="opened")
+
+All the registered metrics can be exported in the Prometheus text format using the
+``generate_latest`` function.
+"""
+import math
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+# Content type of the Prometheus text exposition format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Label values for a single time series in the order of the metric label names.
+LabelValues = tuple[str, ...]
+
+REGISTRY: list["Metric"] = []
+
+
+class Metric:
+    """Base class for all the metric types."""
+
+    kind: str = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        REGISTRY.append(self)
+
+    def _label_values(self, labels: dict[str, str]) -> LabelValues:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(
+                f"Expected labels {self.labelnames} for the metric {self.name!r}, "
+                + f"got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> Iterator[str]:
+        """Generate the lines of the metric in the Prometheus text format."""
+        yield f"# HELP {self.name} {_escape(self.documentation, quote=False)}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._render_samples()
+
+    def _render_samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def _sample(
+        self,
+        values: LabelValues,
+        value: float,
+        *,
+        suffix: str = "",
+        extra: Iterable[tuple[str, str]] = (),
+    ) -> str:
+        pairs = [*zip(self.labelnames, values), *extra]
+        labels = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        if labels:
+            labels = f"{{{labels}}}"
+        return f"{self.name}{suffix}{labels} {_format_value(value)}"
+
+
+class Counter(Metric):
+    """A monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only be incremented by non-negative amounts")
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._label_values(labels), 0)
+
+    def _render_samples(self) -> Iterator[str]:
+        for values, value in self._values.items():
+            yield self._sample(values, value)
+
+
+class Gauge(Metric):
+    """A value which can go up and down."""
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._label_values(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._label_values(labels), 0)
+
+    def _render_samples(self) -> Iterator[str]:
+        for values, value in self._values.items():
+            yield self._sample(values, value)
+
+
+class Histogram(Metric):
+    """Distribution of the observed values in cumulative buckets along with their
+    total sum and count."""
+
+    kind = "histogram"
+
+    DEFAULT_BUCKETS: tuple[float, ...] = (
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1,
+        2.5,
+        5,
+        10,
+        30,
+        60,
+    )
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        *,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        # The last slot is the implicit ``+Inf`` bucket.
+        counts[-1] += 1
+        self._sums[key] = self._sums.get(key, 0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the time taken by the block of code in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        counts = self._counts.get(self._label_values(labels))
+        return 0 if counts is None else counts[-1]
+
+    def sum(self, **labels: str) -> float:
+        return self._sums.get(self._label_values(labels), 0)
+
+    def _render_samples(self) -> Iterator[str]:
+        for values, counts in self._counts.items():
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                yield self._sample(
+                    values,
+                    count,
+                    suffix="_bucket",
+                    extra=[("le", _format_value(bound))],
+                )
+            yield self._sample(values, self._sums[values], suffix="_sum")
+            yield self._sample(values, counts[-1], suffix="_count")
+
+
+def generate_latest(registry: Iterable[Metric] = REGISTRY) -> str:
+    """Return all the metrics in the registry in the Prometheus text format."""
+    lines: list[str] = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str, *, quote: bool = True) -> str:
+    value = value.replace("\\", r"\\").replace("\n", r"\n")
+    if quote:
+        value = value.replace('"', r"\"")
+    return value
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    elif value == -math.inf:
+        return "-Inf"
+    elif math.isnan(value):
+        return "NaN"
+    return repr(float(value))
@@ -1,3 +1,3 @@
-from algorithms_keeper.parser.python_parser import PythonParser
+from algorithms_keeper.parser.python_parser import PythonParser, warm_up
 
-__all__ = ["PythonParser"]
+__all__ = ["PythonParser", "warm_up"]
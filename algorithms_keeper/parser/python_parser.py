@@ -1,6 +1,7 @@
 import importlib
 import inspect
 import logging
+from pathlib import Path
 from typing import Any, Iterable, Iterator, Mapping
 
 from fixit import CstLintRule, LintConfig
@@ -8,6 +9,7 @@ from fixit.common.utils import LintRuleCollectionT
 from fixit.rule_lint_engine import lint_file
 from libcst import ParserSyntaxError
 
+from algorithms_keeper import tracing
 from algorithms_keeper.parser.files_parser import BaseFilesParser
 from algorithms_keeper.parser.record import PullRequestReviewRecord
 from algorithms_keeper.parser.rules import RequireDoctestRule
@@ -17,6 +19,17 @@ RULES_DOTPATH: str = "algorithms_keeper.parser.rules"
 
 DEFAULT_CONFIG: LintConfig = LintConfig(packages=[RULES_DOTPATH])
 
+# Source linted by ``warm_up``, which uses the functions, type hints and doctests
+# checked by the rules.
+WARM_UP_SOURCE: bytes = b'''\
+def add(first: int, second: int) -> int:
+    """
+    >>> add(1, 2)
+    3
+    """
+    return first + second
+'''
+
 logger = logging.getLogger(__package__)
 
 
@@ -45,6 +58,19 @@ def get_rules_from_config(config: LintConfig = DEFAULT_CONFIG) -> LintRuleCollec
     return rules
 
 
+def warm_up() -> None:
+    """Lint a small source with all the rules once, so that the lazily initialized
+    parts of the lint engine are ready before the first pull request."""
+    lint_file(
+        Path("warm_up.py"),
+        WARM_UP_SOURCE,
+        use_ignore_byte_markers=False,
+        use_ignore_comments=False,
+        config=DEFAULT_CONFIG,
+        rules=get_rules_from_config(),
+    )
+
+
 class PythonParser(BaseFilesParser):
     """Parser for all the Python files in the pull request.
 
@@ -111,6 +137,16 @@ class PythonParser(BaseFilesParser):
         The caller of this function should use a loop to generate and parse the files
         one at a time. This way the labels will be filled only after all the files
         have been parsed.
+        """
+        for file in self.pr_files:
+            if self.should_check(file, ignore_modified):
+                yield file
+        # Fill the labels **only** after all the files have been parsed.
+        self._pr_record.fill_labels(self.pr_labels)
+
+    @staticmethod
+    def should_check(file: File, ignore_modified: bool) -> bool:
+        """Return ``True`` if the file should be checked.
 
         Ignores:
 
@@ -119,43 +155,42 @@ class PythonParser(BaseFilesParser):
         - Optionally ignore files which were modified (Issue #11)
         - Files in the *scripts/* directory (Issue #11)
         """
-        for file in self.pr_files:
-            filepath = file.path
-            if (
-                # If *ignore_modified* is ``True``, yield only the added files,
-                # otherwise yield all the files.
-                (not ignore_modified or file.status == "added")
-                and filepath.suffix == ".py"
-                and "scripts" not in filepath.parts
-                and not filepath.name.startswith("__")
-                and (
-                    not (
-                        filepath.name.startswith("test_")
-                        or filepath.name.endswith("_test.py")
-                    )
+        filepath = file.path
+        return (
+            # If *ignore_modified* is ``True``, check only the added files, otherwise
+            # check all the files.
+            (not ignore_modified or file.status == "added")
+            and filepath.suffix == ".py"
+            and "scripts" not in filepath.parts
+            and not filepath.name.startswith("__")
+            and (
+                not (
+                    filepath.name.startswith("test_")
+                    or filepath.name.endswith("_test.py")
                 )
-            ):
-                yield file
-        # Fill the labels **only** after all the files have been parsed.
-        self._pr_record.fill_labels(self.pr_labels)
+            )
+        )
 
     def parse(self, file: File, source: bytes) -> None:
         """Run the lint engine on the given *source* for the *file*."""
-        try:
-            reports = lint_file(
-                file.path,
-                source,
-                use_ignore_byte_markers=False,
-                use_ignore_comments=False,
-                config=DEFAULT_CONFIG,
-                rules=self._rules,
-            )
-            self._pr_record.add_comments(reports, file.name)
-        except (SyntaxError, ParserSyntaxError) as exc:
-            self._pr_record.add_error(exc, file.name)
-            logger.info(
-                "Invalid Python code for the file: [%s] %s", file.name, self.pr_html_url
-            )
+        with tracing.span("parser.parse", file=file.name, size=len(source)):
+            try:
+                reports = lint_file(
+                    file.path,
+                    source,
+                    use_ignore_byte_markers=False,
+                    use_ignore_comments=False,
+                    config=DEFAULT_CONFIG,
+                    rules=self._rules,
+                )
+                self._pr_record.add_comments(reports, file.name)
+            except (SyntaxError, ParserSyntaxError) as exc:
+                self._pr_record.add_error(exc, file.name)
+                logger.info(
+                    "Invalid Python code for the file: [%s] %s",
+                    file.name,
+                    self.pr_html_url,
+                )
 
     def _contains_testfile(self) -> bool:
         """Check whether any of the pull request files satisfy the naming convention
@@ -0,0 +1,121 @@
+"""On-demand profiling of the event dispatch
+
+Some pull requests, like the ones with huge generated files, make the lint engine
+take seconds and the hot spots are hard to find without reproducing them locally.
+The profiler runs the dispatch of the selected events under ``cProfile`` and writes
+the stats to a directory as ``<delivery id>.pstats``, which can be looked at with
+``python -m pstats`` or turned into a flame graph with a tool like ``flameprof``.
+
+An event is selected either by its ``event:action`` or only ``event`` name, or at
+random with the given sampling rate.
+
+``cProfile`` can only profile one thing at a time in a thread and it records every
+task which runs on the event loop while it's enabled. So, only one event is profiled
+at a time and the events selected in the meantime are skipped. The other events
+being processed at the same time still show up in the profile.
+"""
+import cProfile
+import logging
+import random
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Collection, Iterator, Optional
+
+from gidgethub.sansio import Event
+
+from algorithms_keeper.metrics import Counter
+
+logger = logging.getLogger(__package__)
+
+profiled_events_total = Counter(
+    "algorithms_keeper_profiled_events_total",
+    "Number of events whose dispatch was profiled.",
+    ("event", "action"),
+)
+
+
+def parse_names(value: str) -> set[str]:
+    """Parse a comma separated list of event names, like
+    ``pull_request:opened,check_run``."""
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+class Profiler:
+    """Profile the dispatch of the selected events and write the stats to the
+    *directory*.
+
+    The events whose ``event:action`` or ``event`` name is in *events* are always
+    profiled, and the rest with the probability of *sample_rate*.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        events: Collection[str] = (),
+        sample_rate: float = 0,
+    ) -> None:
+        self.directory = directory
+        self.events = events
+        self.sample_rate = sample_rate
+        # Delivery ID of the event being profiled, if any.
+        self._active: Optional[str] = None
+
+    def selected(self, event: Event) -> bool:
+        """Return ``True`` if the event should be profiled."""
+        action = event.data.get("action", "")
+        return (
+            f"{event.event}:{action}" in self.events
+            or event.event in self.events
+            or random.random() < self.sample_rate
+        )
+
+    def path(self, event: Event) -> Path:
+        """Return the path of the stats file for the event."""
+        # Delivery IDs are UUIDs for the GitHub deliveries, but keep the replayed
+        # and synthetic ones from escaping the directory.
+        name = re.sub(r"[^\w.-]", "_", event.delivery_id)
+        return self.directory / f"{name}.pstats"
+
+    @contextmanager
+    def profile(self, event: Event) -> Iterator[None]:
+        """Profile the block of code if the event is selected."""
+        if not self.selected(event):
+            yield
+            return None
+        if self._active is not None:
+            logger.info(
+                "Not profiling delivery_id=%s while profiling delivery_id=%s",
+                event.delivery_id,
+                self._active,
+            )
+            yield
+            return None
+        self._active = event.delivery_id
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            self._active = None
+            self._dump(profiler, event, elapsed)
+
+    def _dump(self, profiler: cProfile.Profile, event: Event, elapsed: float) -> None:
+        path = self.path(event)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError:
+            logger.exception("Failed to write the profile to %s", path)
+            return None
+        profiled_events_total.inc(
+            event=event.event, action=event.data.get("action", "")
+        )
+        logger.info(
+            "Profiled delivery_id=%s in %.3fs to %s", event.delivery_id, elapsed, path
+        )
@@ -0,0 +1,192 @@
+"""Rate limit aware scheduling of the GitHub API requests
+
+GitHub limits the number of requests per installation in fixed windows, separately
+for every resource: the ``core`` REST API gets thousands of requests an hour while
+the ``search`` API gets 30 requests a minute. Once a limit runs out, every request
+fails until the window resets, including the ones a maintainer is waiting for.
+
+The ``RateLimiter`` keeps a bucket per installation and resource with the requests
+left in the current window. The bucket is drawn down before every request and
+synced with the ``X-RateLimit-*`` headers of every response. A part of every bucket
+is reserved for the urgent requests, like closing an invalid pull request or the
+review for a maintainer command, which are marked with the ``urgent`` context
+manager. The other requests wait for the next window once only the reserve is left,
+or fail with ``RateLimitExceeded`` if the window resets too far in the future.
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Mapping, Optional
+
+from gidgethub import RateLimitExceeded
+from gidgethub.sansio import RateLimit
+from yarl import URL
+
+from algorithms_keeper.metrics import Counter
+
+# Default limit and window in seconds per resource, used until the headers of the
+# first response tell otherwise.
+DEFAULT_LIMITS: dict[str, tuple[int, float]] = {
+    "core": (5000, 60 * 60),
+    "search": (30, 60),
+    "graphql": (5000, 60 * 60),
+}
+
+# Fraction of every bucket reserved for the urgent requests.
+DEFAULT_RESERVE = 0.1
+
+# Maximum number of seconds a request waits for the next window. The search API
+# window is a minute, so its requests always wait.
+DEFAULT_MAX_WAIT = 60
+
+logger = logging.getLogger(__package__)
+
+deferred_requests_total = Counter(
+    "algorithms_keeper_github_deferred_requests_total",
+    "Number of requests which waited for the next rate limit window.",
+    ("resource",),
+)
+
+_urgent: ContextVar[bool] = ContextVar("urgent", default=False)
+
+
+@contextmanager
+def urgent() -> Iterator[None]:
+    """Mark the requests made inside the block as urgent, so that they can use the
+    reserved part of the rate limit."""
+    token = _urgent.set(True)
+    try:
+        yield
+    finally:
+        _urgent.reset(token)
+
+
+def resource_for(url: str) -> Optional[str]:
+    """Return the rate limit resource the request to the URL counts against.
+
+    Returns ``None`` for the requests which are made as the app instead of as an
+    installation, as they don't count against the installation rate limit.
+    """
+    path = URL(url).path
+    if path.startswith("/app/") or path == "/app":
+        return None
+    elif path.startswith("/search/"):
+        return "search"
+    elif path == "/graphql":
+        return "graphql"
+    return "core"
+
+
+@dataclass
+class Bucket:
+    """Requests left in the current rate limit window."""
+
+    limit: int
+    remaining: int
+
+    # Epoch time in seconds at which the window resets.
+    reset: float
+
+    # Length of the window in seconds, used to guess the next reset time.
+    window: float
+
+    def refill(self, now: float) -> None:
+        if now >= self.reset:
+            self.remaining = self.limit
+            # Skip the windows which passed without any request.
+            while self.reset <= now:
+                self.reset += self.window
+
+    def update(self, rate_limit: RateLimit) -> None:
+        """Sync the bucket with the rate limit from the response headers."""
+        reset = rate_limit.reset_datetime.timestamp()
+        self.limit = rate_limit.limit
+        if reset != self.reset:
+            # A new window started since the bucket was last synced, or the bucket
+            # was never synced and its window is only a guess.
+            self.remaining = rate_limit.remaining
+        else:
+            # The requests in flight are already drawn from the bucket but might not
+            # be counted in the response.
+            self.remaining = min(self.remaining, rate_limit.remaining)
+        self.reset = reset
+
+
+class RateLimiter:
+    """Schedule the requests within the rate limit of every installation.
+
+    A *reserve* fraction of every bucket is kept for the urgent requests. The other
+    requests wait for at most *max_wait* seconds for the next window once only the
+    reserve is left.
+    """
+
+    def __init__(
+        self,
+        *,
+        reserve: float = DEFAULT_RESERVE,
+        max_wait: float = DEFAULT_MAX_WAIT,
+    ) -> None:
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self._buckets: dict[tuple[int, str], Bucket] = {}
+
+    def bucket(self, installation_id: int, resource: str) -> Bucket:
+        key = installation_id, resource
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limit, window = DEFAULT_LIMITS.get(resource, DEFAULT_LIMITS["core"])
+            bucket = Bucket(limit, limit, time.time() + window, window)
+            self._buckets[key] = bucket
+        return bucket
+
+    async def acquire(self, installation_id: int, resource: str) -> None:
+        """Wait until a request can be made for the installation and draw it from
+        the bucket of the resource.
+
+        Raises ``RateLimitExceeded`` if the request would have to wait for more than
+        ``max_wait`` seconds.
+        """
+        bucket = self.bucket(installation_id, resource)
+        while True:
+            now = time.time()
+            bucket.refill(now)
+            floor = 0 if _urgent.get() else int(bucket.limit * self.reserve)
+            if bucket.remaining > floor:
+                bucket.remaining -= 1
+                return None
+            wait = bucket.reset - now
+            if wait > self.max_wait:
+                raise RateLimitExceeded(
+                    RateLimit(
+                        limit=bucket.limit,
+                        remaining=bucket.remaining,
+                        reset_epoch=bucket.reset,
+                    ),
+                    f"Rate limit for the {resource!r} resource of the installation "
+                    + f"{installation_id} resets in {wait:.0f}s",
+                )
+            deferred_requests_total.inc(resource=resource)
+            logger.warning(
+                "Deferring a request for installation=%s resource=%s by %.1fs",
+                installation_id,
+                resource,
+                wait,
+            )
+            await asyncio.sleep(wait)
+
+    def update(
+        self, installation_id: int, resource: str, headers: Mapping[str, str]
+    ) -> None:
+        """Sync the bucket with the ``X-RateLimit-*`` headers of the response."""
+        rate_limit = RateLimit.from_http(headers)
+        if rate_limit is None:
+            return None
+        resource = headers.get("x-ratelimit-resource", resource)
+        self.bucket(installation_id, resource).update(rate_limit)
+
+
+# Shared by all the ``GitHubAPI`` instances in the process.
+rate_limiter = RateLimiter()
@@ -0,0 +1,274 @@
+"""Replay recorded webhook deliveries through the router
+
+This is a benchmarking tool to measure the changes against real traffic shapes
+offline. Every delivery in the given directory is dispatched through ``main_router``
+with all the GitHub API calls going to a local stub which returns canned responses
+after a configurable latency. At the end, the throughput, the latency percentiles and
+the number of API calls per event type are reported.
+
+    python -m algorithms_keeper.replay <directory> [--latency 0.05] [--concurrency 4]
+
+The directory should contain the deliveries either as ``*.json`` files, one delivery
+per file, or ``*.jsonl`` files with one delivery per line. A delivery is an object
+with the request ``headers`` and the ``body``, which can be the JSON payload or the
+raw payload as a string:
+
+    {"headers": {"X-GitHub-Event": "...", "X-GitHub-Delivery": "..."}, "body": {...}}
+
+The canned responses can be overridden by a ``responses.json`` file in the directory
+which maps ``"<METHOD> <endpoint template>"`` (see ``api.endpoint_template``) to the
+response body. All the other requests get a minimal response good enough for the
+callbacks to go through.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import sys
+import time
+from base64 import b64encode
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Mapping, Optional, Sequence
+
+from gidgethub.abc import JSON_UTF_8_CHARSET
+from gidgethub.sansio import Event
+from multidict import CIMultiDict
+
+from algorithms_keeper.api import GitHubAPI, endpoint_template
+from algorithms_keeper.event import main_router
+
+RESPONSES_FILENAME = "responses.json"
+
+logger = logging.getLogger(__package__)
+
+
+def load_deliveries(directory: Path) -> list[Event]:
+    """Load all the recorded deliveries in the directory sorted by the filename."""
+    events = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix == ".json" and path.name != RESPONSES_FILENAME:
+            events.append(_to_event(json.loads(path.read_text())))
+        elif path.suffix == ".jsonl":
+            for line in path.read_text().splitlines():
+                if line.strip():
+                    events.append(_to_event(json.loads(line)))
+    return events
+
+
+def _to_event(delivery: Mapping[str, Any]) -> Event:
+    headers = CIMultiDict(delivery["headers"])
+    body = delivery["body"]
+    return Event(
+        json.loads(body) if isinstance(body, str) else body,
+        event=headers["x-github-event"],
+        delivery_id=headers["x-github-delivery"],
+    )
+
+
+def default_response(method: str, url: str) -> Any:
+    """Return a minimal response body for the request which is good enough for the
+    callbacks to go through."""
+    endpoint = endpoint_template(url)
+    if method != "GET":
+        # The created resource, e.g. the issue opened on installation.
+        return {"url": url}
+    elif endpoint == "/search/issues":
+        return {"total_count": 0, "items": []}
+    elif endpoint.endswith("/check-runs"):
+        return {"total_count": 0, "check_runs": []}
+    elif endpoint.endswith("/files"):
+        return []
+    elif "/contents/" in endpoint:
+        return {"content": b64encode(b"").decode()}
+    elif endpoint.endswith("/pulls/{number}"):
+        return {
+            "url": url,
+            "html_url": url,
+            "issue_url": url.replace("/pulls/", "/issues/"),
+            "comments_url": url.replace("/pulls/", "/issues/") + "/comments",
+            "head": {"sha": ""},
+            "user": {"login": "", "type": "User"},
+            "author_association": "NONE",
+            "labels": [],
+            "draft": False,
+            "mergeable": True,
+            "requested_reviewers": [],
+        }
+    return {}
+
+
+class StubGitHubAPI(GitHubAPI):
+    """A ``GitHubAPI`` which answers all the requests locally.
+
+    Every request waits for ``latency`` seconds, give or take a uniformly distributed
+    ``jitter``, before returning the canned response for it. The number of requests
+    made is available in the ``calls`` attribute.
+    """
+
+    def __init__(
+        self,
+        installation_id: int,
+        *,
+        responses: Optional[Mapping[str, Any]] = None,
+        latency: float = 0,
+        jitter: float = 0,
+    ) -> None:
+        super().__init__(installation_id, None, "algorithms-keeper-replay")
+        self._responses = responses or {}
+        self._latency = latency
+        self._jitter = jitter
+        self.calls = 0
+
+    @property
+    async def access_token(self) -> str:
+        return "replay"
+
+    async def _request(
+        self, method: str, url: str, headers: Mapping[str, str], body: bytes = b""
+    ) -> tuple[int, Mapping[str, str], bytes]:
+        self.calls += 1
+        delay = self._latency + random.uniform(-self._jitter, self._jitter)
+        await asyncio.sleep(max(delay, 0))
+        try:
+            data = self._responses[f"{method} {endpoint_template(url)}"]
+        except KeyError:
+            data = default_response(method, url)
+        return 200, {"content-type": JSON_UTF_8_CHARSET}, json.dumps(data).encode()
+
+
+@dataclass
+class EventStats:
+    durations: list[float] = field(default_factory=list)
+    api_calls: int = 0
+    failures: int = 0
+
+
+@dataclass
+class Report:
+    elapsed: float
+    stats: dict[str, EventStats]
+
+    @property
+    def total(self) -> int:
+        return sum(len(stats.durations) for stats in self.stats.values())
+
+    @property
+    def events_per_second(self) -> float:
+        return self.total / self.elapsed if self.elapsed else math.inf
+
+    def lines(self) -> Iterator[str]:
+        yield f"events={self.total} elapsed={self.elapsed:.3f}s"
+        yield f"throughput={self.events_per_second:.1f} events/s"
+        yield (
+            f"{'event':<40} {'count':>6} {'p50 (ms)':>10} {'p99 (ms)':>10} "
+            f"{'calls/event':>12} {'failures':>9}"
+        )
+        for event_info, stats in sorted(self.stats.items()):
+            count = len(stats.durations)
+            yield (
+                f"{event_info:<40} {count:>6} "
+                f"{percentile(stats.durations, 50) * 1000:>10.1f} "
+                f"{percentile(stats.durations, 99) * 1000:>10.1f} "
+                f"{stats.api_calls / count:>12.1f} {stats.failures:>9}"
+            )
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """Return the nearest-rank percentile of the values."""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+async def replay(
+    events: Sequence[Event],
+    *,
+    responses: Optional[Mapping[str, Any]] = None,
+    latency: float = 0,
+    jitter: float = 0,
+    concurrency: int = 1,
+) -> Report:
+    """Dispatch all the events through ``main_router`` and report the results.
+
+    At most ``concurrency`` events are dispatched at the same time.
+    """
+    stats: dict[str, EventStats] = defaultdict(EventStats)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def dispatch(event: Event) -> None:
+        gh = StubGitHubAPI(
+            event.data.get("installation", {}).get("id", 0),
+            responses=responses,
+            latency=latency,
+            jitter=jitter,
+        )
+        event_stats = stats[f"{event.event}:{event.data.get('action')}"]
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await main_router.dispatch(event, gh)
+            except Exception:
+                event_stats.failures += 1
+                logger.exception("Failed to replay delivery_id=%s", event.delivery_id)
+            event_stats.durations.append(time.perf_counter() - start)
+            event_stats.api_calls += gh.calls
+
+    start = time.perf_counter()
+    await asyncio.gather(*(dispatch(event) for event in events))
+    return Report(elapsed=time.perf_counter() - start, stats=dict(stats))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m algorithms_keeper.replay",
+        description="Replay recorded webhook deliveries against a local GitHub stub.",
+    )
+    parser.add_argument("directory", type=Path, help="directory of the deliveries")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="API latency in seconds"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0, help="API latency jitter in seconds"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="events dispatched at a time"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="number of times to replay the events"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.WARNING)
+    events = []
+    for _ in range(args.repeat):
+        # Load the events every time as the callbacks can modify the payload.
+        events.extend(load_deliveries(args.directory))
+    if not events:
+        print(f"No deliveries found in {args.directory}", file=sys.stderr)
+        return 1
+    responses_path = args.directory / RESPONSES_FILENAME
+    responses = (
+        json.loads(responses_path.read_text()) if responses_path.exists() else None
+    )
+    report = asyncio.run(
+        replay(
+            events,
+            responses=responses,
+            latency=args.latency,
+            jitter=args.jitter,
+            concurrency=args.concurrency,
+        )
+    )
+    for line in report.lines():
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Retry policy for the GitHub API requests
+
+A ``502 Bad Gateway`` or a secondary rate limit ``403 Forbidden`` from GitHub is
+usually gone a moment later, but without a retry it fails the whole event and the
+pull request is never reviewed.
+
+The failed requests are retried with a jittered exponential backoff, or after the
+time GitHub asks for in the ``Retry-After`` header, or at the ``X-RateLimit-Reset``
+time once the rate limit is used up. A request is retried only if it's safe to do so
+more than once: the idempotent HTTP methods, and the ``POST`` and ``PATCH``
+requests which don't do anything more when repeated, like adding a label, which are
+marked with the ``idempotent`` context manager.
+
+Besides the attempts per request, every event has a budget of retries for all its
+requests, so that an outage doesn't make every event retry every request.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Mapping, Optional
+
+# Methods which can be repeated without changing the result.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Server errors which are usually transient.
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+
+# Statuses used by GitHub for the secondary rate limits and the exhausted rate limit.
+RATE_LIMIT_STATUSES = frozenset({403, 429})
+
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BUDGET = 10
+
+_idempotent: ContextVar[bool] = ContextVar("idempotent", default=False)
+
+
+@contextmanager
+def idempotent() -> Iterator[None]:
+    """Mark the requests made inside the block as safe to retry, whatever their
+    method."""
+    token = _idempotent.set(True)
+    try:
+        yield
+    finally:
+        _idempotent.reset(token)
+
+
+def is_idempotent(method: str) -> bool:
+    """Return ``True`` if the request with the method can be retried."""
+    return method.upper() in IDEMPOTENT_METHODS or _idempotent.get()
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How many times and after how long the failed requests are retried.
+
+    A request is made at most *attempts* times and the requests of an event are
+    retried at most *budget* times in total. The backoff doubles from *base_delay*
+    seconds on every attempt and a request isn't retried if it would have to wait for
+    more than *max_delay* seconds.
+    """
+
+    attempts: int = DEFAULT_ATTEMPTS
+    budget: int = DEFAULT_BUDGET
+    base_delay: float = 1
+    max_delay: float = 60
+
+    def backoff(self, attempt: int) -> float:
+        """Return the jittered delay before the next try after the *attempt*,
+        counting from 1."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def delay(
+        self, attempt: int, status: int, headers: Mapping[str, str]
+    ) -> Optional[float]:
+        """Return the number of seconds to wait before retrying the request which
+        got the response, or ``None`` if it shouldn't be retried."""
+        retry_after = headers.get("retry-after")
+        if status in RETRY_STATUSES:
+            delay = self.backoff(attempt)
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        elif status in RATE_LIMIT_STATUSES:
+            if retry_after is not None and retry_after.isdigit():
+                # Secondary rate limit.
+                delay = float(retry_after)
+            elif (
+                headers.get("x-ratelimit-remaining") == "0"
+                and headers.get("x-ratelimit-reset", "").isdigit()
+            ):
+                # The rate limit is used up and the window resets a bit later than
+                # the header tells as the clocks are not in sync.
+                reset = float(headers["x-ratelimit-reset"])
+                delay = max(reset - time.time(), 0) + self.backoff(attempt)
+            else:
+                # Forbidden for real.
+                return None
+        else:
+            return None
+        return delay if delay <= self.max_delay else None
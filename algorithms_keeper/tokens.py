@@ -0,0 +1,166 @@
+"""Installation access tokens
+
+Every request made on behalf of an installation needs an access token, which is
+minted by GitHub for the app and expires an hour later, as told by the
+``expires_at`` field of the response.
+
+The ``TokenManager`` keeps a token for every installation, without any limit on the
+number of installations as a token takes only a few bytes. The concurrent events for
+the same installation share a single request to mint a token instead of each minting
+its own. The tokens which were used recently are refreshed in the background a few
+minutes before they expire, so that an event rarely has to wait for a new token.
+The tokens of the installations which went quiet are left to expire.
+
+The tokens can be stored in any mapping, like the ``cache.SQLiteCache`` shared by the
+worker processes.
+"""
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Callable, Coroutine, MutableMapping, Optional
+
+from algorithms_keeper.metrics import Counter, Histogram
+
+# Number of seconds before the expiry after which a token is refreshed in the
+# background, and the minimum number of seconds a token should be valid for to be
+# handed out, so that it doesn't expire in the middle of an event.
+REFRESH_MARGIN = 5 * 60
+MIN_VALIDITY = 60
+
+# Number of seconds between the refreshes in the background.
+REFRESH_INTERVAL = 60
+
+# Number of seconds after the last use of a token after which it's no longer
+# refreshed.
+IDLE_TIMEOUT = 60 * 60
+
+logger = logging.getLogger(__package__)
+
+tokens_minted_total = Counter(
+    "algorithms_keeper_tokens_minted_total",
+    "Number of installation access tokens minted, either on demand or refreshed in "
+    "the background.",
+    ("reason",),
+)
+token_mint_duration_seconds = Histogram(
+    "algorithms_keeper_token_mint_duration_seconds",
+    "Time taken to mint an installation access token, including the waiting for "
+    "the rate limit and the retries.",
+    ("reason",),
+)
+
+
+@dataclass(frozen=True)
+class Token:
+    token: str
+
+    # Epoch time in seconds at which the token expires.
+    expires_at: float
+
+    @classmethod
+    def from_response(cls, data: dict[str, str]) -> "Token":
+        """Create the token from the response of the access token endpoint."""
+        expires_at = datetime.fromisoformat(data["expires_at"].replace("Z", "+00:00"))
+        return cls(data["token"], expires_at.timestamp())
+
+    def dumps(self) -> str:
+        """Return the token as JSON, to be stored in a ``cache.SQLiteCache``."""
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def loads(cls, data: str) -> "Token":
+        """Create the token from the JSON returned by ``dumps``."""
+        return cls(**json.loads(data))
+
+
+# Function to mint a new token for the installation.
+Minter = Callable[[int], Coroutine[Any, Any, Token]]
+
+
+async def _timed(mint: Minter, installation_id: int, *, reason: str) -> Token:
+    with token_mint_duration_seconds.time(reason=reason):
+        return await mint(installation_id)
+
+
+class TokenManager:
+    """Hand out the installation access tokens stored in the *cache* and mint them
+    when needed."""
+
+    def __init__(self, cache: Optional[MutableMapping[int, Token]] = None) -> None:
+        self.cache: MutableMapping[int, Token] = {} if cache is None else cache
+        # Tasks minting a token per installation, shared by the waiters.
+        self._minting: dict[int, asyncio.Task[Token]] = {}
+        # Last time a token was handed out per installation.
+        self._last_used: dict[int, float] = {}
+
+    def _expires_within(self, installation_id: int, seconds: float) -> bool:
+        token = self.cache.get(installation_id)
+        return token is None or token.expires_at - time.time() <= seconds
+
+    async def get(self, installation_id: int, mint: Minter) -> str:
+        """Return a token for the installation, minting a new one with *mint* if
+        there isn't one valid for long enough."""
+        self._last_used[installation_id] = time.time()
+        token = self.cache.get(installation_id)
+        if token is None or token.expires_at - time.time() <= MIN_VALIDITY:
+            token = await self._mint(installation_id, mint, reason="miss")
+        return token.token
+
+    async def _mint(self, installation_id: int, mint: Minter, *, reason: str) -> Token:
+        task = self._minting.get(installation_id)
+        if task is None:
+            task = asyncio.create_task(_timed(mint, installation_id, reason=reason))
+            self._minting[installation_id] = task
+            task.add_done_callback(
+                lambda _: self._done(installation_id, task, reason=reason)
+            )
+        # A waiter which is cancelled doesn't cancel the minting for the others.
+        return await asyncio.shield(task)
+
+    def _done(
+        self, installation_id: int, task: "asyncio.Task[Token]", *, reason: str
+    ) -> None:
+        del self._minting[installation_id]
+        if not task.cancelled() and task.exception() is None:
+            self.cache[installation_id] = task.result()
+            tokens_minted_total.inc(reason=reason)
+
+    async def refresh(self, mint: Minter) -> int:
+        """Mint a new token for the installations used recently whose token expires
+        soon, and forget the ones which went idle.
+
+        Returns the number of tokens refreshed.
+        """
+        now = time.time()
+        for installation_id, last_used in list(self._last_used.items()):
+            if now - last_used > IDLE_TIMEOUT:
+                del self._last_used[installation_id]
+        expiring = [
+            installation_id
+            for installation_id in self._last_used
+            if self._expires_within(installation_id, REFRESH_MARGIN)
+        ]
+        results = await asyncio.gather(
+            *(
+                self._mint(installation_id, mint, reason="refresh")
+                for installation_id in expiring
+            ),
+            return_exceptions=True,
+        )
+        for installation_id, result in zip(expiring, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    "Failed to refresh the token for installation=%s: %r",
+                    installation_id,
+                    result,
+                )
+        return sum(not isinstance(result, BaseException) for result in results)
+
+    async def run(self, mint: Minter, *, interval: float = REFRESH_INTERVAL) -> None:
+        """Refresh the tokens every *interval* seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh(mint)
@@ -0,0 +1,191 @@
+"""Tracing spans for the event processing
+
+Every delivery gets a tree of spans: the dispatch of the event at the root, and
+below it the router callbacks, the GitHub API requests, the file content requests and
+the parsing of every file. This tells whether a slow pull request check is spent
+waiting on the network or parsing the files.
+
+A span is started with the ``span`` context manager, which makes it the parent of
+the spans started inside the block, even across the ``await`` points as the current
+span is kept in a context variable:
+
+    with span("github.request", method="GET") as current:
+        ...
+        current.attributes["status"] = 200
+
+The finished spans are passed to every exporter in the module level ``EXPORTERS``.
+The spans are forwarded to Sentry as well when its tracing is enabled, as a child of
+the transaction of the webhook request or as a new transaction in the background
+mode.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+import sentry_sdk
+from sentry_sdk.tracing import Span as SentrySpan
+from sentry_sdk.tracing_utils import has_tracing_enabled
+
+# Number of finished spans buffered by the ``JSONLinesExporter`` before writing them
+# out, unless a trace is finished before that.
+MAX_BUFFERED_SPANS = 100
+
+logger = logging.getLogger(__package__)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str = field(default_factory=lambda: os.urandom(8).hex())
+    parent_id: Optional[str] = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    # Wall clock time at the start of the span in seconds since the epoch, while the
+    # duration is measured with a monotonic clock.
+    start_time: float = field(default_factory=time.time)
+    duration: Optional[float] = None
+
+    # Either "ok" or "error" once the span is finished.
+    status: Optional[str] = None
+
+    # Mirror of the span in Sentry, if its tracing is enabled.
+    sentry_span: Optional[SentrySpan] = field(default=None, repr=False)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Exporter:
+    """Base class for the exporters of the finished spans."""
+
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryExporter(Exporter):
+    """Keep the finished spans in a list."""
+
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+
+class JSONLinesExporter(Exporter):
+    """Append the finished spans to a file, one JSON object per line.
+
+    The spans are buffered and written out in a single write once a trace is
+    finished, so that the lines from the other worker processes appending to the
+    same file are not interleaved within a line.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "ab", buffering=0)
+        self._buffer: list[bytes] = []
+
+    def export(self, span: Span) -> None:
+        self._buffer.append(json.dumps(span.to_dict(), default=str).encode() + b"\n")
+        if span.parent_id is None or len(self._buffer) >= MAX_BUFFERED_SPANS:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._file.write(b"".join(self._buffer))
+            self._buffer.clear()
+
+    def close(self) -> None:
+        self._flush()
+        self._file.close()
+
+
+EXPORTERS: list[Exporter] = []
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    """Return the span of the block being executed, if any."""
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Trace the block of code as a child of the current span.
+
+    A new trace is started if there's no current span. The span is marked as an
+    error if the block raises an exception.
+    """
+    parent = _current_span.get()
+    current = Span(
+        name,
+        trace_id=os.urandom(16).hex() if parent is None else parent.trace_id,
+        parent_id=None if parent is None else parent.span_id,
+        attributes=attributes,
+    )
+    current.sentry_span = _start_sentry_span(current, parent)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.status = "error"
+        raise
+    else:
+        current.status = "ok"
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        _finish_sentry_span(current)
+        for exporter in EXPORTERS:
+            try:
+                exporter.export(current)
+            except Exception:
+                logger.exception("Failed to export the span %r", current.name)
+
+
+def _start_sentry_span(current: Span, parent: Optional[Span]) -> Optional[SentrySpan]:
+    description = " ".join(
+        f"{key}={value}" for key, value in current.attributes.items()
+    )
+    if parent is not None:
+        if parent.sentry_span is None:
+            return None
+        return parent.sentry_span.start_child(op=current.name, description=description)
+    hub = sentry_sdk.Hub.current
+    if hub.client is None or not has_tracing_enabled(hub.client.options):
+        return None
+    # The webhook request transaction started by the ``AioHttpIntegration``. The
+    # scope's span is not changed by us as the queue workers share the same hub.
+    request_span = hub.scope.span
+    if request_span is not None:
+        return request_span.start_child(op=current.name, description=description)
+    return hub.start_transaction(op=current.name, name=description or current.name)
+
+
+def _finish_sentry_span(current: Span) -> None:
+    sentry_span = current.sentry_span
+    if sentry_span is None:
+        return None
+    for key, value in current.attributes.items():
+        sentry_span.set_data(key, value)
+    sentry_span.set_status("ok" if current.status == "ok" else "internal_error")
+    sentry_span.finish()
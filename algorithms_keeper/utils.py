@@ -16,10 +16,17 @@ import urllib.parse
 from base64 import b64decode
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Mapping, Optional, Union
+from typing import Any, Iterable, Mapping, MutableMapping, Optional, Union
 
+from algorithms_keeper import ratelimit, retry, tracing
 from algorithms_keeper.api import GitHubAPI
 from algorithms_keeper.constants import PR_REVIEW_BODY
+from algorithms_keeper.graphql import (
+    BLOB_BATCH_SIZE,
+    CHANGE_TYPES,
+    PULL_REQUEST_QUERY,
+    blobs_query,
+)
 
 
 @dataclass(frozen=True)
@@ -43,6 +50,24 @@ class File:
     status: str
 
 
+@dataclass(frozen=True)
+class PullRequestState:
+    # The SHA of the head commit of the pull request.
+    head_sha: str
+
+    # Either ``True`` or ``False``, or ``None`` if GitHub is still computing it.
+    mergeable: Optional[bool]
+
+    # Names of the labels on the pull request.
+    labels: list[str]
+
+    files: list[File]
+
+    # Check runs of the head commit, as the objects with the ``name``, ``status`` and
+    # ``conclusion`` keys in the same form as the REST API.
+    check_runs: list[dict[str, Any]]
+
+
 async def get_pr_for_commit(
     gh: GitHubAPI, *, sha: str, repository: str
 ) -> Optional[Any]:
@@ -90,11 +115,13 @@ async def add_label_to_pr_or_issue(
         if "labels_url" in pr_or_issue
         else pr_or_issue["issue_url"] + "/labels"
     )
-    await gh.post(
-        labels_url,
-        data={"labels": [label] if isinstance(label, str) else label},
-        oauth_token=await gh.access_token,
-    )
+    # Adding a label which is already there doesn't do anything.
+    with retry.idempotent():
+        await gh.post(
+            labels_url,
+            data={"labels": [label] if isinstance(label, str) else label},
+            oauth_token=await gh.access_token,
+        )
 
 
 async def remove_label_from_pr_or_issue(
@@ -127,6 +154,61 @@ async def remove_label_from_pr_or_issue(
         )
 
 
+def label_names(pr_or_issue: Mapping[str, Any]) -> list[str]:
+    """Return the names of the labels on the given pull request or issue."""
+    return [label["name"] for label in pr_or_issue["labels"]]
+
+
+async def reconcile_labels(
+    gh: GitHubAPI,
+    *,
+    labels: Iterable[str],
+    pr_or_issue: MutableMapping[str, Any],
+) -> None:
+    """Change the labels on the given pull request or issue to `labels` with at most
+    one request.
+
+    The change is computed against the labels in `pr_or_issue`, which are then
+    updated to the new labels, so that the callbacks which follow for the same event
+    see them. Nothing is requested if the labels don't change. Otherwise:
+
+    - Only adding labels is a single POST, like `add_label_to_pr_or_issue`.
+    - Only removing one label is a single DELETE.
+    - Any other change sets all the labels with a single PUT.
+
+    The labels in `pr_or_issue` are kept up to date by every callback for the event,
+    and the events for a pull request are processed one at a time, so the PUT body is
+    built from them without requesting the labels again.
+    """
+    current = label_names(pr_or_issue)
+    desired = list(dict.fromkeys(labels))
+    to_add = [label for label in desired if label not in current]
+    to_remove = [label for label in current if label not in desired]
+    if not to_add and not to_remove:
+        return None
+    if not to_remove:
+        await add_label_to_pr_or_issue(gh, label=to_add, pr_or_issue=pr_or_issue)
+    elif not to_add and len(to_remove) == 1:
+        await remove_label_from_pr_or_issue(
+            gh, label=to_remove, pr_or_issue=pr_or_issue
+        )
+    else:
+        labels_url = (
+            pr_or_issue["labels_url"]
+            if "labels_url" in pr_or_issue
+            else pr_or_issue["issue_url"] + "/labels"
+        )
+        desired = [label for label in current if label not in to_remove] + to_add
+        await gh.put(
+            labels_url, data={"labels": desired}, oauth_token=await gh.access_token
+        )
+    pr_or_issue["labels"] = [{"name": label} for label in desired]
+    # Keep the state fetched with GraphQL for the event in sync as well.
+    state: Optional[PullRequestState] = gh.pr_states.get(pr_or_issue.get("url", ""))
+    if state is not None:
+        state.labels[:] = desired
+
+
 async def get_user_open_pr_numbers(
     gh: GitHubAPI, *, repository: str, user_login: str
 ) -> list[int]:
@@ -168,22 +250,25 @@ async def close_pr_or_issue(
     If it is a pull request then dismiss all the requested reviews from it as well.
 
     As everything is going to be done by the bot, we will make comments compulsory
-    so as to know why was this pull request or issue closed.
+    so as to know why was this pull request or issue closed. These requests can use
+    the rate limit reserved for the urgent requests.
     """
-    await add_comment_to_pr_or_issue(gh, comment=comment, pr_or_issue=pr_or_issue)
-    if label is not None:
-        await add_label_to_pr_or_issue(gh, label=label, pr_or_issue=pr_or_issue)
-    await gh.patch(
-        pr_or_issue["url"],
-        data={"state": "closed"},
-        oauth_token=await gh.access_token,
-    )
-    try:
-        # The review requests will be coming from the CODEOWNERS file
-        if pr_or_issue["requested_reviewers"]:
-            await remove_requested_reviewers_from_pr(gh, pull_request=pr_or_issue)
-    except KeyError:
-        pass
+    with ratelimit.urgent():
+        await add_comment_to_pr_or_issue(gh, comment=comment, pr_or_issue=pr_or_issue)
+        if label is not None:
+            await add_label_to_pr_or_issue(gh, label=label, pr_or_issue=pr_or_issue)
+        with retry.idempotent():
+            await gh.patch(
+                pr_or_issue["url"],
+                data={"state": "closed"},
+                oauth_token=await gh.access_token,
+            )
+        try:
+            # The review requests will be coming from the CODEOWNERS file
+            if pr_or_issue["requested_reviewers"]:
+                await remove_requested_reviewers_from_pr(gh, pull_request=pr_or_issue)
+        except KeyError:
+            pass
 
 
 async def remove_requested_reviewers_from_pr(
@@ -224,8 +309,9 @@ async def get_pr_files(gh: GitHubAPI, *, pull_request: Mapping[str, Any]) -> lis
 
 async def get_file_content(gh: GitHubAPI, *, file: File) -> bytes:
     """Return the file content decoded into Python bytes object."""
-    data = await gh.getitem(file.contents_url, oauth_token=await gh.access_token)
-    return b64decode(data["content"])
+    with tracing.span("github.file_content", file=file.name):
+        data = await gh.getitem(file.contents_url, oauth_token=await gh.access_token)
+        return b64decode(data["content"])
 
 
 async def create_pr_review(
@@ -253,12 +339,14 @@ async def add_reaction(
     gh: GitHubAPI, *, reaction: str, comment: Mapping[str, Any]
 ) -> None:
     """Add the given ``reaction`` to the provided ``comment``."""
-    await gh.post(
-        comment["url"] + "/reactions",
-        data={"content": reaction},
-        accept="application/vnd.github.squirrel-girl-preview+json",
-        oauth_token=await gh.access_token,
-    )
+    # A user can only react once with the same reaction.
+    with retry.idempotent():
+        await gh.post(
+            comment["url"] + "/reactions",
+            data={"content": reaction},
+            accept="application/vnd.github.squirrel-girl-preview+json",
+            oauth_token=await gh.access_token,
+        )
 
 
 async def get_pr_for_issue(gh: GitHubAPI, *, issue: Mapping[str, Any]) -> Any:
@@ -271,3 +359,97 @@ async def get_pr_for_issue(gh: GitHubAPI, *, issue: Mapping[str, Any]) -> Any:
 async def update_pr(gh: GitHubAPI, *, pull_request: Mapping[str, Any]) -> Any:
     """Get the updated pull request object for the given pull request."""
     return await gh.getitem(pull_request["url"], oauth_token=await gh.access_token)
+
+
+async def get_pr_state(
+    gh: GitHubAPI, *, pull_request: Mapping[str, Any], refresh: bool = False
+) -> PullRequestState:
+    """Return the files, labels, mergeability and check runs of the given pull
+    request using GraphQL.
+
+    This takes a single query for every 100 files in the pull request. The state is
+    fetched once for an event and shared by all the callbacks, unless `refresh` is
+    true.
+    """
+    url = pull_request["url"]
+    if not refresh and url in gh.pr_states:
+        state: PullRequestState = gh.pr_states[url]
+        return state
+    repository = pull_request["base"]["repo"]
+    owner, name = repository["full_name"].split("/")
+    files: list[File] = []
+    cursor = None
+    while True:
+        data = await gh.graphql(
+            PULL_REQUEST_QUERY,
+            owner=owner,
+            name=name,
+            number=pull_request["number"],
+            cursor=cursor,
+        )
+        node = data["repository"]["pullRequest"]
+        head_sha = node["headRefOid"]
+        for file in node["files"]["nodes"]:
+            files.append(
+                File(
+                    file["path"],
+                    Path(file["path"]),
+                    f"{repository['url']}/contents/{urllib.parse.quote(file['path'])}"
+                    + f"?ref={head_sha}",
+                    CHANGE_TYPES.get(file["changeType"], file["changeType"].lower()),
+                )
+            )
+        page_info = node["files"]["pageInfo"]
+        if not page_info["hasNextPage"]:
+            break
+        cursor = page_info["endCursor"]
+    check_runs = [
+        {
+            "name": check_run["name"],
+            "status": check_run["status"].lower(),
+            "conclusion": check_run["conclusion"] and check_run["conclusion"].lower(),
+        }
+        for commit in node["commits"]["nodes"]
+        for check_suite in commit["commit"]["checkSuites"]["nodes"]
+        for check_run in check_suite["checkRuns"]["nodes"]
+    ]
+    state = PullRequestState(
+        head_sha=head_sha,
+        mergeable={"MERGEABLE": True, "CONFLICTING": False}.get(node["mergeable"]),
+        labels=[label["name"] for label in node["labels"]["nodes"]],
+        files=files,
+        check_runs=check_runs,
+    )
+    gh.pr_states[url] = state
+    return state
+
+
+async def get_files_content(
+    gh: GitHubAPI, *, pull_request: Mapping[str, Any], files: list[File], ref: str
+) -> dict[str, bytes]:
+    """Return the content of the given files at the `ref` of the pull request's
+    repository using GraphQL, by the file name.
+
+    This takes a single query for every ``graphql.BLOB_BATCH_SIZE`` files. The
+    content of the binary files and the ones too large for GraphQL is requested with
+    the REST API.
+    """
+    owner, name = pull_request["base"]["repo"]["full_name"].split("/")
+    contents: dict[str, bytes] = {}
+    for start in range(0, len(files), BLOB_BATCH_SIZE):
+        end = start + BLOB_BATCH_SIZE
+        batch = files[start:end]
+        with tracing.span("github.file_contents", files=len(batch)):
+            data = await gh.graphql(
+                blobs_query(len(batch)),
+                owner=owner,
+                name=name,
+                **{f"e{n}": f"{ref}:{file.name}" for n, file in enumerate(batch)},
+            )
+        for n, file in enumerate(batch):
+            blob = data["repository"][f"f{n}"]
+            if blob is None or blob["text"] is None or blob["isTruncated"]:
+                contents[file.name] = await get_file_content(gh, file=file)
+            else:
+                contents[file.name] = blob["text"].encode()
+    return contents
@@ -0,0 +1,44 @@
+import pytest
+from gidgethub.sansio import Event
+
+from algorithms_keeper.admission import Admission, shed_events_total
+
+check_run = Event(
+    data={"action": "completed"}, event="check_run", delivery_id="check_run"
+)
+pull_request = Event(
+    data={"action": "opened"}, event="pull_request", delivery_id="pull_request"
+)
+
+
+def test_invalid_capacity() -> None:
+    with pytest.raises(ValueError, match="positive capacity"):
+        Admission(0)
+
+
+@pytest.mark.parametrize(
+    "event, pending, expected",
+    (
+        (check_run, 0, True),
+        (check_run, 7, True),
+        (check_run, 8, False),
+        (pull_request, 8, True),
+        (pull_request, 9, True),
+        (pull_request, 10, False),
+        (check_run, 10, False),
+    ),
+)
+def test_admit(event: Event, pending: int, expected: bool) -> None:
+    admission = Admission(10, shed_threshold=0.8)
+    labels = {"event": event.event, "action": event.data["action"]}
+    before = shed_events_total.value(**labels)
+    assert admission.admit(event, pending) is expected
+    assert shed_events_total.value(**labels) == before + (not expected)
+
+
+def test_admit_priorities() -> None:
+    admission = Admission(
+        10, shed_threshold=0.8, priorities={"check_run": 1, "pull_request:opened": 2}
+    )
+    assert admission.admit(check_run, 8)
+    assert not admission.admit(pull_request, 8)
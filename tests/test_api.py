@@ -1,18 +1,40 @@
+import logging
 from typing import Any, AsyncGenerator, Dict
 
 import aiohttp
 import pytest
 import pytest_asyncio
-from gidgethub import apps, sansio
+from aiohttp import web
+from gidgethub import sansio
 from pytest import MonkeyPatch
 
-from algorithms_keeper.api import GitHubAPI, token_cache
+from algorithms_keeper import api, jsoncodec, retry
+from algorithms_keeper.api import (
+    GitHubAPI,
+    create_client_session,
+    endpoint_template,
+    token_manager,
+)
+from algorithms_keeper.logs import LogSampler
+from algorithms_keeper.retry import RetryPolicy
+from algorithms_keeper.tokens import Token, TokenManager
 
 from .utils import number, token
 
 
 async def mock_return(*args: Any, **kwargs: Any) -> Dict[str, str]:
-    return {"token": token}
+    return {"token": token, "expires_at": "2100-01-01T00:00:00Z"}
+
+
+class MockCredentials:
+    def jwt(self) -> str:
+        return "jwt"
+
+
+@pytest.fixture
+def mock_mint(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(api, "app_credentials", MockCredentials)
+    monkeypatch.setattr(GitHubAPI, "post", mock_return)
 
 
 @pytest_asyncio.fixture
@@ -36,19 +58,142 @@ async def test_initialization() -> None:
 
 
 @pytest.mark.asyncio
-async def test_access_token(github_api: GitHubAPI, monkeypatch: MonkeyPatch) -> None:
-    monkeypatch.setattr(apps, "get_installation_access_token", mock_return)
-    monkeypatch.setenv("GITHUB_APP_ID", "")
-    monkeypatch.setenv("GITHUB_PRIVATE_KEY", "")
-    token_cache.clear()  # Make sure the token_cache is cleared
+async def test_access_token(
+    github_api: GitHubAPI, mock_mint: None, monkeypatch: MonkeyPatch
+) -> None:
+    token_manager.cache.clear()  # Make sure the token cache is cleared
     access_token = await github_api.access_token
     assert access_token == token
     # This is to make sure it actually returns the cached token
-    monkeypatch.delattr(apps, "get_installation_access_token")
+    monkeypatch.delattr(GitHubAPI, "post")
     cached_token = await github_api.access_token
     assert cached_token == token
 
 
+@pytest.mark.asyncio
+async def test_shared_token_manager(mock_mint: None) -> None:
+    shared_token_manager = TokenManager()
+    async with aiohttp.ClientSession() as session:
+        gh = GitHubAPI(
+            number, session, "algorithms-keeper", token_manager=shared_token_manager
+        )
+        assert await gh.access_token == token
+    assert shared_token_manager.cache == {number: Token(token, 4102444800)}
+
+
+@pytest.mark.asyncio
+async def test_client_session(aiohttp_server) -> None:  # type: ignore
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(text="OK")
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    server = await aiohttp_server(app)
+    created = api.connections_created_total.value()
+    reused = api.connections_reused_total.value()
+    async with create_client_session() as session:
+        for _ in range(3):
+            async with session.get(server.make_url("/")) as response:
+                assert response.status == 200
+    # The connection is kept alive and reused for the subsequent requests.
+    assert api.connections_created_total.value() == created + 1
+    assert api.connections_reused_total.value() == reused + 2
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    (
+        (
+            "https://api.github.com/repos/user/testing/pulls/1/files?page=2",
+            "/repos/{owner}/{repo}/pulls/{number}/files",
+        ),
+        (
+            "https://api.github.com/repos/user/testing/contents/a/b.py?ref=1234",
+            "/repos/{owner}/{repo}/contents/{path}",
+        ),
+        (
+            "https://api.github.com/repos/user/testing/issues/1/labels/tests%20failing",
+            "/repos/{owner}/{repo}/issues/{number}/labels/{name}",
+        ),
+        (
+            "https://api.github.com/repos/user/testing/commits/a06212/check-runs",
+            "/repos/{owner}/{repo}/commits/{ref}/check-runs",
+        ),
+        (
+            "https://api.github.com/search/issues?q=type:pr+repo:user/testing",
+            "/search/issues",
+        ),
+        (
+            "https://api.github.com/app/installations/1/access_tokens",
+            "/app/installations/{number}/access_tokens",
+        ),
+    ),
+)
+def test_endpoint_template(url: str, expected: str) -> None:
+    assert endpoint_template(url) == expected
+
+
+@pytest.mark.asyncio
+async def test_request_metrics(aiohttp_server) -> None:  # type: ignore
+    async def handler(request: web.Request) -> web.Response:
+        return web.json_response(
+            {},
+            headers={
+                "x-ratelimit-limit": "5000",
+                "x-ratelimit-remaining": "4999",
+                "x-ratelimit-reset": "0",
+            },
+        )
+
+    app = web.Application()
+    app.router.add_get("/repos/{owner}/{repo}/pulls/{number}", handler)
+    server = await aiohttp_server(app)
+    labels = {"method": "GET", "endpoint": "/repos/{owner}/{repo}/pulls/{number}"}
+    before = api.github_requests_total.value(status="200", **labels)
+    async with create_client_session() as session:
+        gh = GitHubAPI(number, session, "algorithms-keeper")
+        await gh._request(
+            "GET", str(server.make_url("/repos/user/testing/pulls/1")), {}
+        )
+    assert api.github_requests_total.value(status="200", **labels) == before + 1
+    assert api.github_request_duration_seconds.count(**labels) >= 1
+    assert api.github_rate_limit_remaining.value(installation=str(number)) == 4999
+    assert api.github_rate_limit_limit.value(installation=str(number)) == 5000
+
+
+@pytest.mark.asyncio
+async def test_log(aiohttp_server, caplog):  # type: ignore
+    async def handler(request: web.Request) -> web.Response:
+        if request.match_info["number"] == "2":
+            return web.json_response({"message": "Not Found"}, status=404)
+        return web.json_response({"title": "x" * 100})
+
+    app = web.Application()
+    app.router.add_get("/repos/{owner}/{repo}/pulls/{number}", handler)
+    app.router.add_get("/repos/{owner}/{repo}/issues/{number}", handler)
+    server = await aiohttp_server(app)
+    sampler = LogSampler(rates={"/repos/{owner}/{repo}/issues/{number}": 0})
+    caplog.set_level(logging.INFO, logger="algorithms_keeper")
+    async with create_client_session() as session:
+        gh = GitHubAPI(number, session, "algorithms-keeper", log_sampler=sampler)
+        for path in ("pulls/1", "issues/1", "pulls/2", "issues/2"):
+            url = str(server.make_url(f"/repos/user/testing/{path}"))
+            await gh._request("GET", url, {})
+    records = [record for record in caplog.records if record.msg == "api %s"]
+    # The issues endpoint is sampled out except for the failed request.
+    fields = [getattr(record, "github") for record in records]
+    assert [(r.levelname, f["path"]) for r, f in zip(records, fields)] == [
+        ("INFO", "/repos/user/testing/pulls/1"),
+        ("ERROR", "/repos/user/testing/pulls/2"),
+        ("ERROR", "/repos/user/testing/issues/2"),
+    ]
+    assert fields[0]["response_bytes"] > 100
+    # The body of a successful response isn't logged.
+    assert "xxx" not in records[0].getMessage()
+    assert "error=" not in records[0].getMessage()
+    assert 'error={"message": "Not Found"}' in records[1].getMessage()
+
+
 @pytest.mark.asyncio
 async def test_headers_and_log(github_api: GitHubAPI) -> None:
     request_headers = sansio.create_headers("algorithms-keeper")
@@ -57,3 +202,129 @@ async def test_headers_and_log(github_api: GitHubAPI) -> None:
     )
     data, rate_limit, _ = sansio.decipher_response(*resp)
     assert "rate" in data
+
+
+@pytest.mark.asyncio
+async def test_retry(aiohttp_server) -> None:  # type: ignore
+    responses = [
+        web.json_response({"message": "Server Error"}, status=502),
+        web.json_response(
+            {"message": "You have exceeded a secondary rate limit."},
+            status=403,
+            headers={"retry-after": "0"},
+        ),
+    ]
+    calls = []
+
+    async def handler(request: web.Request) -> web.Response:
+        calls.append(request.method)
+        return responses.pop(0) if responses else web.json_response({})
+
+    app = web.Application()
+    app.router.add_route("*", "/repos/{owner}/{repo}/pulls/{number}", handler)
+    server = await aiohttp_server(app)
+    url = str(server.make_url("/repos/user/testing/pulls/1"))
+    policy = RetryPolicy(attempts=3, budget=3, base_delay=0)
+    labels = {"method": "GET", "endpoint": "/repos/{owner}/{repo}/pulls/{number}"}
+    before = api.github_retries_total.value(reason="502", **labels)
+    async with create_client_session() as session:
+        gh = GitHubAPI(number, session, "algorithms-keeper", retry_policy=policy)
+        status, _, _ = await gh._request("GET", url, {})
+        assert status == 200
+        assert calls == ["GET"] * 3
+        assert api.github_retries_total.value(reason="502", **labels) == before + 1
+        # The requests which aren't safe to repeat are not retried.
+        responses.append(web.json_response({}, status=502))
+        status, _, _ = await gh._request("POST", url, {})
+        assert status == 502
+        # Unless they are marked as idempotent.
+        responses.append(web.json_response({}, status=502))
+        with retry.idempotent():
+            status, _, _ = await gh._request("POST", url, {})
+        assert status == 200
+        assert calls[3:] == ["POST"] * 3
+        # The retry budget is used up.
+        responses.append(web.json_response({}, status=502))
+        status, _, _ = await gh._request("GET", url, {})
+        assert status == 502
+
+
+@pytest.mark.asyncio
+async def test_retry_delete(aiohttp_server) -> None:  # type: ignore
+    responses = [web.json_response({"message": "Bad Gateway"}, status=502)]
+
+    async def handler(request: web.Request) -> web.Response:
+        if responses:
+            return responses.pop(0)
+        return web.json_response({"message": "Label does not exist"}, status=404)
+
+    app = web.Application()
+    app.router.add_delete(
+        "/repos/{owner}/{repo}/issues/{number}/labels/{name}", handler
+    )
+    server = await aiohttp_server(app)
+    url = str(server.make_url("/repos/user/testing/issues/1/labels/bug"))
+    policy = RetryPolicy(attempts=3, budget=3, base_delay=0)
+    async with create_client_session() as session:
+        gh = GitHubAPI(number, session, "algorithms-keeper", retry_policy=policy)
+        # The first attempt removed the label, but its response was lost.
+        status, _, body = await gh._request("DELETE", url, {})
+        assert (status, body) == (204, b"")
+        # A 404 for the first attempt is left to the caller.
+        status, _, _ = await gh._request("DELETE", url, {})
+        assert status == 404
+
+
+@pytest.mark.asyncio
+async def test_graphql(aiohttp_server, mock_mint: None) -> None:  # type: ignore
+    async def handler(request: web.Request) -> web.Response:
+        assert request.headers["authorization"] == f"token {token}"
+        payload = await request.json()
+        return web.json_response({"data": payload["variables"]})
+
+    app = web.Application()
+    app.router.add_post("/graphql", handler)
+    server = await aiohttp_server(app)
+    async with create_client_session() as session:
+        gh = GitHubAPI(
+            number,
+            session,
+            "algorithms-keeper",
+            token_manager=TokenManager(),
+            base_url=str(server.make_url("")),
+        )
+        assert await gh.graphql("query { viewer }", number=1) == {"number": 1}
+
+
+@pytest.mark.asyncio
+async def test_json_codec(aiohttp_server, monkeypatch):  # type: ignore
+    deciphered = []
+
+    def decipher_response(*args: Any) -> Any:
+        deciphered.append(args[0])
+        return original(*args)
+
+    original = jsoncodec.decipher_response
+    monkeypatch.setattr(jsoncodec, "decipher_response", decipher_response)
+
+    async def handler(request: web.Request) -> web.Response:
+        assert request.headers["content-type"] == "application/json; charset=utf-8"
+        return web.json_response(await request.json(), status=201)
+
+    app = web.Application()
+    app.router.add_post("/repos/{owner}/{repo}/issues/{number}/labels", handler)
+    server = await aiohttp_server(app)
+    async with create_client_session() as session:
+        gh = GitHubAPI(
+            number, session, "algorithms-keeper", base_url=str(server.make_url(""))
+        )
+        data = await gh.post(
+            "/repos/user/testing/issues/1/labels",
+            data={"labels": ["ünïcödé"]},
+            oauth_token=token,
+        )
+    assert data == {"labels": ["ünïcödé"]}
+    # The response bodies are decoded with the JSON codec, without changing the
+    # decoder of gidgethub for everyone else.
+    assert deciphered == [201]
+    assert sansio.decipher_response is not original
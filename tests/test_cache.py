@@ -0,0 +1,97 @@
+import json
+import time
+from pathlib import Path
+
+import pytest
+from pytest import MonkeyPatch
+
+from algorithms_keeper.cache import MeteredCache, SQLiteCache, cache_lookups_total
+from algorithms_keeper.tokens import Token
+
+
+@pytest.fixture
+def path(tmp_path: Path) -> str:
+    return str(tmp_path / "cache.sqlite3")
+
+
+def test_mapping(path: str) -> None:
+    cache = SQLiteCache(path, namespace="test")
+    cache["url"] = ("etag", None, {"data": [1, 2]}, None)
+    cache[1] = "token"
+    # The tuples come back as lists from JSON.
+    assert cache["url"] == ["etag", None, {"data": [1, 2]}, None]
+    assert cache[1] == "token"
+    assert 1 in cache
+    assert len(cache) == 2
+    assert sorted(map(str, cache)) == ["1", "url"]
+    del cache[1]
+    assert 1 not in cache
+    with pytest.raises(KeyError):
+        del cache[1]
+    cache.clear()
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_custom_codec(path: str) -> None:
+    cache = SQLiteCache(path, namespace="token", dumps=Token.dumps, loads=Token.loads)
+    cache[1] = Token("token", 4102444800)
+    assert cache[1] == Token("token", 4102444800)
+    (value,) = cache._db.execute("SELECT value FROM json_cache").fetchone()
+    assert json.loads(value) == {"token": "token", "expires_at": 4102444800}
+    cache.close()
+
+
+def test_shared_between_instances(path: str) -> None:
+    first = SQLiteCache(path, namespace="token")
+    second = SQLiteCache(path, namespace="token")
+    other = SQLiteCache(path, namespace="etag")
+    first[1] = "token"
+    assert second[1] == "token"
+    assert 1 not in other
+    for cache in (first, second, other):
+        cache.close()
+
+
+def test_ttl(path: str, monkeypatch: MonkeyPatch) -> None:
+    cache = SQLiteCache(path, namespace="token", ttl=60)
+    cache[1] = "token"
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    with pytest.raises(KeyError):
+        cache[1]
+    assert len(cache) == 0
+    assert list(cache) == []
+    cache.close()
+
+
+def test_maxsize(path: str, monkeypatch: MonkeyPatch) -> None:
+    cache = SQLiteCache(path, namespace="etag", maxsize=2)
+    now = time.time()
+    for n in range(3):
+        monkeypatch.setattr(time, "time", lambda: now + n)
+        cache[n] = n
+    assert sorted(cache) == [1, 2]
+    cache.close()
+
+
+def test_maxsize_within_limit(path: str) -> None:
+    cache = SQLiteCache(path, namespace="etag", maxsize=2)
+    cache[1] = 1
+    cache[2] = 2
+    assert sorted(cache) == [1, 2]
+    cache.close()
+
+
+def test_metered_cache() -> None:
+    cache = MeteredCache({}, name="test")
+    cache["url"] = "response"
+    assert cache["url"] == "response"
+    with pytest.raises(KeyError):
+        cache["other"]
+    assert len(cache) == 1
+    assert list(cache) == ["url"]
+    del cache["url"]
+    assert "url" not in cache
+    assert cache_lookups_total.value(cache="test", result="hit") == 1
+    assert cache_lookups_total.value(cache="test", result="miss") == 2
@@ -217,10 +217,9 @@ def test_command_regex_match(text: str, group: str) -> None:
                 },
             ),
             ExpectedData(
-                post_url=[reactions_url, labels_url, labels_url, comments_url],
+                post_url=[reactions_url, labels_url, comments_url],
                 post_data=[
-                    {"labels": [Label.ENHANCEMENT]},
-                    {"labels": [Label.DESCRIPTIVE_NAME]},
+                    {"labels": [Label.ENHANCEMENT, Label.DESCRIPTIVE_NAME]},
                     {"content": "+1"},
                     {"body": comment},
                 ],
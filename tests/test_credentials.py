@@ -0,0 +1,80 @@
+import time
+from pathlib import Path
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from pytest import MonkeyPatch
+
+from algorithms_keeper import credentials
+from algorithms_keeper.credentials import AppCredentials, app_credentials
+
+private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+pem = private_key.private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.TraditionalOpenSSL,
+    serialization.NoEncryption(),
+).decode()
+
+
+def test_jwt() -> None:
+    app = AppCredentials("1", pem)
+    token = app.jwt()
+    claims = jwt.decode(token, private_key.public_key(), algorithms=["RS256"])
+    assert claims["iss"] == "1"
+    now = time.time()
+    assert claims["iat"] < now < claims["exp"] <= now + 10 * 60
+    # The JWT is reused while it's valid.
+    assert app.jwt() == token
+
+
+def test_jwt_expiring(monkeypatch: MonkeyPatch) -> None:
+    app = AppCredentials("1", pem)
+    before = credentials.jwt_sign_duration_seconds.count()
+    app.jwt()
+    monkeypatch.setattr(
+        time, "time", lambda: app._jwt_expires_at - credentials.JWT_MIN_VALIDITY
+    )
+    app.jwt()
+    assert credentials.jwt_sign_duration_seconds.count() == before + 2
+
+
+def test_not_rsa_key() -> None:
+    key = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    with pytest.raises(ValueError, match="Expected an RSA private key"):
+        AppCredentials("1", key.decode())
+
+
+def test_app_credentials(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setenv("GITHUB_APP_ID", "1")
+    monkeypatch.setenv("GITHUB_PRIVATE_KEY", pem)
+    app = app_credentials()
+    # The private key is parsed once.
+    assert app_credentials() is app
+    monkeypatch.setenv("GITHUB_APP_ID", "2")
+    assert app_credentials().app_id == "2"
+
+
+def test_app_credentials_from_file(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    path = tmp_path / "private-key.pem"
+    path.write_text(pem)
+    monkeypatch.setenv("GITHUB_APP_ID", "1")
+    monkeypatch.delenv("GITHUB_PRIVATE_KEY", raising=False)
+    monkeypatch.setenv("GITHUB_PRIVATE_KEY_PATH", str(path))
+    app = app_credentials()
+    path.unlink()
+    # The file is read once.
+    assert app_credentials() is app
+
+
+def test_missing_private_key(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setenv("GITHUB_APP_ID", "1")
+    monkeypatch.delenv("GITHUB_PRIVATE_KEY", raising=False)
+    monkeypatch.delenv("GITHUB_PRIVATE_KEY_PATH", raising=False)
+    with pytest.raises(RuntimeError, match="Provide the private key"):
+        app_credentials()
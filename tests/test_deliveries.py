@@ -0,0 +1,57 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from algorithms_keeper.deliveries import (
+    DeliveryStore,
+    MemoryDeliveryStore,
+    SQLiteDeliveryStore,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def delivery_store(request, tmp_path: Path) -> DeliveryStore:  # type: ignore
+    if request.param == "memory":
+        return MemoryDeliveryStore(ttl=0.1)
+    return SQLiteDeliveryStore(str(tmp_path / "deliveries.db"), ttl=0.1)
+
+
+def test_add(delivery_store: DeliveryStore) -> None:
+    assert delivery_store.add("1") is True
+    assert delivery_store.add("1") is False
+    assert delivery_store.add("2") is True
+    delivery_store.close()
+
+
+def test_discard(delivery_store: DeliveryStore) -> None:
+    assert delivery_store.add("1") is True
+    delivery_store.discard("1")
+    delivery_store.discard("2")
+    assert delivery_store.add("1") is True
+    delivery_store.close()
+
+
+def test_expiry(delivery_store: DeliveryStore) -> None:
+    assert delivery_store.add("1") is True
+    time.sleep(0.15)
+    assert delivery_store.add("1") is True
+    delivery_store.close()
+
+
+def test_sqlite_survives_restart(tmp_path: Path) -> None:
+    path = str(tmp_path / "deliveries.db")
+    delivery_store = SQLiteDeliveryStore(path)
+    assert delivery_store.add("1") is True
+    delivery_store.close()
+    delivery_store = SQLiteDeliveryStore(path)
+    assert delivery_store.add("1") is False
+    delivery_store.close()
+
+
+def test_base_store() -> None:
+    delivery_store = DeliveryStore()
+    with pytest.raises(NotImplementedError):
+        delivery_store.add("1")
+    with pytest.raises(NotImplementedError):
+        delivery_store.discard("1")
@@ -0,0 +1,157 @@
+from typing import Any, AsyncGenerator
+
+import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestServer
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from gidgethub import BadRequest, GitHubBroken, RateLimitExceeded
+from pytest import MonkeyPatch
+
+from algorithms_keeper import __main__ as main
+from algorithms_keeper import loadgen
+from algorithms_keeper.api import GitHubAPI, create_client_session, token_manager
+from algorithms_keeper.fake_github import FakeGitHub
+from algorithms_keeper.ratelimit import RateLimiter
+from algorithms_keeper.retry import RetryPolicy
+
+from .utils import number, repository, token
+
+
+@pytest_asyncio.fixture
+async def server(aiohttp_server) -> AsyncGenerator[Any, None]:  # type: ignore
+    fake_github = FakeGitHub(per_page=2, files_per_pr=5)
+    server = await aiohttp_server(fake_github.app)
+    server.fake_github = fake_github
+    yield server
+
+
+def github_api(server: TestServer, **kwargs: Any) -> GitHubAPI:
+    kwargs.setdefault("rate_limiter", RateLimiter())
+    kwargs.setdefault("retry_policy", RetryPolicy(attempts=1))
+    return GitHubAPI(
+        number,
+        create_client_session(),
+        "algorithms-keeper",
+        base_url=str(server.make_url("")),
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_pagination(server: TestServer) -> None:
+    gh = github_api(server)
+    files = [
+        data["filename"]
+        async for data in gh.getiter(
+            f"/repos/{repository}/pulls/{number}/files", oauth_token=token
+        )
+    ]
+    await gh._session.close()
+    assert len(files) == 5
+    assert (
+        server.fake_github.requests[  # type: ignore
+            "GET /repos/{owner}/{repo}/pulls/{number}/files"
+        ]
+        == 3
+    )
+
+
+@pytest.mark.asyncio
+async def test_conditional_request(server: TestServer) -> None:
+    cache: dict[str, Any] = {}
+    gh = github_api(server, cache=cache)
+    url = f"/repos/{repository}/pulls/{number}"
+    first = await gh.getitem(url, oauth_token=token)
+    second = await gh.getitem(url, oauth_token=token)
+    await gh.getitem(f"/repos/{repository}/pulls/2", oauth_token=token)
+    await gh._session.close()
+    assert first == second
+    assert len(cache) == 2
+    # The not modified response didn't count against the rate limit.
+    assert gh.rate_limit.remaining == 4998  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_server_error(server: TestServer) -> None:
+    server.fake_github.error_rate = 1  # type: ignore
+    gh = github_api(server)
+    with pytest.raises(GitHubBroken):
+        await gh.getitem(f"/repos/{repository}/pulls/{number}", oauth_token=token)
+    await gh._session.close()
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_exceeded(server: TestServer) -> None:
+    server.fake_github.rate_limit = 1  # type: ignore
+    gh = github_api(server)
+    url = f"/repos/{repository}/pulls/{number}"
+    await gh.getitem(url, oauth_token=token)
+    # The client doesn't even make the request once the rate limit is used up.
+    with pytest.raises(RateLimitExceeded, match="resets in"):
+        await gh.getitem(url, oauth_token=token)
+    await gh._session.close()
+    # Without knowing the rate limit, the client makes the request and the server
+    # refuses it.
+    gh = github_api(server)
+    with pytest.raises(BadRequest, match="rate limit exceeded"):
+        await gh.getitem(url, oauth_token=token)
+    await gh._session.close()
+    assert (
+        server.fake_github.requests[  # type: ignore
+            "GET /repos/{owner}/{repo}/pulls/{number}"
+        ]
+        == 2
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_graphql", ("", "1"))
+async def test_load_generator(  # type: ignore
+    server, aiohttp_server, monkeypatch: MonkeyPatch, use_graphql: str
+) -> None:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    )
+    monkeypatch.setenv("GITHUB_API_URL", str(server.make_url("")))
+    monkeypatch.setenv("GITHUB_APP_ID", "1")
+    monkeypatch.setenv("GITHUB_PRIVATE_KEY", pem.decode())
+    monkeypatch.setenv("GITHUB_SECRET", "secret")
+    monkeypatch.setenv("USE_GRAPHQL", use_graphql)
+    token_manager.cache.clear()
+    bot = await aiohttp_server(main.create_app())
+    report = await loadgen.run(
+        target=str(bot.make_url("/")),
+        github_url=str(server.make_url("")),
+        rate=20,
+        duration=0.25,
+        secret="secret",
+    )
+    token_manager.cache.clear()
+    assert report.statuses == {"200": 5}
+    assert len(report.latencies) == 5
+    # The bot minted an installation access token from the fake server.
+    assert "POST /app/installations/{number}/access_tokens" in report.github_requests
+    assert ("POST /graphql" in report.github_requests) is bool(use_graphql)
+    lines = list(report.lines())
+    assert lines[0].startswith("deliveries=5")
+
+
+@pytest.mark.parametrize("event, action", list(loadgen.EVENT_WEIGHTS))
+def test_make_delivery(event: str, action: str) -> None:
+    delivery_id, data = loadgen.make_delivery(
+        event, action, github_url="http://localhost/", pr_number=number
+    )
+    assert delivery_id
+    assert data["action"] == action
+    assert data["repository"]["full_name"] == loadgen.REPOSITORY
+
+
+def test_sign() -> None:
+    # https://docs.github.com/en/webhooks/using-webhooks/validating-webhook-deliveries
+    assert loadgen.sign(b"Hello, World!", "It's a Secret to Everybody") == (
+        "sha256=757107ea0eb2509fc211221cce984b8a37570b6d7586c22c46f4379c8b043e17"
+    )
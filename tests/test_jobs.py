@@ -0,0 +1,438 @@
+import asyncio
+from functools import partial
+from pathlib import Path
+
+import pytest
+from gidgethub.sansio import Event
+from pytest import MonkeyPatch
+
+from algorithms_keeper import jobstore
+from algorithms_keeper.jobs import (
+    DEFAULT_PRIORITY,
+    EventQueue,
+    KeyedExecutor,
+    coalesced_events_total,
+    job_failures_total,
+    parse_priorities,
+    pull_request_key,
+    run_in_order,
+)
+from algorithms_keeper.jobstore import DEAD, JobStore
+
+from .utils import number, repository
+
+
+def make_event(
+    delivery_id: str, action: str = "opened", pr_number: int = number
+) -> Event:
+    return Event(
+        data={
+            "action": action,
+            "installation": {"id": number},
+            "pull_request": {"number": pr_number},
+            "repository": {"full_name": repository},
+        },
+        event="pull_request",
+        delivery_id=delivery_id,
+    )
+
+
+@pytest.mark.parametrize(
+    "event, expected",
+    (
+        (make_event("1"), (repository, number)),
+        (
+            Event(
+                data={
+                    "action": "created",
+                    "issue": {"number": 2, "pull_request": {}},
+                    "repository": {"full_name": repository},
+                },
+                event="issue_comment",
+                delivery_id="issue_comment_on_pull_request",
+            ),
+            (repository, 2),
+        ),
+        (
+            Event(
+                data={
+                    "action": "created",
+                    "issue": {"number": 2},
+                    "repository": {"full_name": repository},
+                },
+                event="issue_comment",
+                delivery_id="issue_comment_on_issue",
+            ),
+            None,
+        ),
+        (
+            Event(
+                data={
+                    "action": "completed",
+                    "check_run": {"pull_requests": [{"number": 3}]},
+                    "repository": {"full_name": repository},
+                },
+                event="check_run",
+                delivery_id="check_run_with_pull_request",
+            ),
+            (repository, 3),
+        ),
+        (
+            Event(
+                data={
+                    "action": "completed",
+                    "check_run": {"pull_requests": []},
+                    "repository": {"full_name": repository},
+                },
+                event="check_run",
+                delivery_id="check_run_without_pull_request",
+            ),
+            None,
+        ),
+        (Event(data={"action": "created"}, event="project", delivery_id="2"), None),
+        (
+            Event(
+                data={"action": "created", "repository": {"full_name": repository}},
+                event="project",
+                delivery_id="3",
+            ),
+            None,
+        ),
+    ),
+)
+def test_pull_request_key(event: Event, expected: object) -> None:
+    assert pull_request_key(event) == expected
+
+
+def test_invalid_workers() -> None:
+    with pytest.raises(ValueError, match="at least one worker"):
+        EventQueue(lambda event: asyncio.sleep(0), workers=0)
+
+
+@pytest.mark.asyncio
+async def test_process_events() -> None:
+    processed = []
+
+    async def handler(event: Event) -> None:
+        processed.append(event.delivery_id)
+
+    event_queue = EventQueue(handler, workers=2)
+    for n in range(5):
+        event_queue.put(make_event(str(n)))
+    assert event_queue.qsize() == 5
+    await event_queue.start()
+    await asyncio.wait_for(event_queue.join(), 1)
+    await event_queue.stop()
+    assert event_queue.qsize() == 0
+    assert sorted(processed) == ["0", "1", "2", "3", "4"]
+
+
+@pytest.mark.asyncio
+async def test_priority_order() -> None:
+    processed = []
+
+    async def handler(event: Event) -> None:
+        processed.append(event.delivery_id)
+
+    event_queue = EventQueue(
+        handler, workers=1, priorities={"pull_request:opened": 0, "pull_request": 2}
+    )
+    # Every event is for a different pull request, so only the priority matters.
+    event_queue.put(make_event("closed-1", action="closed", pr_number=1))
+    event_queue.put(make_event("opened-2", pr_number=2))
+    event_queue.put(make_event("closed-3", action="closed", pr_number=3))
+    event_queue.put(make_event("opened-4", pr_number=4))
+    await event_queue.start()
+    await asyncio.wait_for(event_queue.join(), 1)
+    await event_queue.stop()
+    assert processed == ["opened-2", "opened-4", "closed-1", "closed-3"]
+
+
+def test_default_priority() -> None:
+    event_queue = EventQueue(
+        lambda event: asyncio.sleep(0), workers=1, priorities={"pull_request": 0}
+    )
+    assert event_queue.priority(make_event("1")) == 0
+    check_run = Event(data={"action": "completed"}, event="check_run", delivery_id="2")
+    assert event_queue.priority(check_run) == DEFAULT_PRIORITY
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    (
+        ("", {}),
+        ("check_run=2", {"check_run": 2}),
+        (
+            " issue_comment:created = 0, check_run=2,",
+            {"issue_comment:created": 0, "check_run": 2},
+        ),
+    ),
+)
+def test_parse_priorities(value: str, expected: dict[str, int]) -> None:
+    assert parse_priorities(value) == expected
+
+
+def test_parse_invalid_priorities() -> None:
+    with pytest.raises(ValueError, match="name=priority"):
+        parse_priorities("check_run")
+
+
+@pytest.mark.asyncio
+async def test_handler_failure() -> None:
+    processed = []
+
+    async def handler(event: Event) -> None:
+        if event.delivery_id == "fail":
+            raise RuntimeError("failed")
+        processed.append(event.delivery_id)
+
+    before = job_failures_total.value(event="pull_request", action="closed")
+    event_queue = EventQueue(handler, workers=1)
+    await event_queue.start()
+    event_queue.put(make_event("fail", action="closed"))
+    event_queue.put(make_event("ok", action="closed"))
+    await asyncio.wait_for(event_queue.join(), 1)
+    await event_queue.stop()
+    # The worker survives the failure and goes on to the next job.
+    assert processed == ["ok"]
+    after = job_failures_total.value(event="pull_request", action="closed")
+    assert after == before + 1
+
+
+@pytest.mark.asyncio
+async def test_coalesce_synchronize_events() -> None:
+    processed = []
+
+    async def handler(event: Event) -> None:
+        processed.append(event.delivery_id)
+
+    before = coalesced_events_total.value(event="pull_request", action="synchronize")
+    event_queue = EventQueue(handler, workers=2, coalesce_window=0.05)
+    await event_queue.start()
+    for n in range(3):
+        event_queue.put(make_event(f"sync-{n}", action="synchronize"))
+    # Different pull request and an event which is never coalesced.
+    event_queue.put(make_event("other", action="synchronize", pr_number=2))
+    event_queue.put(make_event("opened"))
+    assert event_queue.held() == 2
+    await asyncio.sleep(0.1)
+    await asyncio.wait_for(event_queue.join(), 1)
+    await event_queue.stop()
+    assert sorted(processed) == ["opened", "other", "sync-2"]
+    after = coalesced_events_total.value(event="pull_request", action="synchronize")
+    assert after == before + 2
+
+
+@pytest.mark.asyncio
+async def test_coalesce_max_hold() -> None:
+    processed = []
+
+    async def handler(event: Event) -> None:
+        processed.append(event.delivery_id)
+
+    event_queue = EventQueue(
+        handler, workers=1, coalesce_window=0.05, coalesce_max_hold=0.12
+    )
+    await event_queue.start()
+    # The pushes keep coming faster than the window.
+    for n in range(8):
+        event_queue.put(make_event(f"sync-{n}", action="synchronize"))
+        await asyncio.sleep(0.03)
+    # The newest event at the maximum hold time was processed without waiting for
+    # the pushes to stop.
+    assert processed[0] in {"sync-2", "sync-3", "sync-4"}
+    await event_queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_drops_held_events() -> None:
+    processed = []
+
+    async def handler(event: Event) -> None:
+        processed.append(event.delivery_id)
+
+    event_queue = EventQueue(handler, workers=1, coalesce_window=10)
+    await event_queue.start()
+    event_queue.put(make_event("sync", action="synchronize"))
+    assert event_queue.held() == 1
+    await event_queue.stop()
+    assert event_queue.held() == 0
+    assert processed == []
+
+
+@pytest.mark.asyncio
+async def test_flush_held_events() -> None:
+    processed = []
+
+    async def handler(event: Event) -> None:
+        processed.append(event.delivery_id)
+
+    event_queue = EventQueue(handler, workers=1, coalesce_window=10)
+    await event_queue.start()
+    event_queue.put(make_event("sync", action="synchronize"))
+    event_queue.flush()
+    assert event_queue.held() == 0
+    await asyncio.wait_for(event_queue.join(), 1)
+    await event_queue.stop()
+    assert processed == ["sync"]
+
+
+@pytest.mark.asyncio
+async def test_unfinished_events() -> None:
+    started = asyncio.Event()
+
+    async def handler(event: Event) -> None:
+        started.set()
+        await asyncio.sleep(10)
+
+    event_queue = EventQueue(handler, workers=1)
+    await event_queue.start()
+    event_queue.put(make_event("running"))
+    # Waiting for the same pull request as the running one.
+    event_queue.put(make_event("waiting"))
+    await started.wait()
+    await asyncio.sleep(0)
+    # Still on the queue as the only worker is busy.
+    event_queue.put(make_event("queued", pr_number=2))
+    assert event_queue.pending() == 3
+    await event_queue.stop()
+    unfinished = event_queue.unfinished()
+    assert [event.delivery_id for event in unfinished] == [
+        "running",
+        "waiting",
+        "queued",
+    ]
+    assert event_queue.qsize() == 0
+    assert event_queue.unfinished() == []
+    assert event_queue.pending() == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_from_job_store(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    attempts = []
+
+    async def handler(event: Event) -> None:
+        attempts.append(event.delivery_id)
+        raise RuntimeError("GitHub is down")
+
+    monkeypatch.setattr(jobstore, "RETRY_DELAY", 0.01)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=3)
+    event_queue = EventQueue(handler, workers=1, store=store)
+    await event_queue.start()
+    event_queue.put(make_event("failing"))
+    for _ in range(10):
+        await asyncio.sleep(0.02)
+        if store.jobs(DEAD):
+            break
+    await event_queue.stop()
+    assert attempts == ["failing"] * 3
+    (job,) = store.jobs(DEAD)
+    assert job.last_error == "RuntimeError('GitHub is down')"
+
+
+@pytest.mark.asyncio
+async def test_recover_from_job_store(tmp_path: Path) -> None:
+    processed = []
+    started = asyncio.Event()
+
+    async def slow_handler(event: Event) -> None:
+        started.set()
+        await asyncio.sleep(10)
+
+    async def handler(event: Event) -> None:
+        processed.append(event.delivery_id)
+
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    event_queue = EventQueue(slow_handler, workers=1, store=store)
+    await event_queue.start()
+    event_queue.put(make_event("interrupted"))
+    event_queue.put(make_event("queued", pr_number=2))
+    await started.wait()
+    await event_queue.stop()
+    store.close()
+    # The restarted process picks up where the previous one left off.
+    store = JobStore(path)
+    event_queue = EventQueue(handler, workers=1, store=store)
+    await event_queue.start()
+    await asyncio.wait_for(event_queue.join(), 1)
+    await event_queue.stop()
+    assert processed == ["interrupted", "queued"]
+    assert store.recover() == []
+
+
+def test_keyed_executor() -> None:
+    executor: KeyedExecutor[str] = KeyedExecutor()
+    assert executor.acquire("a", "a1") is True
+    assert executor.acquire("a", "a2") is False
+    assert executor.acquire("a", "a3") is False
+    assert executor.acquire("b", "b1") is True
+    assert executor.release("a") == "a2"
+    assert executor.release("a") == "a3"
+    assert executor.release("a") is None
+    assert executor.release("b") is None
+    # The lane was released, so it can be acquired again.
+    assert executor.acquire("a", "a4") is True
+    assert executor.acquire("a", "a5") is False
+    assert executor.drain() == ["a5"]
+    assert executor.acquire("a", "a6") is True
+
+
+@pytest.mark.asyncio
+async def test_run_in_order() -> None:
+    executor: KeyedExecutor[asyncio.Future[None]] = KeyedExecutor()
+    running: set[str] = set()
+    order = []
+
+    async def work(key: str, n: int) -> None:
+        # Only one work is running for a key at a time.
+        assert key not in running
+        running.add(key)
+        await asyncio.sleep(0.01)
+        order.append(f"{key}{n}")
+        running.remove(key)
+
+    tasks = [
+        asyncio.create_task(run_in_order(executor, key, partial(work, key, n)))
+        for n in range(3)
+        for key in ("a", "b")
+    ]
+    # Let all the tasks get in line and cancel one which is waiting for its turn.
+    await asyncio.sleep(0)
+    tasks[2].cancel()
+    tasks.append(
+        asyncio.create_task(run_in_order(executor, None, partial(work, "c", 0)))
+    )
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert [item for item in order if item.startswith("a")] == ["a0", "a2"]
+    assert [item for item in order if item.startswith("b")] == ["b0", "b1", "b2"]
+    assert "c0" in order
+
+
+@pytest.mark.asyncio
+async def test_serialize_events_per_pull_request() -> None:
+    running: set[int] = set()
+    processed = []
+
+    async def handler(event: Event) -> None:
+        pr_number = event.data["pull_request"]["number"]
+        assert pr_number not in running
+        running.add(pr_number)
+        await asyncio.sleep(0.01)
+        processed.append(event.delivery_id)
+        running.remove(pr_number)
+
+    event_queue = EventQueue(handler, workers=3)
+    await event_queue.start()
+    for n in range(3):
+        event_queue.put(make_event(f"1-{n}", pr_number=1))
+    event_queue.put(make_event("2-0", pr_number=2))
+    await asyncio.wait_for(event_queue.join(), 1)
+    await event_queue.stop()
+    assert [item for item in processed if item.startswith("1-")] == [
+        "1-0",
+        "1-1",
+        "1-2",
+    ]
+    # The other pull request didn't have to wait for the first one.
+    assert processed.index("2-0") < processed.index("1-2")
@@ -0,0 +1,113 @@
+from pathlib import Path
+
+import pytest
+from gidgethub.sansio import Event
+from pytest import MonkeyPatch
+
+from algorithms_keeper import jobstore
+from algorithms_keeper.jobstore import DEAD, PENDING, RUNNING, JobStore
+
+from .utils import number
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> JobStore:
+    return JobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+
+
+def make_event(delivery_id: str) -> Event:
+    return Event(
+        data={"action": "opened", "installation": {"id": number}},
+        event="pull_request",
+        delivery_id=delivery_id,
+    )
+
+
+def test_claim_and_complete(store: JobStore) -> None:
+    job_id = store.add(make_event("1"))
+    job = store.get(job_id)
+    assert job is not None
+    assert job.state == PENDING
+    assert job.event.delivery_id == "1"
+    assert job.event.data["action"] == "opened"
+    assert store.claim(job_id) is True
+    # Already claimed.
+    assert store.claim(job_id) is False
+    assert [job.id for job in store.jobs(RUNNING)] == [job_id]
+    store.complete(job_id)
+    assert store.get(job_id) is None
+
+
+def test_fail_and_retry(store: JobStore) -> None:
+    job_id = store.add(make_event("1"))
+    store.claim(job_id)
+    assert store.fail(job_id, "RuntimeError()") == jobstore.RETRY_DELAY
+    assert store.claim(job_id) is True
+    assert store.fail(job_id, "RuntimeError()") is None
+    job = store.get(job_id)
+    assert job is not None
+    assert job.summary() == {
+        "id": job_id,
+        "delivery_id": "1",
+        "event": "pull_request",
+        "action": "opened",
+        "state": DEAD,
+        "attempts": 2,
+        "last_error": "RuntimeError()",
+        "updated_at": job.updated_at,
+    }
+    assert store.fail(1234, "RuntimeError()") is None
+
+
+def test_requeue(store: JobStore) -> None:
+    job_id = store.add(make_event("1"))
+    # Only the dead jobs can be requeued.
+    assert store.requeue(job_id) is None
+    for _ in range(2):
+        store.claim(job_id)
+        store.fail(job_id, "RuntimeError()")
+    job = store.requeue(job_id)
+    assert job is not None
+    assert job.state == PENDING
+    assert job.attempts == 0
+
+
+def test_release(store: JobStore) -> None:
+    job_id = store.add(make_event("1"))
+    store.claim(job_id)
+    store.release(job_id)
+    job = store.get(job_id)
+    assert job is not None
+    assert job.state == PENDING
+    assert job.attempts == 0
+
+
+def test_recover(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    crashed_store = JobStore(path)
+    crashed_store._pid = -1
+    other_store = JobStore(path)
+    other_store._pid = -2
+    monkeypatch.setattr(jobstore, "_pid_alive", lambda pid: pid == -2)
+    pending = store.add(make_event("pending"))
+    crashed = store.add(make_event("crashed"))
+    running = store.add(make_event("running"))
+    crashed_store.claim(crashed)
+    other_store.claim(running)
+    assert [job.id for job in store.recover()] == [pending, crashed]
+    assert [job.id for job in store.jobs(RUNNING)] == [running]
+
+
+def test_recover_same_pid(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    # The process restarted with the same PID, e.g., PID 1 in a container, so the
+    # PID is alive but the job was interrupted.
+    path = str(tmp_path / "jobs.sqlite3")
+    crashed_store = JobStore(path)
+    crashed = crashed_store.add(make_event("crashed"))
+    crashed_store.claim(crashed)
+    crashed_store.close()
+    monkeypatch.setattr(jobstore, "_pid_alive", lambda pid: True)
+    store = JobStore(path)
+    assert [job.id for job in store.recover()] == [crashed]
+    assert store.jobs(RUNNING) == []
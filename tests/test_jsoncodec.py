@@ -0,0 +1,99 @@
+import hashlib
+import hmac
+import json
+import urllib.parse
+from typing import Iterator
+
+import pytest
+from gidgethub import BadRequest, ValidationFailure
+from gidgethub.sansio import Event
+
+from algorithms_keeper import jsoncodec
+
+payload = {"action": "opened", "number": 1, "title": "Add ünïcödé"}
+headers = {
+    "content-type": "application/json",
+    "x-github-event": "pull_request",
+    "x-github-delivery": "1",
+}
+
+
+@pytest.fixture(params=sorted(jsoncodec.CODECS))
+def codec(request: pytest.FixtureRequest) -> Iterator[jsoncodec.Codec]:
+    previous = jsoncodec.current()
+    yield jsoncodec.use(request.param)
+    jsoncodec.use(previous.name)
+
+
+def test_use_unknown() -> None:
+    with pytest.raises(ValueError, match="Unknown or unavailable JSON codec 'simd'"):
+        jsoncodec.use("simd")
+
+
+def test_round_trip(codec: jsoncodec.Codec) -> None:
+    body = jsoncodec.dumps(payload)
+    assert isinstance(body, bytes)
+    assert json.loads(body) == payload
+    assert jsoncodec.loads(body) == jsoncodec.loads(body.decode()) == payload
+
+
+def test_event_from_http(codec: jsoncodec.Codec) -> None:
+    body = json.dumps(payload).encode()
+    event = jsoncodec.event_from_http(headers, body)
+    expected = Event.from_http(headers, body)
+    assert (event.data, event.event, event.delivery_id) == (
+        expected.data,
+        expected.event,
+        expected.delivery_id,
+    )
+
+
+def test_event_from_http_form(codec: jsoncodec.Codec) -> None:
+    body = urllib.parse.urlencode({"payload": json.dumps(payload)}).encode()
+    form_headers = {**headers, "content-type": "application/x-www-form-urlencoded"}
+    assert jsoncodec.event_from_http(form_headers, body).data == payload
+
+
+def test_event_from_http_signature(codec: jsoncodec.Codec) -> None:
+    body = json.dumps(payload).encode()
+    digest = hmac.new(b"secret", msg=body, digestmod=hashlib.sha256).hexdigest()
+    signed_headers = {**headers, "x-hub-signature-256": f"sha256={digest}"}
+    event = jsoncodec.event_from_http(signed_headers, body, secret="secret")
+    assert event.data == payload
+    with pytest.raises(ValidationFailure):
+        jsoncodec.event_from_http(signed_headers, body, secret="wrong")
+    with pytest.raises(ValidationFailure, match="secret not provided"):
+        jsoncodec.event_from_http(signed_headers, body)
+    with pytest.raises(ValidationFailure, match="signature is missing"):
+        jsoncodec.event_from_http(headers, body, secret="secret")
+
+
+@pytest.mark.parametrize("content_type", (None, "text/plain"))
+def test_event_from_http_content_type(content_type: str) -> None:
+    bad_headers = {k: v for k, v in headers.items() if k != "content-type"}
+    if content_type is not None:
+        bad_headers["content-type"] = content_type
+    with pytest.raises(BadRequest) as exc_info:
+        jsoncodec.event_from_http(bad_headers, b"{}")
+    assert exc_info.value.status_code == 415
+
+
+def test_decipher_response(codec: jsoncodec.Codec) -> None:
+    response_headers = {
+        "content-type": "application/json; charset=utf-8",
+        "link": '<https://api.github.com/repositories?page=2>; rel="next"',
+        "x-ratelimit-limit": "5000",
+        "x-ratelimit-remaining": "4999",
+        "x-ratelimit-reset": "0",
+    }
+    data, rate_limit, more = jsoncodec.decipher_response(
+        200, response_headers, json.dumps(payload).encode()
+    )
+    assert data == payload
+    assert rate_limit is not None and rate_limit.remaining == 4999
+    assert more == "https://api.github.com/repositories?page=2"
+    assert jsoncodec.decipher_response(204, {}, b"") == (None, None, None)
+    with pytest.raises(BadRequest, match="Not Found"):
+        jsoncodec.decipher_response(
+            404, response_headers, json.dumps({"message": "Not Found"}).encode()
+        )
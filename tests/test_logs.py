@@ -0,0 +1,58 @@
+import logging
+import threading
+
+import pytest
+
+from algorithms_keeper.logs import LogSampler, parse_sample_rates, queued_handler
+
+
+class ThreadRecordingHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[tuple[str, str]] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append((record.getMessage(), threading.current_thread().name))
+
+
+def test_queued_handler() -> None:
+    logger = logging.getLogger("algorithms_keeper.test_logs")
+    logger.propagate = False
+    handler = ThreadRecordingHandler()
+    logger.addHandler(handler)
+    try:
+        with queued_handler(logger, handler):
+            assert handler not in logger.handlers
+            logger.warning("queued %s", "message")
+        # The queue is flushed on exit and the handler is put back.
+        assert logger.handlers == [handler]
+        assert len(handler.records) == 1
+        message, thread_name = handler.records[0]
+        assert message == "queued message"
+        assert thread_name != threading.current_thread().name
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+
+
+def test_queued_handler_not_attached() -> None:
+    logger = logging.getLogger("algorithms_keeper.test_logs")
+    handler = ThreadRecordingHandler()
+    with queued_handler(logger, handler):
+        assert logger.handlers == []
+
+
+def test_parse_sample_rates() -> None:
+    assert parse_sample_rates("") == {}
+    assert parse_sample_rates(
+        " /repos/{owner}/{repo}/contents/{path}=0.1, /search/issues=0"
+    ) == {"/repos/{owner}/{repo}/contents/{path}": 0.1, "/search/issues": 0}
+    with pytest.raises(ValueError, match="Expected 'endpoint=rate'"):
+        parse_sample_rates("/search/issues")
+
+
+def test_log_sampler() -> None:
+    sampler = LogSampler(rate=0, rates={"/search/issues": 1})
+    assert sampler.sample("/search/issues")
+    assert not sampler.sample("/repos/{owner}/{repo}/pulls/{number}")
+    assert LogSampler().sample("/search/issues")
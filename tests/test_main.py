@@ -1,18 +1,24 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, cast
+
 import pytest
-from aiohttp import web
+from gidgethub.sansio import Event
 
 from algorithms_keeper import __main__ as main
+from algorithms_keeper.api import GitHubAPI
+from algorithms_keeper.cache import MeteredCache, SQLiteCache
+from algorithms_keeper.replay import load_deliveries
+from algorithms_keeper.tokens import Token
 
-from .utils import number
+from .utils import MockGitHubAPI, number
 
 
 @pytest.fixture
 def client(loop, aiohttp_client):  # type: ignore
-    app = web.Application()
-    app.router.add_get("/", main.index)
-    app.router.add_get("/health", main.health)
-    app.router.add_post("/", main.main)
-    return loop.run_until_complete(aiohttp_client(app))
+    return loop.run_until_complete(aiohttp_client(main.create_app()))
 
 
 @pytest.mark.asyncio
@@ -42,6 +48,50 @@ async def test_success(client):  # type: ignore
     assert response.status == 200
 
 
+@pytest.mark.asyncio
+async def test_duplicate_delivery(client):  # type: ignore
+    headers = {"X-GitHub-Event": "project", "X-GitHub-Delivery": "5678"}
+    data = {"action": "created", "installation": {"id": number}}
+    response = await client.post("/", headers=headers, json=data)
+    assert response.status == 200
+    response = await client.post("/", headers=headers, json=data)
+    assert response.status == 200
+    assert await response.text() == "duplicate"
+
+
+@pytest.mark.asyncio
+async def test_failed_delivery_is_forgotten(client):  # type: ignore
+    headers = {"X-GitHub-Event": "project", "X-GitHub-Delivery": "5678"}
+    # Missing installation ID.
+    data = {"action": "created"}
+    response = await client.post("/", headers=headers, json=data)
+    assert response.status == 500
+    response = await client.post("/", headers=headers, json=data)
+    assert response.status == 500
+    assert await response.text() != "duplicate"
+
+
+@pytest.mark.asyncio
+async def test_shared_caches(aiohttp_client, tmp_path, monkeypatch):  # type: ignore
+    monkeypatch.setenv("CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    client = await aiohttp_client(main.create_app())
+    app = client.server.app
+    assert isinstance(app["cache"], MeteredCache)
+    assert isinstance(app["cache"].cache, SQLiteCache)
+    assert isinstance(app["token_manager"].cache, SQLiteCache)
+    app["token_manager"].cache[number] = Token("token", time.time() + 3600)
+    # Another worker process sees the same token.
+    shared = SQLiteCache(
+        str(tmp_path / "cache.sqlite3"), namespace="token", loads=Token.loads
+    )
+    assert shared[number].token == "token"
+    app["cache"]["url"] = ("etag", None, {}, None)
+    await client.close()
+    # The cached responses survive a restart.
+    client = await aiohttp_client(main.create_app())
+    assert client.server.app["cache"]["url"] == ["etag", None, {}, None]
+
+
 @pytest.mark.asyncio
 async def test_index(client):  # type: ignore
     response = await client.get("/")
@@ -55,3 +105,240 @@ async def test_health(client):  # type: ignore
     response = await client.get("/health")
     assert response.status == 200
     assert await response.text() == "OK"
+
+
+@pytest.mark.asyncio
+async def test_background_mode(aiohttp_client, monkeypatch):  # type: ignore
+    processed = asyncio.Event()
+
+    async def mock_process_event(event: Event, *args: Any, **kwargs: Any) -> None:
+        assert event.delivery_id == "1234"
+        processed.set()
+
+    monkeypatch.setenv("QUEUE_WORKERS", "1")
+    monkeypatch.setattr(main, "process_event", mock_process_event)
+    client = await aiohttp_client(main.create_app())
+    headers = {"X-GitHub-Event": "project", "X-GitHub-Delivery": "1234"}
+    data = {"action": "created", "installation": {"id": number}}
+    response = await client.post("/", headers=headers, json=data)
+    assert response.status == 202
+    await asyncio.wait_for(processed.wait(), 1)
+
+
+@pytest.mark.asyncio
+async def test_reject_deliveries_when_draining(client):  # type: ignore
+    client.server.app["draining"].set()
+    headers = {"X-GitHub-Event": "project", "X-GitHub-Delivery": "1234"}
+    data = {"action": "created", "installation": {"id": number}}
+    response = await client.post("/", headers=headers, json=data)
+    assert response.status == 503
+
+
+@pytest.mark.asyncio
+async def test_drain_in_flight_events(  # type: ignore
+    aiohttp_client, tmp_path, monkeypatch
+):
+    started = asyncio.Event()
+
+    async def mock_process_event(event: Event, *args: Any, **kwargs: Any) -> None:
+        if event.delivery_id == "slow":
+            started.set()
+            await asyncio.sleep(10)
+
+    path = tmp_path / "unfinished.jsonl"
+    monkeypatch.setenv("SHUTDOWN_TIMEOUT", "0.05")
+    monkeypatch.setenv("UNFINISHED_EVENTS_PATH", str(path))
+    monkeypatch.setattr(main, "process_event", mock_process_event)
+    client = await aiohttp_client(main.create_app())
+    app = client.server.app
+    headers = {"X-GitHub-Event": "project", "X-GitHub-Delivery": "slow"}
+    data = {"action": "created", "installation": {"id": number}}
+    request = asyncio.create_task(client.post("/", headers=headers, json=data))
+    await started.wait()
+    await main.drain(app)
+    assert app["draining"].is_set()
+    # The unfinished event can be replayed and redelivered.
+    events = load_deliveries(tmp_path)
+    assert [event.delivery_id for event in events] == ["slow"]
+    assert app["delivery_store"].add("slow") is True
+    request.cancel()
+    await asyncio.gather(request, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_drain_event_queue(aiohttp_client, monkeypatch, caplog):  # type: ignore
+    async def mock_process_event(event: Event, *args: Any, **kwargs: Any) -> None:
+        await asyncio.sleep(0 if event.delivery_id == "fast" else 10)
+
+    monkeypatch.setenv("QUEUE_WORKERS", "1")
+    monkeypatch.setenv("SHUTDOWN_TIMEOUT", "0.05")
+    monkeypatch.delenv("UNFINISHED_EVENTS_PATH", raising=False)
+    monkeypatch.setattr(main, "process_event", mock_process_event)
+    client = await aiohttp_client(main.create_app())
+    for delivery_id in ("fast", "slow"):
+        headers = {"X-GitHub-Event": "project", "X-GitHub-Delivery": delivery_id}
+        data = {"action": "created", "installation": {"id": number}}
+        response = await client.post("/", headers=headers, json=data)
+        assert response.status == 202
+    await main.drain(client.server.app)
+    unfinished = [
+        record.message
+        for record in caplog.records
+        if record.message.startswith("Unfinished delivery")
+    ]
+    assert len(unfinished) == 1
+    assert '"X-GitHub-Delivery": "slow"' in unfinished[0]
+
+
+@pytest.mark.asyncio
+async def test_admin_disabled(client, monkeypatch):  # type: ignore
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    # The job store is not enabled.
+    response = await client.get("/admin/jobs")
+    assert response.status == 404
+
+
+@pytest.mark.asyncio
+async def test_admin_jobs(aiohttp_client, tmp_path, monkeypatch):  # type: ignore
+    async def mock_process_event(event: Event, *args: Any, **kwargs: Any) -> None:
+        raise RuntimeError("GitHub is down")
+
+    monkeypatch.setenv("JOB_STORE_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setenv("JOB_MAX_ATTEMPTS", "1")
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(main, "process_event", mock_process_event)
+    client = await aiohttp_client(main.create_app())
+    headers = {"X-GitHub-Event": "project", "X-GitHub-Delivery": "1234"}
+    data = {"action": "created", "installation": {"id": number}}
+    response = await client.post("/", headers=headers, json=data)
+    assert response.status == 202
+    await asyncio.wait_for(client.server.app["event_queue"].join(), 1)
+
+    response = await client.get("/admin/jobs")
+    assert response.status == 401
+    auth = {"Authorization": "Bearer secret"}
+    response = await client.get("/admin/jobs", headers=auth)
+    assert response.status == 200
+    (job,) = await response.json()
+    assert job["delivery_id"] == "1234"
+    assert job["state"] == "dead"
+    assert job["last_error"] == "RuntimeError('GitHub is down')"
+    # The failed delivery is still remembered as it's in the job store.
+    assert client.server.app["delivery_store"].add("1234") is False
+
+    response = await client.post(f"/admin/jobs/{job['id']}/requeue", headers=auth)
+    assert response.status == 202
+    assert (await response.json())["state"] == "pending"
+    await asyncio.wait_for(client.server.app["event_queue"].join(), 1)
+    response = await client.get("/admin/jobs", headers=auth)
+    assert [job["attempts"] for job in await response.json()] == [1]
+    response = await client.post("/admin/jobs/1234/requeue", headers=auth)
+    assert response.status == 404
+
+
+@pytest.mark.asyncio
+async def test_load_shedding(aiohttp_client, monkeypatch):  # type: ignore
+    release = asyncio.Event()
+
+    async def mock_process_event(event: Event, *args: Any, **kwargs: Any) -> None:
+        await release.wait()
+
+    monkeypatch.setenv("QUEUE_WORKERS", "1")
+    monkeypatch.setenv("MAX_PENDING_EVENTS", "2")
+    monkeypatch.setenv("SHED_THRESHOLD", "0.5")
+    monkeypatch.setattr(main, "process_event", mock_process_event)
+    client = await aiohttp_client(main.create_app())
+
+    async def post(event: str, action: str, delivery_id: str) -> int:
+        headers = {"X-GitHub-Event": event, "X-GitHub-Delivery": delivery_id}
+        data = {"action": action, "installation": {"id": number}}
+        response = await client.post("/", headers=headers, json=data)
+        return int(response.status)
+
+    assert await post("check_run", "completed", "1") == 202
+    # The low priority events are shed first.
+    assert await post("check_run", "completed", "2") == 503
+    assert await post("project", "created", "3") == 202
+    # At capacity.
+    assert await post("project", "created", "4") == 503
+    release.set()
+    await asyncio.wait_for(client.server.app["event_queue"].join(), 1)
+    # The turned away delivery can be redelivered.
+    assert await post("check_run", "completed", "2") == 202
+
+
+@pytest.mark.asyncio
+async def test_metrics(client):  # type: ignore
+    response = await client.get("/metrics")
+    assert response.status == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE algorithms_keeper_events_total counter" in (await response.text())
+
+
+@pytest.mark.asyncio
+async def test_dispatch_callback() -> None:
+    async def successful_callback(*args: Any) -> None:
+        pass
+
+    async def failing_callback(*args: Any) -> None:
+        raise RuntimeError("failed")
+
+    event = Event(data={"action": "created"}, event="project", delivery_id="1234")
+    gh = cast(GitHubAPI, MockGitHubAPI())
+    await main.dispatch_callback(successful_callback, event, gh)
+    with pytest.raises(RuntimeError):
+        await main.dispatch_callback(failing_callback, event, gh)
+    assert (
+        main.callback_calls_total.value(
+            callback="successful_callback", status="success"
+        )
+        == 1
+    )
+    assert main.callback_calls_total.value(callback="failing_callback", status="error")
+    assert main.callback_duration_seconds.count(callback="failing_callback") == 1
+
+
+def test_warm_up_lint_engine(monkeypatch, caplog):  # type: ignore
+    caplog.set_level(logging.INFO)
+    main.warm_up_lint_engine()
+    assert "Warmed up the lint engine" in caplog.text
+
+    def failing_warm_up() -> None:
+        raise RuntimeError("failed")
+
+    monkeypatch.setattr("algorithms_keeper.parser.warm_up", failing_warm_up)
+    # The failure is only logged as the lint engine is imported again on first use.
+    main.warm_up_lint_engine()
+    assert "Failed to warm up the lint engine" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_trace_path(aiohttp_client, tmp_path, monkeypatch):  # type: ignore
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setenv("TRACE_PATH", str(path))
+    client = await aiohttp_client(main.create_app())
+    headers = {"X-GitHub-Event": "project", "X-GitHub-Delivery": "trace"}
+    data = {"action": "created", "installation": {"id": number}}
+    response = await client.post("/", headers=headers, json=data)
+    assert response.status == 200
+    await client.close()
+    (root,) = [json.loads(line) for line in path.read_text().splitlines()]
+    assert root["name"] == "event.dispatch"
+    assert root["attributes"] == {
+        "delivery_id": "trace",
+        "event": "project",
+        "action": "created",
+    }
+
+
+@pytest.mark.asyncio
+async def test_profile_dir(aiohttp_client, tmp_path, monkeypatch):  # type: ignore
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_EVENTS", "project:created")
+    client = await aiohttp_client(main.create_app())
+    for event, delivery_id in (("project", "profiled"), ("project_card", "skipped")):
+        headers = {"X-GitHub-Event": event, "X-GitHub-Delivery": delivery_id}
+        data = {"action": "created", "installation": {"id": number}}
+        response = await client.post("/", headers=headers, json=data)
+        assert response.status == 200
+    assert [path.name for path in tmp_path.iterdir()] == ["profiled.pstats"]
@@ -0,0 +1,82 @@
+import pytest
+
+from algorithms_keeper.metrics import (
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    generate_latest,
+)
+
+
+def test_registry() -> None:
+    counter = Counter("test_registry_total", "Test counter.")
+    assert counter in REGISTRY
+
+
+def test_counter() -> None:
+    counter = Counter("test_counter_total", "Test counter.", ("event",))
+    counter.inc(event="push")
+    counter.inc(2, event="push")
+    assert counter.value(event="push") == 3
+    assert counter.value(event="ping") == 0
+    with pytest.raises(ValueError, match="non-negative"):
+        counter.inc(-1, event="push")
+
+
+def test_labels_mismatch() -> None:
+    counter = Counter("test_labels_total", "Test counter.", ("event",))
+    with pytest.raises(ValueError, match="Expected labels"):
+        counter.inc(action="opened")
+
+
+def test_gauge() -> None:
+    gauge = Gauge("test_gauge", "Test gauge.")
+    gauge.set(5)
+    gauge.inc()
+    gauge.dec(3)
+    assert gauge.value() == 3
+
+
+def test_histogram() -> None:
+    histogram = Histogram("test_histogram", "Test histogram.", buckets=(1, 0.1))
+    assert histogram.buckets == (0.1, 1)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    with histogram.time():
+        pass
+    assert histogram.count() == 4
+    assert histogram.sum() >= 5.55
+
+
+def test_generate_latest() -> None:
+    counter = Counter("test_latest_total", "Test counter.", ("event",))
+    counter.inc(event='say "hi"\n')
+    gauge = Gauge("test_latest", "Test\\gauge.")
+    gauge.set(1.5)
+    histogram = Histogram("test_latest_seconds", "Test histogram.", buckets=(1,))
+    histogram.observe(0.5)
+    histogram.observe(2)
+    output = generate_latest([counter, gauge, histogram])
+    assert output == (
+        "# HELP test_latest_total Test counter.\n"
+        "# TYPE test_latest_total counter\n"
+        'test_latest_total{event="say \\"hi\\"\\n"} 1.0\n'
+        "# HELP test_latest Test\\\\gauge.\n"
+        "# TYPE test_latest gauge\n"
+        "test_latest 1.5\n"
+        "# HELP test_latest_seconds Test histogram.\n"
+        "# TYPE test_latest_seconds histogram\n"
+        'test_latest_seconds_bucket{le="1.0"} 1.0\n'
+        'test_latest_seconds_bucket{le="+Inf"} 2.0\n'
+        "test_latest_seconds_sum 2.5\n"
+        "test_latest_seconds_count 2.0\n"
+    )
+
+
+def test_base_metric_render() -> None:
+    metric = Metric("test_untyped", "Test metric.")
+    with pytest.raises(NotImplementedError):
+        list(metric.render())
@@ -5,7 +5,7 @@ import pytest
 from pytest import MonkeyPatch
 
 from algorithms_keeper.constants import Label
-from algorithms_keeper.parser import PythonParser, rules
+from algorithms_keeper.parser import PythonParser, rules, warm_up
 from algorithms_keeper.parser.record import PullRequestReviewRecord
 from algorithms_keeper.utils import File
 
@@ -204,3 +204,8 @@ def test_combinations(
     assert len(parser._pr_record._comments) == expected
     assert len(parser.labels_to_add) == add_count
     assert len(parser.labels_to_remove) == remove_count
+
+
+def test_warm_up() -> None:
+    # Doesn't raise with all the rules enabled.
+    warm_up()
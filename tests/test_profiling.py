@@ -0,0 +1,88 @@
+import asyncio
+import pstats
+from pathlib import Path
+
+import pytest
+from gidgethub.sansio import Event
+
+from algorithms_keeper.profiling import Profiler, parse_names, profiled_events_total
+
+
+def make_event(delivery_id: str, event: str = "pull_request") -> Event:
+    return Event(data={"action": "opened"}, event=event, delivery_id=delivery_id)
+
+
+def busy() -> int:
+    return sum(range(1000))
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    (
+        ("", set()),
+        ("check_run", {"check_run"}),
+        (" pull_request:opened, check_run,", {"pull_request:opened", "check_run"}),
+    ),
+)
+def test_parse_names(value: str, expected: set[str]) -> None:
+    assert parse_names(value) == expected
+
+
+@pytest.mark.parametrize(
+    "events, sample_rate, expected",
+    (
+        ((), 0, False),
+        ((), 1, True),
+        (("pull_request",), 0, True),
+        (("pull_request:opened",), 0, True),
+        (("pull_request:closed", "check_run"), 0, False),
+    ),
+)
+def test_selected(events: tuple[str, ...], sample_rate: float, expected: bool) -> None:
+    profiler = Profiler(Path(), events=events, sample_rate=sample_rate)
+    assert profiler.selected(make_event("1")) is expected
+
+
+def test_path() -> None:
+    profiler = Profiler(Path("profiles"))
+    assert profiler.path(make_event("../1/2")) == Path("profiles/.._1_2.pstats")
+
+
+def test_profile(tmp_path: Path) -> None:
+    profiler = Profiler(tmp_path / "profiles", events={"pull_request"})
+    before = profiled_events_total.value(event="pull_request", action="opened")
+    with profiler.profile(make_event("1")):
+        busy()
+    with profiler.profile(make_event("2", event="check_run")):
+        busy()
+    assert [path.name for path in (tmp_path / "profiles").iterdir()] == ["1.pstats"]
+    stats = pstats.Stats(str(tmp_path / "profiles" / "1.pstats"))
+    assert any(name == "busy" for _, _, name in stats.stats)  # type: ignore
+    after = profiled_events_total.value(event="pull_request", action="opened")
+    assert after == before + 1
+
+
+@pytest.mark.asyncio
+async def test_profile_one_at_a_time(tmp_path: Path) -> None:
+    profiler = Profiler(tmp_path, sample_rate=1)
+
+    async def dispatch(delivery_id: str) -> None:
+        with profiler.profile(make_event(delivery_id)):
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(dispatch("1"), dispatch("2"))
+    assert [path.name for path in tmp_path.iterdir()] == ["1.pstats"]
+    # The next one is profiled once the first one is done.
+    await dispatch("3")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["1.pstats", "3.pstats"]
+
+
+def test_profile_write_failure(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    not_a_directory = tmp_path / "file"
+    not_a_directory.write_text("")
+    profiler = Profiler(not_a_directory, sample_rate=1)
+    with profiler.profile(make_event("1")):
+        busy()
+    assert "Failed to write the profile" in caplog.text
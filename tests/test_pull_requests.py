@@ -549,12 +549,10 @@ async def test_max_pr_by_user(
             ),
             ExpectedData(
                 getiter_url=[files_url],
-                post_url=[labels_url, review_url],
-                post_data=[
-                    {"labels": [Label.REQUIRE_TEST]},
-                    {"commit_id": sha, "event": "COMMENT"},
-                ],
-                delete_url=[f"{labels_url}/{quote(Label.TYPE_HINT)}"],
+                post_url=[review_url],
+                post_data=[{"commit_id": sha, "event": "COMMENT"}],
+                put_url=[labels_url],
+                put_data=[{"labels": [Label.REVIEW, Label.REQUIRE_TEST]}],
             ),
         ),
         # Pull request reopened and the files were checked, this test is mainly to check
@@ -772,9 +770,8 @@ async def test_max_pr_by_user(
             ),
             MockGitHubAPI(),
             ExpectedData(
-                post_url=[labels_url],
-                post_data=[{"labels": [Label.CHANGE]}],
-                delete_url=[f"{labels_url}/{quote(Label.REVIEW)}"],
+                put_url=[labels_url],
+                put_data=[{"labels": [Label.CHANGE]}],
             ),
         ),
         # Pull request approved with review label on it, so remove the label.
@@ -861,9 +858,8 @@ async def test_max_pr_by_user(
             MockGitHubAPI(getiter={files_url: []}),
             ExpectedData(
                 getiter_url=[files_url],
-                post_url=[labels_url],
-                post_data=[{"labels": [Label.REVIEW]}],
-                delete_url=[f"{labels_url}/{quote(Label.CHANGE)}"],
+                put_url=[labels_url],
+                put_data=[{"labels": [Label.REVIEW]}],
             ),
         ),
         # Remove all the awaiting labels after the pull request is merged, if any.
@@ -1050,3 +1046,95 @@ async def test_pull_request(
 ) -> None:
     await pull_request_router.dispatch(event, gh)
     assert gh == expected
+
+
+@pytest.mark.asyncio
+async def test_pull_request_graphql() -> None:
+    event = Event(
+        data={
+            "action": "ready_for_review",
+            "pull_request": {
+                "url": pr_url,
+                "number": 1,
+                "base": {
+                    "repo": {
+                        "full_name": repository,
+                        "url": f"https://api.github.com/repos/{repository}",
+                    }
+                },
+                "head": {"sha": sha},
+                "labels": [],
+                "user": {"login": user, "type": "User"},
+                "author_association": "NONE",
+                "comments_url": comments_url,
+                "issue_url": issue_url,
+                "html_url": html_pr_url,
+                "draft": False,
+                "mergeable": True,
+            },
+            "repository": {"full_name": repository},
+            "sender": {"type": "User"},
+        },
+        event="pull_request",
+        delivery_id="pull_request_graphql",
+    )
+    gh = MockGitHubAPI(
+        graphql=[
+            {
+                "repository": {
+                    "pullRequest": {
+                        "headRefOid": sha,
+                        "mergeable": "MERGEABLE",
+                        "labels": {"nodes": []},
+                        "files": {
+                            "pageInfo": {"hasNextPage": False, "endCursor": None},
+                            "nodes": [{"path": "doctest.py", "changeType": "ADDED"}],
+                        },
+                        "commits": {
+                            "nodes": [
+                                {
+                                    "commit": {
+                                        "checkSuites": {
+                                            "nodes": [
+                                                {
+                                                    "checkRuns": {
+                                                        "nodes": [
+                                                            {
+                                                                "name": "test",
+                                                                "status": "COMPLETED",
+                                                                "conclusion": "FAILURE",
+                                                            }
+                                                        ]
+                                                    }
+                                                }
+                                            ]
+                                        }
+                                    }
+                                }
+                            ]
+                        },
+                    }
+                }
+            },
+            {
+                "repository": {
+                    "f0": {
+                        "text": get_source("doctest.py").decode(),
+                        "isTruncated": False,
+                    }
+                }
+            },
+        ]
+    )
+    await pull_request_router.dispatch(event, gh)
+    # The files, their content and the check runs took two queries.
+    assert len(gh.graphql_variables) == 2
+    assert gh == ExpectedData(
+        post_url=[labels_url, labels_url, review_url, labels_url],
+        post_data=[
+            {"labels": [Label.REVIEW]},
+            {"labels": [Label.REQUIRE_TEST]},
+            {"commit_id": sha, "event": "COMMENT"},
+            {"labels": [Label.FAILED_TEST]},
+        ],
+    )
@@ -0,0 +1,89 @@
+import time
+from typing import Optional
+
+import pytest
+from gidgethub import RateLimitExceeded
+
+from algorithms_keeper import ratelimit
+from algorithms_keeper.ratelimit import Bucket, RateLimiter, resource_for
+
+
+@pytest.mark.parametrize(
+    "url, resource",
+    (
+        ("/repos/TheAlgorithms/Python/pulls/1", "core"),
+        ("https://api.github.com/repos/TheAlgorithms/Python/issues", "core"),
+        ("/search/issues?q=repo:TheAlgorithms/Python", "search"),
+        ("https://api.github.com/search/issues", "search"),
+        ("/graphql", "graphql"),
+        ("/app/installations/1/access_tokens", None),
+        ("/app", None),
+        ("/apps/algorithms-keeper", "core"),
+    ),
+)
+def test_resource_for(url: str, resource: Optional[str]) -> None:
+    assert resource_for(url) == resource
+
+
+def test_bucket_refill() -> None:
+    bucket = Bucket(limit=10, remaining=0, reset=100, window=60)
+    bucket.refill(99)
+    assert bucket.remaining == 0
+    # Two windows passed without any request.
+    bucket.refill(200)
+    assert bucket.remaining == 10
+    assert bucket.reset == 220
+
+
+@pytest.mark.asyncio
+async def test_reserve() -> None:
+    limiter = RateLimiter(reserve=0.2, max_wait=0)
+    limiter._buckets[1, "core"] = Bucket(10, 3, time.time() + 3600, 3600)
+    await limiter.acquire(1, "core")
+    # Only the reserve is left for the other requests.
+    with pytest.raises(RateLimitExceeded, match="installation 1 resets in"):
+        await limiter.acquire(1, "core")
+    with ratelimit.urgent():
+        await limiter.acquire(1, "core")
+        await limiter.acquire(1, "core")
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire(1, "core")
+    assert limiter.bucket(1, "core").remaining == 0
+    # Other installations and resources have their own buckets.
+    await limiter.acquire(2, "core")
+    await limiter.acquire(1, "search")
+
+
+@pytest.mark.asyncio
+async def test_deferred() -> None:
+    limiter = RateLimiter(reserve=0, max_wait=1)
+    limiter._buckets[1, "search"] = Bucket(30, 0, time.time() + 0.05, 60)
+    deferred = ratelimit.deferred_requests_total.value(resource="search")
+    await limiter.acquire(1, "search")
+    bucket = limiter.bucket(1, "search")
+    assert bucket.remaining == 29
+    assert bucket.reset > time.time() + 59
+    assert ratelimit.deferred_requests_total.value(resource="search") == deferred + 1
+
+
+def test_update() -> None:
+    limiter = RateLimiter()
+    reset = int(time.time()) + 1800
+    headers = {
+        "x-ratelimit-limit": "15000",
+        "x-ratelimit-remaining": "14000",
+        "x-ratelimit-reset": str(reset),
+    }
+    limiter.update(1, "core", headers)
+    bucket = limiter.bucket(1, "core")
+    assert (bucket.limit, bucket.remaining, bucket.reset) == (15000, 14000, reset)
+    # The requests in flight are already drawn from the bucket.
+    bucket.remaining = 13990
+    limiter.update(1, "core", {**headers, "x-ratelimit-remaining": "13995"})
+    assert bucket.remaining == 13990
+    # The resource from the headers wins over the one guessed from the URL.
+    limiter.update(1, "core", {**headers, "x-ratelimit-resource": "search"})
+    assert limiter.bucket(1, "search").limit == 15000
+    # Responses without the rate limit headers are ignored.
+    limiter.update(2, "core", {})
+    assert limiter.bucket(2, "core").remaining == 5000
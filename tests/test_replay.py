@@ -0,0 +1,153 @@
+import json
+import math
+from pathlib import Path
+
+import pytest
+from gidgethub.sansio import Event
+
+from algorithms_keeper import replay
+from algorithms_keeper.constants import Label
+
+from .utils import (
+    comments_url,
+    files_url,
+    html_pr_url,
+    issue_url,
+    labels_url,
+    number,
+    pr_url,
+    repository,
+    sha,
+)
+
+PR_CLOSED = {
+    "action": "closed",
+    "installation": {"id": number},
+    "pull_request": {
+        "url": pr_url,
+        "html_url": html_pr_url,
+        "issue_url": issue_url,
+        "merged": True,
+        "labels": [{"name": Label.REVIEW}],
+    },
+    "repository": {"full_name": repository},
+}
+
+CHECK_RUN_COMPLETED = {
+    "action": "completed",
+    "installation": {"id": number},
+    "check_run": {"head_sha": sha},
+    "repository": {"full_name": repository},
+}
+
+
+def delivery(event: str, delivery_id: str, body: object) -> dict[str, object]:
+    return {
+        "headers": {"X-GitHub-Event": event, "X-GitHub-Delivery": delivery_id},
+        "body": body,
+    }
+
+
+@pytest.fixture
+def directory(tmp_path: Path) -> Path:
+    tmp_path.joinpath("1.json").write_text(
+        json.dumps(delivery("pull_request", "1", PR_CLOSED))
+    )
+    tmp_path.joinpath("2.jsonl").write_text(
+        json.dumps(delivery("check_run", "2", json.dumps(CHECK_RUN_COMPLETED)))
+        + "\n\n"
+        + json.dumps(delivery("check_run", "3", CHECK_RUN_COMPLETED))
+    )
+    tmp_path.joinpath(replay.RESPONSES_FILENAME).write_text("{}")
+    tmp_path.joinpath("README.md").write_text("Ignored")
+    return tmp_path
+
+
+def test_load_deliveries(directory: Path) -> None:
+    events = replay.load_deliveries(directory)
+    assert [(event.event, event.delivery_id) for event in events] == [
+        ("pull_request", "1"),
+        ("check_run", "2"),
+        ("check_run", "3"),
+    ]
+    assert events[1].data == CHECK_RUN_COMPLETED
+
+
+@pytest.mark.parametrize(
+    "method, url, key",
+    (
+        ("POST", labels_url, "url"),
+        ("GET", f"https://api.github.com/search/issues?q=sha:{sha}", "total_count"),
+        (
+            "GET",
+            f"https://api.github.com/repos/{repository}/commits/{sha}/check-runs",
+            "check_runs",
+        ),  # noqa: E501
+        ("GET", f"https://api.github.com/repos/{repository}/contents/a.py", "content"),
+        ("GET", pr_url, "mergeable"),
+    ),
+)
+def test_default_response(method: str, url: str, key: str) -> None:
+    assert key in replay.default_response(method, url)
+
+
+def test_default_response_others() -> None:
+    assert replay.default_response("GET", files_url) == []
+    assert replay.default_response("GET", comments_url) == {}
+
+
+@pytest.mark.asyncio
+async def test_replay(directory: Path) -> None:
+    events = replay.load_deliveries(directory)
+    events.append(
+        Event(data={"action": "opened"}, event="pull_request", delivery_id="4")
+    )
+    report = await replay.replay(events, latency=0.01, jitter=0.005, concurrency=2)
+    assert report.total == 4
+    assert report.events_per_second > 0
+    closed = report.stats["pull_request:closed"]
+    # Remove the awaiting label from the merged pull request.
+    assert closed.api_calls == 1
+    assert min(closed.durations) >= 0.005
+    # Search for the pull request which is not found.
+    assert report.stats["check_run:completed"].api_calls == 2
+    # Payload without the pull request object.
+    assert report.stats["pull_request:opened"].failures == 1
+    lines = list(report.lines())
+    assert lines[0].startswith("events=4")
+    assert any(line.startswith("check_run:completed") for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_replay_with_responses(directory: Path) -> None:
+    events = replay.load_deliveries(directory)[1:]
+    responses = {
+        "GET /search/issues": {
+            "total_count": 1,
+            "items": [{"number": number, "labels": []}],
+        },
+        "GET /repos/{owner}/{repo}/commits/{ref}/check-runs": {
+            "total_count": 1,
+            "check_runs": [{"status": "completed", "conclusion": "success"}],
+        },
+    }
+    report = await replay.replay(events, responses=responses)
+    # Search for the pull request and then get the check runs.
+    assert report.stats["check_run:completed"].api_calls == 4
+
+
+def test_percentile() -> None:
+    assert math.isnan(replay.percentile([], 50))
+    assert replay.percentile([3, 1, 2], 50) == 2
+    assert replay.percentile([3, 1, 2], 99) == 3
+    assert replay.percentile([3, 1, 2], 0) == 1
+
+
+def test_main(directory: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    assert replay.main([str(directory), "--latency", "0", "--repeat", "2"]) == 0
+    output = capsys.readouterr().out
+    assert "events=6" in output
+
+
+def test_main_empty(tmp_path: Path) -> None:
+    assert replay.main([str(tmp_path)]) == 1
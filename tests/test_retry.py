@@ -0,0 +1,53 @@
+import time
+from typing import Optional
+
+import pytest
+
+from algorithms_keeper import retry
+from algorithms_keeper.retry import RetryPolicy
+
+
+def test_is_idempotent() -> None:
+    assert retry.is_idempotent("GET")
+    assert retry.is_idempotent("delete")
+    assert not retry.is_idempotent("POST")
+    assert not retry.is_idempotent("PATCH")
+    with retry.idempotent():
+        assert retry.is_idempotent("POST")
+    assert not retry.is_idempotent("POST")
+
+
+def test_backoff() -> None:
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    for attempt in range(1, 10):
+        assert 0 <= policy.backoff(attempt) <= min(5, 2**attempt)
+
+
+@pytest.mark.parametrize(
+    "status, headers, expected",
+    (
+        (502, {}, 0),
+        (503, {"retry-after": "5"}, 5),
+        (403, {"retry-after": "30"}, 30),
+        (429, {"retry-after": "120"}, None),
+        (403, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "0"}, 0),
+        (403, {"x-ratelimit-remaining": "10"}, None),
+        (403, {}, None),
+        (404, {}, None),
+        (422, {"retry-after": "1"}, None),
+    ),
+)
+def test_delay(status: int, headers: dict[str, str], expected: Optional[float]) -> None:
+    policy = RetryPolicy(base_delay=0, max_delay=60)
+    assert policy.delay(1, status, headers) == expected
+
+
+def test_delay_until_reset() -> None:
+    policy = RetryPolicy(base_delay=0, max_delay=60)
+    reset = int(time.time()) + 30
+    headers = {"x-ratelimit-remaining": "0", "x-ratelimit-reset": str(reset)}
+    delay = policy.delay(1, 403, headers)
+    assert delay is not None and 28 <= delay <= 30
+    # The rate limit resets too far in the future.
+    headers["x-ratelimit-reset"] = str(reset + 3600)
+    assert policy.delay(1, 403, headers) is None
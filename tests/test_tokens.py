@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+
+from algorithms_keeper import tokens
+from algorithms_keeper.tokens import Token, TokenManager
+
+
+class FakeMinter:
+    def __init__(self, *, lifetime: float = 3600) -> None:
+        self.lifetime = lifetime
+        self.calls: list[int] = []
+        self.failing = False
+
+    async def __call__(self, installation_id: int) -> Token:
+        self.calls.append(installation_id)
+        await asyncio.sleep(0.01)
+        if self.failing:
+            raise RuntimeError("GitHub is down")
+        return Token(f"token-{len(self.calls)}", time.time() + self.lifetime)
+
+
+def test_token_from_response() -> None:
+    token = Token.from_response({"token": "abc", "expires_at": "2016-07-11T22:14:10Z"})
+    assert token == Token("abc", 1468275250)
+
+
+@pytest.mark.asyncio
+async def test_single_flight() -> None:
+    manager = TokenManager()
+    mint = FakeMinter()
+    results = await asyncio.gather(*(manager.get(1, mint) for _ in range(10)))
+    # The concurrent waiters share the same token.
+    assert results == ["token-1"] * 10
+    assert mint.calls == [1]
+    assert await manager.get(1, mint) == "token-1"
+    assert await manager.get(2, mint) == "token-2"
+    assert mint.calls == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter() -> None:
+    manager = TokenManager()
+    mint = FakeMinter()
+    waiter = asyncio.create_task(manager.get(1, mint))
+    await asyncio.sleep(0)
+    other = asyncio.create_task(manager.get(1, mint))
+    waiter.cancel()
+    # The other waiter still gets the token minted for both.
+    assert await other == "token-1"
+    assert mint.calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_mint_failure() -> None:
+    manager = TokenManager()
+    mint = FakeMinter()
+    mint.failing = True
+    with pytest.raises(RuntimeError, match="GitHub is down"):
+        await manager.get(1, mint)
+    assert 1 not in manager.cache
+    mint.failing = False
+    assert await manager.get(1, mint) == "token-2"
+
+
+@pytest.mark.asyncio
+async def test_expiring_token() -> None:
+    manager = TokenManager()
+    manager.cache[1] = Token("old", time.time() + tokens.MIN_VALIDITY / 2)
+    mint = FakeMinter()
+    # The token would expire in the middle of the event.
+    assert await manager.get(1, mint) == "token-1"
+    assert manager.cache[1].token == "token-1"
+
+
+@pytest.mark.asyncio
+async def test_refresh(monkeypatch: pytest.MonkeyPatch) -> None:
+    manager = TokenManager()
+    mint = FakeMinter(lifetime=tokens.REFRESH_MARGIN + 60)
+    assert await manager.get(1, mint) == "token-1"
+    assert await manager.refresh(mint) == 0
+    manager.cache[1] = Token("token-1", time.time() + tokens.REFRESH_MARGIN / 2)
+    assert await manager.get(2, mint) == "token-2"
+    before = tokens.tokens_minted_total.value(reason="refresh")
+    # Only the token which expires soon is refreshed.
+    assert await manager.refresh(mint) == 1
+    assert tokens.tokens_minted_total.value(reason="refresh") == before + 1
+    assert await manager.get(1, mint) == "token-3"
+    assert mint.calls == [1, 2, 1]
+    # The tokens of the idle installations are not refreshed.
+    monkeypatch.setattr(tokens, "IDLE_TIMEOUT", -1)
+    manager.cache[1] = Token("token-3", time.time())
+    assert await manager.refresh(mint) == 0
+    assert await manager.get(1, mint) == "token-4"
+
+
+@pytest.mark.asyncio
+async def test_refresh_failure(caplog: pytest.LogCaptureFixture) -> None:
+    manager = TokenManager()
+    mint = FakeMinter(lifetime=0)
+    await manager.get(1, mint)
+    mint.failing = True
+    assert await manager.refresh(mint) == 0
+    assert "Failed to refresh the token for installation=1" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_run() -> None:
+    manager = TokenManager()
+    mint = FakeMinter(lifetime=0)
+    await manager.get(1, mint)
+    task = asyncio.create_task(manager.run(mint, interval=0.02))
+    await asyncio.sleep(0.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert len(mint.calls) > 1
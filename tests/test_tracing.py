@@ -0,0 +1,132 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Iterator
+
+import pytest
+import sentry_sdk
+from sentry_sdk.envelope import Envelope
+
+from algorithms_keeper import tracing
+from algorithms_keeper.tracing import JSONLinesExporter, MemoryExporter, span
+
+
+@pytest.fixture
+def exporter() -> Iterator[MemoryExporter]:
+    exporter = MemoryExporter()
+    tracing.EXPORTERS.append(exporter)
+    yield exporter
+    tracing.EXPORTERS.remove(exporter)
+
+
+@pytest.mark.asyncio
+async def test_span_tree(exporter: MemoryExporter) -> None:
+    with span("root", delivery_id="1") as root:
+        assert tracing.current_span() is root
+        with span("child") as child:
+            await asyncio.sleep(0)
+            with span("grandchild") as grandchild:
+                pass
+        assert tracing.current_span() is root
+    assert tracing.current_span() is None
+    # The spans are exported as they finish.
+    assert exporter.spans == [grandchild, child, root]
+    assert {s.trace_id for s in exporter.spans} == {root.trace_id}
+    assert root.parent_id is None
+    assert child.parent_id == root.span_id
+    assert grandchild.parent_id == child.span_id
+    assert root.attributes == {"delivery_id": "1"}
+    assert all(s.status == "ok" and s.duration is not None for s in exporter.spans)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_traces(exporter: MemoryExporter) -> None:
+    async def deliver(delivery_id: str) -> None:
+        with span("root", delivery_id=delivery_id):
+            await asyncio.sleep(0)
+            with span("child", delivery_id=delivery_id):
+                await asyncio.sleep(0)
+
+    await asyncio.gather(deliver("1"), deliver("2"))
+    roots = {s.attributes["delivery_id"]: s for s in exporter.spans if s.name == "root"}
+    for child in (s for s in exporter.spans if s.name == "child"):
+        root = roots[child.attributes["delivery_id"]]
+        assert child.parent_id == root.span_id
+        assert child.trace_id == root.trace_id
+    assert roots["1"].trace_id != roots["2"].trace_id
+
+
+def test_span_error(exporter: MemoryExporter) -> None:
+    with pytest.raises(RuntimeError):
+        with span("root"):
+            raise RuntimeError("failed")
+    assert exporter.spans[0].status == "error"
+
+
+def test_failing_exporter(exporter: MemoryExporter) -> None:
+    class FailingExporter(tracing.Exporter):
+        pass
+
+    tracing.EXPORTERS.insert(0, FailingExporter())
+    try:
+        with span("root"):
+            pass
+    finally:
+        del tracing.EXPORTERS[0]
+    # The other exporters still get the span.
+    assert len(exporter.spans) == 1
+
+
+def test_json_lines_exporter(tmp_path: Path) -> None:
+    path = tmp_path / "spans.jsonl"
+    exporter = JSONLinesExporter(str(path))
+    tracing.EXPORTERS.append(exporter)
+    try:
+        with span("root", delivery_id="1"):
+            with span("child", file=Path("sol1.py")):
+                pass
+            # Nothing is written until the trace is finished.
+            assert path.read_bytes() == b""
+        with span("other"):
+            pass
+    finally:
+        tracing.EXPORTERS.remove(exporter)
+        exporter.close()
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [s["name"] for s in spans] == ["child", "root", "other"]
+    assert spans[0]["parent_id"] == spans[1]["span_id"]
+    assert spans[0]["attributes"] == {"file": "sol1.py"}
+    assert spans[1]["attributes"] == {"delivery_id": "1"}
+
+
+class RecordingTransport(sentry_sdk.Transport):
+    transactions: list[dict[str, Any]]
+
+    def capture_envelope(self, envelope: Envelope) -> None:
+        transaction = envelope.get_transaction_event()
+        if transaction is not None:
+            self.transactions.append(transaction)
+
+
+def test_sentry_transaction() -> None:
+    transport = RecordingTransport()
+    transport.transactions = []
+    client = sentry_sdk.Client(traces_sample_rate=1.0, transport=transport)
+    with sentry_sdk.Hub(client):
+        with span("root", delivery_id="1"):
+            with span("child", file="sol1.py"):
+                pass
+    (transaction,) = transport.transactions
+    assert transaction["transaction"] == "delivery_id=1"
+    (child,) = transaction["spans"]
+    assert child["op"] == "child"
+    assert child["description"] == "file=sol1.py"
+    assert child["parent_span_id"] == transaction["contexts"]["trace"]["span_id"]
+
+
+def test_sentry_disabled() -> None:
+    client = sentry_sdk.Client(dsn=None)
+    with sentry_sdk.Hub(client):
+        with span("root") as root:
+            pass
+    assert root.sentry_span is None
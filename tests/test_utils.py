@@ -1,14 +1,15 @@
 import urllib.parse
 from pathlib import Path
-from typing import Dict, cast
+from typing import Any, Dict, Optional, cast
 
 import pytest
 
-from algorithms_keeper import utils
+from algorithms_keeper import graphql, utils
 from algorithms_keeper.api import GitHubAPI
 from algorithms_keeper.constants import Label
 
 from .utils import (
+    ExpectedData,
     MockGitHubAPI,
     check_run_url,
     comment,
@@ -145,6 +146,57 @@ async def test_remove_multiple_labels() -> None:
     assert f"{labels_url}/{parse_label2}" in gh.delete_url
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "current, labels, expected",
+    (
+        # Nothing changes, so nothing is requested.
+        ([Label.REVIEW], [Label.REVIEW, Label.REVIEW], ExpectedData()),
+        (
+            [Label.REVIEW],
+            [Label.REVIEW, Label.TYPE_HINT, Label.REQUIRE_TEST],
+            ExpectedData(
+                post_url=[labels_url],
+                post_data=[{"labels": [Label.TYPE_HINT, Label.REQUIRE_TEST]}],
+            ),
+        ),
+        (
+            [Label.REVIEW, Label.TYPE_HINT],
+            [Label.TYPE_HINT],
+            ExpectedData(
+                delete_url=[f"{labels_url}/{urllib.parse.quote(Label.REVIEW)}"]
+            ),
+        ),
+        (
+            [Label.REVIEW, Label.TYPE_HINT, Label.REQUIRE_TEST],
+            [Label.CHANGE, Label.REQUIRE_TEST],
+            ExpectedData(
+                put_url=[labels_url],
+                put_data=[{"labels": [Label.REQUIRE_TEST, Label.CHANGE]}],
+            ),
+        ),
+    ),
+)
+async def test_reconcile_labels(
+    current: list[str], labels: list[str], expected: ExpectedData
+) -> None:
+    pr_or_issue: Dict[str, Any] = {
+        "url": pr_url,
+        "issue_url": issue_url,
+        "labels": [{"name": label} for label in current],
+    }
+    gh = MockGitHubAPI()
+    state = utils.PullRequestState(sha, None, list(current), [], [])
+    gh.pr_states[pr_url] = state
+    await utils.reconcile_labels(
+        cast(GitHubAPI, gh), labels=labels, pr_or_issue=pr_or_issue
+    )
+    assert gh == expected
+    # The labels are updated for the callbacks which follow.
+    assert sorted(utils.label_names(pr_or_issue)) == sorted(set(labels))
+    assert sorted(state.labels) == sorted(set(labels))
+
+
 @pytest.mark.asyncio
 async def test_get_user_open_pr_numbers() -> None:
     getiter = {
@@ -322,3 +374,147 @@ async def test_get_pr_for_issue() -> None:
     result = await utils.get_pr_for_issue(cast(GitHubAPI, gh), issue=issue)
     assert result is None
     assert pr_url in gh.getitem_url
+
+
+def pr_state_response(
+    files: list[Dict[str, str]], *, cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    return {
+        "repository": {
+            "pullRequest": {
+                "headRefOid": sha,
+                "mergeable": "CONFLICTING",
+                "labels": {"nodes": [{"name": Label.REVIEW}]},
+                "files": {
+                    "pageInfo": {
+                        "hasNextPage": cursor is not None,
+                        "endCursor": cursor,
+                    },
+                    "nodes": files,
+                },
+                "commits": {
+                    "nodes": [
+                        {
+                            "commit": {
+                                "checkSuites": {
+                                    "nodes": [
+                                        {
+                                            "checkRuns": {
+                                                "nodes": [
+                                                    {
+                                                        "name": "test",
+                                                        "status": "COMPLETED",
+                                                        "conclusion": "FAILURE",
+                                                    },
+                                                    {
+                                                        "name": "lint",
+                                                        "status": "IN_PROGRESS",
+                                                        "conclusion": None,
+                                                    },
+                                                ]
+                                            }
+                                        }
+                                    ]
+                                }
+                            }
+                        }
+                    ]
+                },
+            }
+        }
+    }
+
+
+pull_request = {
+    "url": pr_url,
+    "number": number,
+    "base": {
+        "repo": {
+            "full_name": repository,
+            "url": f"https://api.github.com/repos/{repository}",
+        }
+    },
+}
+
+
+@pytest.mark.asyncio
+async def test_get_pr_state() -> None:
+    gh = MockGitHubAPI(
+        graphql=[
+            pr_state_response([{"path": "a/b.py", "changeType": "ADDED"}], cursor="1"),
+            pr_state_response([{"path": "c.py", "changeType": "DELETED"}]),
+        ]
+    )
+    state = await utils.get_pr_state(cast(GitHubAPI, gh), pull_request=pull_request)
+    assert state.head_sha == sha
+    assert state.mergeable is False
+    assert state.labels == [Label.REVIEW]
+    assert state.files == [
+        utils.File(
+            "a/b.py",
+            Path("a/b.py"),
+            f"https://api.github.com/repos/{repository}/contents/a/b.py?ref={sha}",
+            "added",
+        ),
+        utils.File(
+            "c.py",
+            Path("c.py"),
+            f"https://api.github.com/repos/{repository}/contents/c.py?ref={sha}",
+            "removed",
+        ),
+    ]
+    assert state.check_runs == [
+        {"name": "test", "status": "completed", "conclusion": "failure"},
+        {"name": "lint", "status": "in_progress", "conclusion": None},
+    ]
+    assert [variables["cursor"] for variables in gh.graphql_variables] == [None, "1"]
+    assert gh.graphql_variables[0]["owner"] == "user"
+    assert gh.graphql_variables[0]["name"] == "testing"
+    # The state is fetched once for the event, unless refreshed.
+    assert (
+        await utils.get_pr_state(cast(GitHubAPI, gh), pull_request=pull_request)
+        is state
+    )
+    gh._graphql_return = [pr_state_response([])]
+    refreshed = await utils.get_pr_state(
+        cast(GitHubAPI, gh), pull_request=pull_request, refresh=True
+    )
+    assert refreshed.files == []
+
+
+@pytest.mark.asyncio
+async def test_get_files_content(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def mock_get_file_content(*args: Any, **kwargs: Any) -> bytes:
+        return b"binary"
+
+    monkeypatch.setattr(utils, "get_file_content", mock_get_file_content)
+    monkeypatch.setattr(utils, "BLOB_BATCH_SIZE", 2)
+    files = [
+        utils.File(name, Path(name), "", "added") for name in ("a.py", "b.py", "c.py")
+    ]
+    gh = MockGitHubAPI(
+        graphql=[
+            {
+                "repository": {
+                    "f0": {"text": "a = 1\n", "isTruncated": False},
+                    "f1": {"text": None, "isTruncated": False},
+                }
+            },
+            {"repository": {"f0": {"text": "c = 1", "isTruncated": True}}},
+        ]
+    )
+    contents = await utils.get_files_content(
+        cast(GitHubAPI, gh), pull_request=pull_request, files=files, ref=sha
+    )
+    # The binary and the truncated files are requested with the REST API.
+    assert contents == {"a.py": b"a = 1\n", "b.py": b"binary", "c.py": b"binary"}
+    assert gh.graphql_variables[0]["e0"] == f"{sha}:a.py"
+    assert gh.graphql_variables[0]["e1"] == f"{sha}:b.py"
+    assert gh.graphql_variables[1]["e0"] == f"{sha}:c.py"
+
+
+def test_blobs_query() -> None:
+    query = graphql.blobs_query(2)
+    assert "$e0: String!, $e1: String!" in query
+    assert "f1: object(expression: $e1)" in query
+    assert "$e2" not in query
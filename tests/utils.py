@@ -21,6 +21,8 @@ class ExpectedData:
     post_data: List[Dict[str, Any]] = field(default_factory=list)
     patch_url: List[str] = field(default_factory=list)
     patch_data: List[Dict[str, Any]] = field(default_factory=list)
+    put_url: List[str] = field(default_factory=list)
+    put_data: List[Dict[str, Any]] = field(default_factory=list)
     delete_url: List[str] = field(default_factory=list)
     delete_data: List[Dict[str, Any]] = field(default_factory=list)
 
@@ -33,6 +35,8 @@ class MockGitHubAPI:
     - ``getitem``: dictionary mapping ``{url: result}``, or None
     - ``getiter``: dictionary mapping ``{url: result}``, or None
     - ``post``: dictionary mapping ``{url: result}``, or None
+    - ``graphql``: list of the results for the GraphQL queries in order, or None to
+      use the REST API
 
     The actual results are stored in the attributes:
 
@@ -42,8 +46,11 @@ class MockGitHubAPI:
     - ``post_data``: list of the data input for each post
     - ``patch_url``: list of urls called with patch
     - ``patch_data``: list of the data input for each patch
+    - ``put_url``: list of urls called with put
+    - ``put_data``: list of the data input for each put
     - ``delete_url``: list of urls called with delete
     - ``delete_data``: list of the data input for each delete
+    - ``graphql_variables``: list of the variables for each GraphQL query
 
     **NOTE:**
 
@@ -61,16 +68,23 @@ class MockGitHubAPI:
         getitem: Optional[Dict[str, Any]] = None,
         getiter: Optional[Dict[str, Any]] = None,
         post: Optional[Dict[str, Any]] = None,
+        graphql: Optional[List[Any]] = None,
     ) -> None:
         self._getitem_return = getitem
         self._getiter_return = getiter
         self._post_return = post
+        self._graphql_return = graphql
+        self.use_graphql = graphql is not None
+        self.pr_states: Dict[str, Any] = {}
+        self.graphql_variables: List[Dict[str, Any]] = []
         self.getitem_url: List[str] = []
         self.getiter_url: List[str] = []
         self.post_url: List[str] = []
         self.post_data: List[Dict[str, Any]] = []
         self.patch_url: List[str] = []
         self.patch_data: List[Dict[str, Any]] = []
+        self.put_url: List[str] = []
+        self.put_data: List[Dict[str, Any]] = []
         self.delete_url: List[str] = []
         self.delete_data: List[Dict[str, Any]] = []
 
@@ -121,10 +135,19 @@ class MockGitHubAPI:
         if post_return is not None:
             return post_return[url]
 
+    async def graphql(self, query: str, **variables: Any) -> Any:
+        self.graphql_variables.append(variables)
+        assert self._graphql_return, "Unexpected GraphQL query"
+        return self._graphql_return.pop(0)
+
     async def patch(self, url: str, *, data: Any, **kwargs: Any) -> Any:
         self.patch_url.append(url)
         self.patch_data.append(data)
 
+    async def put(self, url: str, *, data: Any, **kwargs: Any) -> Any:
+        self.put_url.append(url)
+        self.put_data.append(data)
+
     async def delete(self, url: str, *, data: Any = None, **kwargs: Any) -> None:
         self.delete_url.append(url)
         if data is not None: